@@ -1,4 +1,5 @@
 from pathlib import Path
+from urllib.parse import unquote, urlparse
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -96,6 +97,16 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetCursorPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.codec.CodecJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.codec.CodecJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 # REST_FRAMEWORK = {
 #     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -124,16 +135,30 @@ CHANNEL_LAYERS = {
     },
 }
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'devboard',
-        'USER': 'devboard',
-        'PASSWORD': 'devpass',
-        'HOST': 'db',
-        'PORT': '5432',
+# Postgres from DATABASE_URL (docker-compose points it at the db service), or a
+# local SQLite file when it is unset. The test suite runs on whichever is configured.
+DATABASE_URL = os.environ.get('DATABASE_URL')
+if DATABASE_URL:
+    _database_url = urlparse(DATABASE_URL)
+    if _database_url.scheme not in ('postgres', 'postgresql'):
+        raise ValueError(f"Unsupported DATABASE_URL scheme: {_database_url.scheme}")
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': _database_url.path.lstrip('/'),
+            'USER': unquote(_database_url.username or ''),
+            'PASSWORD': unquote(_database_url.password or ''),
+            'HOST': _database_url.hostname or '',
+            'PORT': str(_database_url.port or ''),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
-}
 
 ASGI_APPLICATION = "backend.asgi.application"
 
@@ -149,11 +174,128 @@ CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
-            "hosts": [("redis", 6379)],  
+            "hosts": [("redis", 6379)],
         },
     },
 }
 
+# Opt-in, not yet run against a real channels_redis: core.layers.ShardedChannelLayer
+# spreads board groups over several layers by consistent hashing of the group name.
+# Sockets of the same worker are served in-process; a board whose sockets all live in
+# one worker costs one ZCOUNT per broadcast instead of the Redis fan-out. Each worker
+# receives all its cross-worker traffic on one node channel per shard, sized by
+# node_capacity. `manage.py bench_channel_layers` compares it with a single backend.
+# CHANNEL_LAYERS = {
+#     "default": {
+#         "BACKEND": "core.layers.ShardedChannelLayer",
+#         "CONFIG": {
+#             "shards": [
+#                 {"BACKEND": "channels_redis.core.RedisChannelLayer", "CONFIG": {"hosts": [("redis", 6379)]}},
+#                 {"BACKEND": "channels_redis.core.RedisChannelLayer", "CONFIG": {"hosts": [("redis-2", 6379)]}},
+#             ],
+#             "membership_ttl": 5,
+#             "node_capacity": 10000,
+#         },
+#     },
+# }
+
+# Board snapshot cache used by full_board and invalidated on every board broadcast.
+# For a cache shared between workers use:
+#   'BACKEND': 'core.snapshot_cache.RedisSnapshotCache',
+#   'OPTIONS': {'url': 'redis://redis:6379/1', 'timeout': 300},
+BOARD_SNAPSHOT_CACHE = {
+    'BACKEND': 'core.snapshot_cache.LocalSnapshotCache',
+    'OPTIONS': {
+        'max_entries': 512,
+        'max_bytes': 64 * 1024 * 1024,
+    },
+}
+
+# Per-board ring buffer of broadcast events used to resync reconnecting sockets.
+# The Redis backend ('core.event_log.RedisEventLog') shares seqs across workers.
+BOARD_EVENT_LOG = {
+    'BACKEND': 'core.event_log.LocalEventLog',
+    'OPTIONS': {
+        'max_events': 1000,
+    },
+}
+
+# JSON codec for WebSocket frames, snapshots, the event log and DRF bodies.
+# 'core.codec.MsgspecCodec' and 'core.codec.StdlibCodec' are the alternatives; a
+# backend whose library is not installed falls back to the stdlib json module.
+JSON_CODEC = {
+    'BACKEND': 'core.codec.OrjsonCodec',
+    'OPTIONS': {},
+}
+
+# Merge rapid updates to the same card/column within `window_ms` into one broadcast
+# per entity. Event types listed in `defer_writes` (update events carrying an "id")
+# are also written to the database once per window with the merged payload.
+BOARD_EVENT_COALESCING = {
+    'window_ms': 50,
+    'event_types': ['card.updated', 'card.moved', 'column.updated'],
+    'defer_writes': [],
+}
+
+# Who is viewing each board (core.presence). Sockets heartbeat within `ttl` seconds or
+# are dropped; joins, leaves and focus changes reach the board as at most one batched
+# presence.diff per broadcast_interval_ms (0 disables diffs; clients poll viewers/).
+# For presence shared between workers use:
+#   'BACKEND': 'core.presence.RedisPresence',
+#   'OPTIONS': {'url': 'redis://redis:6379/1'},
+BOARD_PRESENCE = {
+    'BACKEND': 'core.presence.LocalPresence',
+    'OPTIONS': {},
+    'ttl': 60,
+    'broadcast_interval_ms': 1000,
+}
+
+# Per-socket outbound broadcast queue. When a slow client lets it fill up the policy
+# is one of 'drop_resync' (drop queued frames, then replay/snapshot), 'coalesce'
+# (replace the queued frame for the same entity) or 'disconnect'.
+BOARD_OUTBOUND_QUEUE = {
+    'max_frames': 256,
+    'policy': 'drop_resync',
+}
+
+# Threads running BoardConsumer database work (core.db.board_db). Each holds its own
+# database connection. 0 keeps channels' default of one DB thread per process; only
+# raise it after `manage.py loadtest_sockets` shows a gain on the production database.
+BOARD_DB_THREADS = 0
+
+# Per-process cache of decoded WebSocket JWTs and board-access decisions (seconds).
+# Membership changes invalidate entries; the TTL bounds staleness across workers.
+WS_AUTH_CACHE = {
+    'token_ttl': 60,
+    'access_ttl': 30,
+    'max_entries': 10000,
+}
+
+# How django-simple-history rows are written (core.history). 'sync' inserts each row
+# with its change. Opt-in: 'buffered' bulk inserts committed rows from a background
+# thread every flush_interval_ms (or batch_size rows) and loses at most that on a
+# crash; 'journal' also appends them to a per-process file in journal_dir first, and
+# journals left by dead processes are replayed by the next one to start.
+HISTORY_RECORDING = {
+    'mode': 'sync',
+    'batch_size': 500,
+    'flush_interval_ms': 200,
+    'max_pending': 50000,
+    'journal_dir': BASE_DIR / 'history-journal',
+}
+
+# History retention applied by `manage.py compact_history` (core.retention). Runs of
+# position-only card/column changes older than collapse_after_hours keep only their
+# first and last row; past keep_all_days each object keeps one row per day; rows
+# older than delete_after_days (None: never) are dropped. 'models' overrides any of
+# these per model name, e.g. {'card': {'delete_after_days': 365}}.
+HISTORY_RETENTION = {
+    'collapse_after_hours': 1,
+    'keep_all_days': 30,
+    'delete_after_days': None,
+    'models': {},
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
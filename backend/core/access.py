@@ -0,0 +1,77 @@
+from django.db import transaction
+from .models import BoardAccess, TeamMembership
+
+
+def accessible_board_ids(user):
+    """Subquery of board ids `user` may open, answered from the access index"""
+    return BoardAccess.objects.filter(user=user).values('board_id')
+
+
+def has_board_access(user, board_id):
+    """Single indexed lookup on the (user, board) unique constraint"""
+    return BoardAccess.objects.filter(user=user, board_id=board_id).exists()
+
+
+def _apply(existing, desired):
+    """
+    Diff `existing` ({(user_id, board_id): pk}) against the `desired` pairs,
+    inserting and deleting in bulk
+    """
+    missing = desired - existing.keys()
+    stale = [pk for pair, pk in existing.items() if pair not in desired]
+    if missing:
+        BoardAccess.objects.bulk_create(
+            [BoardAccess(user_id=user_id, board_id=board_id) for user_id, board_id in missing],
+            ignore_conflicts=True,
+        )
+    if stale:
+        BoardAccess.objects.filter(pk__in=stale).delete()
+    return len(missing), len(stale)
+
+
+def _existing(queryset):
+    return {(user_id, board_id): pk for pk, user_id, board_id in queryset.values_list('pk', 'user_id', 'board_id')}
+
+
+def sync_user_access(user_id):
+    """Recompute the boards reachable by one user"""
+    return sync_users_access([user_id])
+
+
+def sync_users_access(user_ids):
+    """Recompute the boards reachable by each of `user_ids` (e.g. after a bulk membership change)"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0, 0
+    with transaction.atomic():
+        desired = set(
+            TeamMembership.objects
+            .filter(user_id__in=user_ids, team__project__board__isnull=False)
+            .values_list('user_id', 'team__project__board__id')
+        )
+        existing = _existing(BoardAccess.objects.filter(user_id__in=user_ids))
+        return _apply(existing, desired)
+
+
+def sync_board_access(board_ids):
+    """Recompute the users who can reach each of `board_ids`"""
+    board_ids = list(board_ids)
+    if not board_ids:
+        return 0, 0
+    with transaction.atomic():
+        desired = set(
+            TeamMembership.objects
+            .filter(team__project__board__id__in=board_ids)
+            .values_list('user_id', 'team__project__board__id')
+        )
+        existing = _existing(BoardAccess.objects.filter(board_id__in=board_ids))
+        return _apply(existing, desired)
+
+
+def rebuild_board_access():
+    """Recompute the whole index (repairs drift after raw SQL or bulk writes)"""
+    with transaction.atomic():
+        desired = set(TeamMembership.objects.filter(team__project__board__isnull=False)
+                      .values_list('user_id', 'team__project__board__id'))
+        existing = _existing(BoardAccess.objects.all())
+        return _apply(existing, desired)
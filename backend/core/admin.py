@@ -1,15 +1,32 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from simple_history.admin import SimpleHistoryAdmin
+from .history import get_history_pipeline
 from .models import User, Team, TeamMembership, Project, Board, Column, Card
 
+
+# History is written in batches (see core.history); flush before showing it so the
+# page is complete, and tell the admin how far behind the writer was
+class PipelineHistoryAdmin(SimpleHistoryAdmin):
+    def history_view(self, request, object_id, extra_context=None):
+        pipeline = get_history_pipeline()
+        lag = pipeline.stats()
+        if lag['pending']:
+            written = pipeline.flush()
+            messages.info(
+                request,
+                f"History writer was {lag['lag_seconds']:.1f}s behind; flushed {written} queued rows",
+            )
+        return super().history_view(request, object_id, extra_context=extra_context)
+
+
 # Register with history tracking
 admin.site.register(User, SimpleHistoryAdmin)
-admin.site.register(Team, SimpleHistoryAdmin)
-admin.site.register(TeamMembership, SimpleHistoryAdmin)
-admin.site.register(Project, SimpleHistoryAdmin)
-admin.site.register(Board, SimpleHistoryAdmin)
-admin.site.register(Column, SimpleHistoryAdmin)
-admin.site.register(Card, SimpleHistoryAdmin)
+admin.site.register(Team, PipelineHistoryAdmin)
+admin.site.register(TeamMembership, PipelineHistoryAdmin)
+admin.site.register(Project, PipelineHistoryAdmin)
+admin.site.register(Board, PipelineHistoryAdmin)
+admin.site.register(Column, PipelineHistoryAdmin)
+admin.site.register(Card, PipelineHistoryAdmin)
 
 # from django.contrib import admin
 # from simple_history.admin import SimpleHistoryAdmin
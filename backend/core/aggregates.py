@@ -0,0 +1,234 @@
+from django.db import transaction
+from django.db.models import Count
+from .models import Card, CardCount
+
+# Card counts are kept by triggers on core_card (and core_column, for columns
+# moving between boards), so every write path updates them in the same
+# transaction as the card: the consumer's RETURNING statements, REST saves,
+# queryset updates and cascading deletes alike. A trigger sees both the old and
+# the new row, which the single-statement card writes never read.
+#
+# Each change is an upsert on one (column, assignee) row. Both databases accept
+# the same statements; the partial unique indexes on CardCount give unassigned
+# cards a conflict target of their own. Rows that drop to zero are kept (they
+# are filtered out on read) so a card bouncing between columns does not churn.
+
+_INCREMENT = [
+    """
+    INSERT INTO core_cardcount (board_id, column_id, assignee_id, cards)
+    SELECT board_id, id, NEW.assignee_id, 1 FROM core_column
+    WHERE id = NEW.column_id AND NEW.assignee_id IS NOT NULL
+    ON CONFLICT (column_id, assignee_id) WHERE assignee_id IS NOT NULL
+    DO UPDATE SET cards = core_cardcount.cards + 1
+    """,
+    """
+    INSERT INTO core_cardcount (board_id, column_id, assignee_id, cards)
+    SELECT board_id, id, NULL, 1 FROM core_column
+    WHERE id = NEW.column_id AND NEW.assignee_id IS NULL
+    ON CONFLICT (column_id) WHERE assignee_id IS NULL
+    DO UPDATE SET cards = core_cardcount.cards + 1
+    """,
+]
+_DECREMENT = [
+    """
+    UPDATE core_cardcount SET cards = cards - 1
+    WHERE column_id = OLD.column_id AND assignee_id IS NOT DISTINCT FROM OLD.assignee_id
+    """,
+]
+_MOVE_COLUMN = [
+    "UPDATE core_cardcount SET board_id = NEW.board_id WHERE column_id = NEW.id",
+]
+_CHANGED = "OLD.column_id IS DISTINCT FROM NEW.column_id OR OLD.assignee_id IS DISTINCT FROM NEW.assignee_id"
+
+
+def _body(statements):
+    return ';\n'.join(statement.strip() for statement in statements) + ';'
+
+
+POSTGRES_TRIGGER_SQL = [
+    f"""
+    CREATE OR REPLACE FUNCTION core_card_count_changed() RETURNS trigger AS $$
+    BEGIN
+        -- A move locks the lower column's row first, so opposite moves cannot deadlock
+        IF TG_OP = 'UPDATE' AND NEW.column_id < OLD.column_id THEN
+            {_body(_INCREMENT)}
+            {_body(_DECREMENT)}
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            {_body(_DECREMENT)}
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            {_body(_INCREMENT)}
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION core_column_count_moved() RETURNS trigger AS $$
+    BEGIN
+        {_body(_MOVE_COLUMN)}
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS core_card_count_insert_delete ON core_card",
+    """
+    CREATE TRIGGER core_card_count_insert_delete AFTER INSERT OR DELETE ON core_card
+    FOR EACH ROW EXECUTE FUNCTION core_card_count_changed()
+    """,
+    "DROP TRIGGER IF EXISTS core_card_count_update ON core_card",
+    f"""
+    CREATE TRIGGER core_card_count_update AFTER UPDATE OF column_id, assignee_id ON core_card
+    FOR EACH ROW WHEN ({_CHANGED}) EXECUTE FUNCTION core_card_count_changed()
+    """,
+    "DROP TRIGGER IF EXISTS core_column_count_moved ON core_column",
+    """
+    CREATE TRIGGER core_column_count_moved AFTER UPDATE OF board_id ON core_column
+    FOR EACH ROW WHEN (OLD.board_id IS DISTINCT FROM NEW.board_id) EXECUTE FUNCTION core_column_count_moved()
+    """,
+]
+POSTGRES_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS core_card_count_insert_delete ON core_card",
+    "DROP TRIGGER IF EXISTS core_card_count_update ON core_card",
+    "DROP TRIGGER IF EXISTS core_column_count_moved ON core_column",
+    "DROP FUNCTION IF EXISTS core_card_count_changed()",
+    "DROP FUNCTION IF EXISTS core_column_count_moved()",
+]
+
+SQLITE_TRIGGER_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_card_count_insert AFTER INSERT ON core_card BEGIN
+        {_body(_INCREMENT)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_card_count_delete AFTER DELETE ON core_card BEGIN
+        {_body(_DECREMENT)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_card_count_update AFTER UPDATE OF column_id, assignee_id ON core_card
+    WHEN {_CHANGED} BEGIN
+        {_body(_DECREMENT + _INCREMENT)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_column_count_moved AFTER UPDATE OF board_id ON core_column
+    WHEN OLD.board_id IS NOT NEW.board_id BEGIN
+        {_body(_MOVE_COLUMN)}
+    END
+    """,
+]
+SQLITE_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS core_card_count_insert",
+    "DROP TRIGGER IF EXISTS core_card_count_delete",
+    "DROP TRIGGER IF EXISTS core_card_count_update",
+    "DROP TRIGGER IF EXISTS core_column_count_moved",
+]
+
+
+BACKFILL_SQL = """
+    INSERT INTO core_cardcount (board_id, column_id, assignee_id, cards)
+    SELECT core_column.board_id, core_card.column_id, core_card.assignee_id, COUNT(*)
+    FROM core_card JOIN core_column ON core_column.id = core_card.column_id
+    GROUP BY core_column.board_id, core_card.column_id, core_card.assignee_id
+"""
+
+
+def install_count_triggers(schema_editor, backfill=False):
+    """Create the vendor's card count triggers; `backfill` first counts the existing cards"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRES_TRIGGER_SQL
+    elif vendor == 'sqlite':
+        statements = SQLITE_TRIGGER_SQL
+    else:
+        return
+    if backfill:
+        schema_editor.execute(BACKFILL_SQL)
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_count_triggers(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRES_DROP_SQL
+    elif vendor == 'sqlite':
+        statements = SQLITE_DROP_SQL
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def board_counts(board_id):
+    """Card totals for a board, by column and by assignee, from its CardCount rows"""
+    columns = {}
+    assignees = {}
+    for column_id, assignee_id, cards in (
+        CardCount.objects.filter(board_id=board_id, cards__gt=0).values_list('column_id', 'assignee_id', 'cards')
+    ):
+        columns[column_id] = columns.get(column_id, 0) + cards
+        assignees[assignee_id] = assignees.get(assignee_id, 0) + cards
+    return {
+        'board': board_id,
+        'total': sum(columns.values()),
+        'columns': [{'column': column_id, 'cards': cards} for column_id, cards in sorted(columns.items())],
+        # Unassigned cards (null) sort first
+        'assignees': [
+            {'assignee': assignee_id, 'cards': cards}
+            for assignee_id, cards in sorted(assignees.items(), key=lambda item: (item[0] is not None, item[0] or 0))
+        ],
+    }
+
+
+def repair_card_counts(board_ids=None, dry_run=False):
+    """
+    Recount cards from scratch and rewrite the CardCount rows that disagree
+    (all boards, or just `board_ids`). Returns the drift found, one
+    {board, column, assignee, stored, actual} dict per wrong row.
+    """
+    cards = Card.objects.all()
+    stored = CardCount.objects.all()
+    if board_ids is not None:
+        cards = cards.filter(column__board_id__in=board_ids)
+        stored = stored.filter(board_id__in=board_ids)
+
+    with transaction.atomic():
+        # Lock the counters against concurrent triggers while comparing (no-op on SQLite)
+        existing = {
+            (row['column_id'], row['assignee_id']): row
+            for row in stored.select_for_update().values('id', 'board_id', 'column_id', 'assignee_id', 'cards')
+        }
+        actual = {
+            (row['column_id'], row['assignee_id']): row
+            for row in cards.values('column_id', 'assignee_id', 'column__board_id').annotate(cards=Count('id'))
+        }
+
+        drift = []
+        for key in sorted(existing.keys() | actual.keys(), key=lambda key: (key[0], key[1] or 0)):
+            row, counted = existing.get(key), actual.get(key)
+            stored_cards = row['cards'] if row else 0
+            actual_cards = counted['cards'] if counted else 0
+            board_id = counted['column__board_id'] if counted else row['board_id']
+            if stored_cards != actual_cards or (row and counted and row['board_id'] != board_id):
+                drift.append({
+                    'board': board_id, 'column': key[0], 'assignee': key[1],
+                    'stored': stored_cards, 'actual': actual_cards,
+                })
+        if dry_run:
+            return drift
+
+        stale = [row['id'] for key, row in existing.items() if key not in actual or row['cards'] <= 0]
+        CardCount.objects.filter(id__in=stale).delete()
+        for item in drift:
+            if item['actual']:
+                CardCount.objects.update_or_create(
+                    column_id=item['column'], assignee_id=item['assignee'],
+                    defaults={'board_id': item['board'], 'cards': item['actual']},
+                )
+    return drift
+
@@ -1,6 +1,31 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import post_migrate
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(restore_triggers, sender=self)
+
+
+def restore_triggers(using, **kwargs):
+    """SQLite table rebuilds during migrate drop the search, counter and WIP triggers; put them back"""
+    from .aggregates import install_count_triggers
+    from .search import install_search_index
+    from .wip import install_wip_triggers
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    tables = connection.introspection.table_names()
+    with connection.schema_editor() as schema_editor:
+        if 'core_card_search' in tables:
+            install_search_index(schema_editor, rebuild=False)
+        if 'core_cardcount' in tables:
+            install_count_triggers(schema_editor)
+        if ('core', '0009_wip_guard_triggers') in MigrationRecorder(connection).applied_migrations():
+            install_wip_triggers(schema_editor)
@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+DEFAULT_WS_AUTH_CACHE = {
+    'token_ttl': 60,
+    'access_ttl': 30,
+    'max_entries': 10000,
+}
+
+
+class AuthCache:
+    """
+    Short-lived, bounded, in-process cache of decoded JWTs -> users and of
+    (user, board) access decisions for WebSocket connects.
+
+    Entries are stamped with per-user and per-board generations; invalidating
+    a user or board bumps its generation, so older entries are never served
+    again and simply age out of the LRU.
+    """
+
+    def __init__(self, token_ttl=60, access_ttl=30, max_entries=10000):
+        self.token_ttl = token_ttl
+        self.access_ttl = access_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._tokens = OrderedDict()
+        self._access = OrderedDict()
+        self._user_generations = {}
+        self._board_generations = {}
+        self._lock = threading.Lock()
+
+    def _get(self, entries, key, generation):
+        with self._lock:
+            entry = entries.get(key)
+            if entry is None or entry[0] < time.monotonic() or entry[1] != generation:
+                if entry is not None:
+                    del entries[key]
+                self.misses += 1
+                return None
+            entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def _set(self, entries, key, generation, value, ttl):
+        if ttl <= 0:
+            return
+        with self._lock:
+            entries[key] = (time.monotonic() + ttl, generation, value)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def _access_generation(self, user_id, board_id):
+        return (self._user_generations.get(user_id, 0), self._board_generations.get(str(board_id), 0))
+
+    def get_user(self, token):
+        entry = self._get(self._tokens, token, None)
+        if entry is None:
+            return None
+        user, generation = entry
+        if generation != self._user_generations.get(user.id, 0):
+            return None
+        return user
+
+    def set_user(self, token, user, expires_at=None):
+        """Cache the token's user, never past the token's own `exp`"""
+        ttl = self.token_ttl
+        if expires_at is not None:
+            ttl = min(ttl, expires_at - time.time())
+        generation = self._user_generations.get(user.id, 0)
+        self._set(self._tokens, token, None, (user, generation), ttl)
+
+    def get_access(self, user_id, board_id):
+        key = (user_id, str(board_id))
+        return self._get(self._access, key, self._access_generation(user_id, board_id))
+
+    def set_access(self, user_id, board_id, allowed):
+        key = (user_id, str(board_id))
+        self._set(self._access, key, self._access_generation(user_id, board_id), allowed, self.access_ttl)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._user_generations[user_id] = self._user_generations.get(user_id, 0) + 1
+
+    def invalidate_board(self, board_id):
+        board_id = str(board_id)
+        with self._lock:
+            self._board_generations[board_id] = self._board_generations.get(board_id, 0) + 1
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'tokens': len(self._tokens),
+            'access': len(self._access),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_auth_cache():
+    """Return the process-wide auth cache configured by WS_AUTH_CACHE"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AuthCache(**getattr(settings, 'WS_AUTH_CACHE', DEFAULT_WS_AUTH_CACHE))
+    return _cache
+
+
+def reset_auth_cache():
+    """Drop the cache instance (used by tests and settings changes)"""
+    global _cache
+    _cache = None
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTBOUND_QUEUE = {
+    'max_frames': 256,
+    'policy': 'drop_resync',
+}
+
+DROP_RESYNC = 'drop_resync'
+COALESCE = 'coalesce'
+DISCONNECT = 'disconnect'
+POLICIES = (DROP_RESYNC, COALESCE, DISCONNECT)
+
+
+def outbound_queue_config():
+    """BOARD_OUTBOUND_QUEUE merged over the defaults, with the policy checked"""
+    config = {**DEFAULT_OUTBOUND_QUEUE, **getattr(settings, 'BOARD_OUTBOUND_QUEUE', {})}
+    if config['policy'] not in POLICIES:
+        raise ValueError(f"Unknown outbound queue policy {config['policy']!r}; expected one of {POLICIES}")
+    return config
+
+
+class OutboundQueue:
+    """
+    Bounded queue of broadcast frames for one socket, drained by its own writer
+    task so a slow client never stalls the consumer's channel-layer reader.
+
+    When the queue is full the policy decides what happens:
+      drop_resync - discard queued frames and resync the client from the event
+                    log (or a snapshot) once the writer catches up
+      coalesce    - drop the queued frame for the same entity in favour of the
+                    new one, falling back to drop_resync when nothing matches
+      disconnect  - close the socket; the client reconnects with last_seq
+    """
+
+    def __init__(self, send, resync, disconnect, max_frames=256, policy=DROP_RESYNC,
+                 last_seq=0, record=None):
+        self.max_frames = max_frames
+        self.policy = policy
+        self.last_seq = last_seq
+        self.dropped = 0
+        self.max_depth = 0
+        self._send = send
+        self._resync = resync
+        self._disconnect = disconnect
+        self._record = record or (lambda **counters: None)
+        self._frames = OrderedDict()
+        self._keys = {}
+        self._counter = 0
+        self._resync_pending = False
+        self._closed = False
+        self._ready = asyncio.Event()
+        self._writer = asyncio.get_running_loop().create_task(self._drain())
+
+    def __len__(self):
+        return len(self._frames)
+
+    def put(self, text, seq=None, key=None):
+        """Queue a frame without blocking; `key` identifies the entity for the coalesce policy"""
+        if self._closed:
+            return
+        if len(self._frames) >= self.max_frames and not self._overflow(key):
+            return
+        self._counter += 1
+        self._frames[self._counter] = (text, seq, key)
+        if key is not None:
+            self._keys[key] = self._counter
+        if len(self._frames) > self.max_depth:
+            self.max_depth = len(self._frames)
+            self._record(depth=self.max_depth)
+        self._ready.set()
+
+    def _overflow(self, key):
+        """Apply the policy to a full queue; return whether the new frame should still be queued"""
+        if self.policy == COALESCE and key in self._keys:
+            del self._frames[self._keys.pop(key)]
+            self._drop(1)
+            return True
+        if self.policy == DISCONNECT:
+            self._drop(len(self._frames) + 1)
+            self._record(disconnects=1)
+            self.close()
+            asyncio.get_running_loop().create_task(self._disconnect())
+            return False
+        self._drop(len(self._frames) + 1)
+        self._record(resyncs=1)
+        self._frames.clear()
+        self._keys.clear()
+        self._resync_pending = True
+        self._ready.set()
+        return False
+
+    def _drop(self, count):
+        self.dropped += count
+        self._record(dropped=count)
+
+    async def _drain(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            if self._resync_pending:
+                self._resync_pending = False
+                try:
+                    await self._resync(self.last_seq)
+                except Exception as e:
+                    logger.error(f"Resync after dropped frames failed: {str(e)}")
+            while self._frames and not self._resync_pending:
+                frame_id, (text, seq, key) = self._frames.popitem(last=False)
+                if key is not None and self._keys.get(key) == frame_id:
+                    del self._keys[key]
+                await self._send(text)
+                if seq is not None:
+                    self.last_seq = seq
+
+    def close(self):
+        """Stop the writer and discard anything still queued"""
+        self._closed = True
+        self._frames.clear()
+        self._keys.clear()
+        self._writer.cancel()
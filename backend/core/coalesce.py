@@ -0,0 +1,175 @@
+import asyncio
+import contextvars
+import logging
+import threading
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EVENT_COALESCING = {
+    'window_ms': 0,
+    'event_types': [],
+    'defer_writes': [],
+}
+
+# Board id whose coalescer is flushing in the current task, so only the
+# broadcasts that flush itself produces skip the buffer
+_flushing_board = contextvars.ContextVar('flushing_board', default=None)
+
+
+def merge_latest(previous, current):
+    """Full-state events: the newest one supersedes the rest"""
+    return current
+
+
+def merge_move(previous, current):
+    """Keep where the card started so clients see one move from origin to destination"""
+    payload = dict(current['payload'])
+    for field in ('old_column_id', 'old_position'):
+        payload[field] = previous['payload'].get(field)
+    return {**current, 'payload': payload}
+
+
+def merge_payloads(previous, current):
+    """
+    Deferred writes: later fields win, but the version check stays against what
+    the client first saw. Edits expecting a different version are not merged
+    (None), so each one gets its own check and conflict.
+    """
+    if 'version' in current and current['version'] != previous.get('version'):
+        return None
+    merged = {**previous, **current}
+    if 'version' in previous:
+        merged['version'] = previous['version']
+    return merged
+
+
+EVENT_MERGERS = {
+    'card.moved': merge_move,
+}
+
+
+class BoardCoalescer:
+    """
+    Pending entries for one board, keyed by (event type, entity id[, socket]). The first
+    entry for a key starts the window; when it closes, each key is flushed
+    once with its merged value, in first-seen order.
+    """
+
+    def __init__(self, board_id, window, on_idle):
+        self.board_id = board_id
+        self.window = window
+        self.flushing = False
+        self._pending = {}
+        self._timer = None
+        self._on_idle = on_idle
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, key, value, merge, flush):
+        """Queue `value` under `key`; False (and nothing queued) when `merge` refuses the pending entry"""
+        entry = self._pending.get(key)
+        if entry is not None:
+            value = merge(entry[0], value)
+            if value is None:
+                return False
+        self._pending[key] = (value, flush)
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().create_task(self._flush_after_window())
+        return True
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.window)
+        self._timer = None
+        await self._flush()
+
+    async def flush_now(self):
+        """Flush immediately, e.g. before an event that must not overtake pending ones"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self._flush()
+
+    async def _flush(self):
+        pending, self._pending = self._pending, {}
+        self.flushing = True
+        token = _flushing_board.set(self.board_id)
+        try:
+            for value, flush in pending.values():
+                try:
+                    await flush(value)
+                except Exception as e:
+                    logger.error(f"Coalesced flush for board {self.board_id} failed: {str(e)}")
+        finally:
+            _flushing_board.reset(token)
+            self.flushing = False
+        if not self._pending and self._timer is None:
+            self._on_idle(self.board_id, self)
+
+
+class EventCoalescing:
+    """Per-process registry of board coalescers configured by BOARD_EVENT_COALESCING"""
+
+    def __init__(self, window_ms=0, event_types=(), defer_writes=()):
+        self.window = window_ms / 1000
+        self.event_types = frozenset(event_types)
+        self.defer_writes = frozenset(defer_writes)
+        self._boards = {}
+
+    @property
+    def enabled(self):
+        return self.window > 0
+
+    def coalesces(self, event_type):
+        return self.enabled and event_type in self.event_types
+
+    def defers(self, event_type):
+        return self.enabled and event_type in self.defer_writes
+
+    def board(self, board_id, create=True):
+        board_id = str(board_id)
+        coalescer = self._boards.get(board_id)
+        if coalescer is None and create:
+            coalescer = self._boards[board_id] = BoardCoalescer(board_id, self.window, self._discard)
+        return coalescer
+
+    def _discard(self, board_id, coalescer):
+        if self._boards.get(board_id) is coalescer:
+            del self._boards[board_id]
+
+    def buffer_for(self, board_id, event_type):
+        """Coalescer that should hold this broadcast, or None to publish it now"""
+        if not self.coalesces(event_type):
+            return None
+        if _flushing_board.get() == str(board_id):
+            # Broadcasts produced by a deferred write go straight out; other
+            # tasks keep buffering behind the entries being flushed
+            return None
+        return self.board(board_id)
+
+    async def flush(self, board_id):
+        """Flush whatever is pending for the board (no-op when nothing is)"""
+        coalescer = self.board(board_id, create=False)
+        if coalescer is not None and len(coalescer) and not coalescer.flushing:
+            await coalescer.flush_now()
+
+
+_coalescing = None
+_coalescing_lock = threading.Lock()
+
+
+def get_coalescing():
+    """Return the process-wide coalescing registry"""
+    global _coalescing
+    if _coalescing is None:
+        with _coalescing_lock:
+            if _coalescing is None:
+                _coalescing = EventCoalescing(**getattr(settings, 'BOARD_EVENT_COALESCING', DEFAULT_EVENT_COALESCING))
+    return _coalescing
+
+
+def reset_coalescing():
+    """Drop the registry and its pending entries (used by tests and settings changes)"""
+    global _coalescing
+    _coalescing = None
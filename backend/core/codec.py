@@ -0,0 +1,164 @@
+import json
+import logging
+import threading
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JSON_CODEC = {
+    'BACKEND': 'core.codec.StdlibCodec',
+    'OPTIONS': {},
+}
+
+
+class DecodeError(ValueError):
+    """Raised by every codec for malformed input, whatever the backend's own error type"""
+
+
+_fallback_encoder = DjangoJSONEncoder()
+
+
+def encode_default(obj):
+    """Fallback for types a backend cannot encode natively (Decimal, lazy strings, timedelta...)"""
+    return _fallback_encoder.default(obj)
+
+
+class BaseCodec:
+    """
+    JSON codec used for WebSocket frames, the event log, board snapshots and
+    DRF requests/responses. Output is compact (no whitespace) UTF-8.
+    """
+
+    name = None
+
+    def dumps(self, obj):
+        """Encode to str (WebSocket text frames)"""
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def dumps_bytes(self, obj):
+        """Encode to UTF-8 bytes (HTTP bodies, Redis)"""
+        raise NotImplementedError
+
+    def loads(self, data):
+        """Decode str or bytes, raising DecodeError on malformed input"""
+        raise NotImplementedError
+
+
+class StdlibCodec(BaseCodec):
+    """The json module with Django's encoder for datetimes, Decimals and UUIDs"""
+
+    name = 'stdlib'
+
+    def __init__(self):
+        self._encoder = DjangoJSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+    def dumps(self, obj):
+        return self._encoder.encode(obj)
+
+    def dumps_bytes(self, obj):
+        return self._encoder.encode(obj).encode('utf-8')
+
+    def loads(self, data):
+        try:
+            return json.loads(data)
+        except ValueError as e:
+            raise DecodeError(str(e))
+
+
+class OrjsonCodec(BaseCodec):
+    """orjson: native datetime/UUID/dataclass encoding, Decimals as strings"""
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+        self._option = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(self, obj):
+        return self._orjson.dumps(obj, default=encode_default, option=self._option)
+
+    def loads(self, data):
+        try:
+            return self._orjson.loads(data)
+        except self._orjson.JSONDecodeError as e:
+            raise DecodeError(str(e))
+
+
+class MsgspecCodec(BaseCodec):
+    """msgspec.json: native datetime/Decimal/UUID encoding with reusable encoder and decoder"""
+
+    name = 'msgspec'
+
+    def __init__(self):
+        import msgspec
+
+        self._encoder = msgspec.json.Encoder(enc_hook=encode_default)
+        self._decoder = msgspec.json.Decoder()
+        self._error = msgspec.DecodeError
+
+    def dumps_bytes(self, obj):
+        return self._encoder.encode(obj)
+
+    def loads(self, data):
+        try:
+            return self._decoder.decode(data)
+        except self._error as e:
+            raise DecodeError(str(e))
+
+
+_codec = None
+_codec_lock = threading.Lock()
+
+
+def load_codec(config):
+    """Instantiate the codec described by `config`, falling back to the stdlib when unavailable"""
+    try:
+        backend = import_string(config['BACKEND'])
+        return backend(**config.get('OPTIONS', {}))
+    except ImportError as e:
+        logger.warning(f"JSON codec {config['BACKEND']} unavailable ({str(e)}), using stdlib json")
+        return StdlibCodec()
+
+
+def get_codec():
+    """Return the process-wide codec configured by JSON_CODEC"""
+    global _codec
+    if _codec is None:
+        with _codec_lock:
+            if _codec is None:
+                _codec = load_codec(getattr(settings, 'JSON_CODEC', DEFAULT_JSON_CODEC))
+    return _codec
+
+
+def reset_codec():
+    """Drop the configured codec instance (used by tests and settings changes)"""
+    global _codec
+    _codec = None
+
+
+class CodecJSONRenderer(JSONRenderer):
+    """DRF JSON renderer backed by the configured codec; indented output is left to DRF's renderer"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        return get_codec().dumps_bytes(data)
+
+
+class CodecJSONParser(JSONParser):
+    """DRF JSON parser backed by the configured codec"""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return get_codec().loads(stream.read())
+        except DecodeError as e:
+            raise ParseError(f"JSON parse error - {str(e)}")
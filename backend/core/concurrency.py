@@ -0,0 +1,110 @@
+import functools
+import random
+import time
+from django.db import OperationalError, transaction
+from django.db.models import F
+from django.forms.models import model_to_dict
+from .history import record_history
+
+
+class ConflictError(Exception):
+    """A versioned write lost the race: the row changed since the client read it"""
+
+    def __init__(self, instance, expected_version, current):
+        self.model = type(instance)
+        self.pk = instance.pk
+        self.expected_version = expected_version
+        self.current = current
+        super().__init__(
+            f"{self.model.__name__} {self.pk} was modified concurrently "
+            f"(expected version {expected_version}, "
+            f"current {current.version if current else 'deleted'})"
+        )
+
+    def as_payload(self):
+        """Structured body for the `conflict` event sent back to the writer"""
+        return {
+            "entity": self.model._meta.model_name,
+            "id": self.pk,
+            "expected_version": self.expected_version,
+            "current_version": self.current.version if self.current else None,
+            "current": model_to_dict(self.current) if self.current else None,
+        }
+
+
+# SQLSTATEs of transactions PostgreSQL rolled back to break a deadlock or a
+# serialization conflict; the same write succeeds when simply run again
+TRANSIENT_SQLSTATES = {'40P01', '40001'}
+TRANSIENT_ATTEMPTS = 3
+
+
+def is_transient(error):
+    cause = error.__cause__
+    return (getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)) in TRANSIENT_SQLSTATES
+
+
+def run_retrying(call, before_retry=None):
+    """
+    Run `call()`, running it again (up to TRANSIENT_ATTEMPTS times) when the
+    database aborted it as a deadlock victim. Only retried outside an
+    enclosing transaction, which the error has already spoiled.
+    """
+    for attempt in range(1, TRANSIENT_ATTEMPTS + 1):
+        try:
+            return call()
+        except OperationalError as e:
+            if attempt == TRANSIENT_ATTEMPTS or not is_transient(e) or transaction.get_connection().in_atomic_block:
+                raise
+        # A little jitter so the two sides of a deadlock do not meet again
+        time.sleep(random.uniform(0, 0.01 * attempt))
+        if before_retry is not None:
+            before_retry()
+
+
+def retrying(func):
+    """Decorator form of run_retrying"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return run_retrying(lambda: func(*args, **kwargs))
+
+    return wrapper
+
+
+def claim_version(instance, expected_version=None):
+    """
+    Bump the row's version only if it still matches, without touching any other
+    column. Used by REST updates, which then save the full row at the new version.
+    """
+    model = type(instance)
+    expected = instance.version if expected_version is None else expected_version
+    claimed = model.objects.filter(pk=instance.pk, version=expected).update(version=F('version') + 1)
+    if not claimed:
+        raise ConflictError(instance, expected, model.objects.filter(pk=instance.pk).first())
+    return expected + 1
+
+
+def versioned_update(instance, changes, expected_version=None, user=None):
+    """
+    Apply `changes` ({attname: value}) with a single conditional
+    UPDATE ... SET ..., version = version + 1 WHERE id = %s AND version = %s.
+    No row lock is taken and only the changed columns are written. Raises
+    ConflictError if another writer got there first.
+    """
+    model = type(instance)
+    expected = instance.version if expected_version is None else expected_version
+    if not changes:
+        return instance
+
+    updated = model.objects.filter(pk=instance.pk, version=expected).update(
+        version=F('version') + 1, **changes
+    )
+    if not updated:
+        raise ConflictError(instance, expected, model.objects.filter(pk=instance.pk).first())
+
+    for attname, value in changes.items():
+        setattr(instance, attname, value)
+    instance.version = expected + 1
+    # Queryset updates bypass post_save, so record the history row explicitly
+    record_history(model, [instance], '~', user)
+    return instance
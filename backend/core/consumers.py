@@ -1,25 +1,47 @@
-import json
 import logging
 from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
 from .models import Card, Column, Board, Project, Team  # Added Project and Team models
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
-from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from jwt import decode as jwt_decode
-from django.conf import settings
+from django.db import transaction
+from .snapshot_cache import get_snapshot_cache, invalidates_snapshot
+from .snapshot import cached_board_snapshot_bytes
+from .event_log import get_event_log
+from .fanout import encode_broadcast, get_broadcast_stats
+from .backpressure import OutboundQueue, outbound_queue_config
+from .coalesce import EVENT_MERGERS, get_coalescing, merge_latest, merge_payloads
+from .auth_cache import get_auth_cache
+from .access import has_board_access
+from .membership import sync_team_members, team_members
+from .middleware import get_token_from_scope, get_user_from_token
+from .codec import DecodeError, get_codec
+from .db import board_db
+from .dispatch import HandlerRegistry, Field, PayloadError, ID_TYPES
+from .concurrency import ConflictError, retrying, versioned_update
+from .returning import insert_returning, update_returning, delete_returning, parent_id
+from .ranking import card_rank, column_rank, schedule_rebalance, rebalance_cards, rebalance_columns
+from .wip import WipGuard, WipLimitError
+from .presence import get_presence, get_presence_broadcaster
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Registry of client event types -> BoardConsumer handlers and payload schemas
+board_events = HandlerRegistry()
+
+MAX_BATCH_OPERATIONS = 500
+
+def entity_id(*aliases):
+    return Field(ID_TYPES, required=True, aliases=aliases)
+
 
 class BoardConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.board_id = self.scope['url_route']['kwargs']['board_id']
         self.room_group_name = f"board_{self.board_id}"
         self.user = None
+        self.outbound = None
         
         # Authenticate user
         user = await self.get_user_from_token()
@@ -42,17 +64,33 @@ class BoardConsumer(AsyncWebsocketConsumer):
 
         await self.accept()
         
-        # Send welcome message with user info
-        await self.send(text_data=json.dumps({
+        # Send welcome message with user info and who else is here
+        current_seq = await get_event_log().acurrent_seq(self.board_id)
+        self.outbound = self.create_outbound_queue(current_seq)
+        presence = get_presence()
+        await presence.ajoin(self.board_id, self.channel_name, user.id, user.username)
+        get_presence_broadcaster().changed(self.board_id)
+        await self.send(text_data=get_codec().dumps({
             "type": "connection.established",
             "payload": {
                 "user_id": user.id,
                 "username": user.username,
-                "board_id": self.board_id
+                "board_id": self.board_id,
+                "seq": current_seq,
+                "viewers": await presence.aviewers(self.board_id)
             }
         }))
 
+        # Reconnecting clients pass the last seq they saw and get only what they missed
+        last_seq = self.get_last_seq()
+        if last_seq is not None:
+            await self.resync(last_seq)
+
     async def disconnect(self, close_code):
+        if self.outbound is not None:
+            self.outbound.close()
+            if await get_presence().aleave(self.board_id, self.channel_name):
+                get_presence_broadcaster().changed(self.board_id)
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
@@ -60,7 +98,7 @@ class BoardConsumer(AsyncWebsocketConsumer):
 
     async def receive(self, text_data):
         try:
-            data = json.loads(text_data)
+            data = get_codec().loads(text_data)
             event_type = data.get("type")
             payload = data.get("payload")
             
@@ -68,41 +106,34 @@ class BoardConsumer(AsyncWebsocketConsumer):
                 await self.send_error("Missing 'type' or 'payload' in message")
                 return
             
-            # Handle card events
-            if event_type == "card.created":
-                await self.handle_card_created(payload)
-            elif event_type == "card.updated":
-                await self.handle_card_updated(payload)
-            elif event_type == "card.deleted":
-                await self.handle_card_deleted(payload)
-            elif event_type == "card.moved":  # NEW: Added card move functionality
-                await self.handle_card_moved(payload)
-            
-            # Handle column events
-            elif event_type == "column.created":
-                await self.handle_column_created(payload)
-            elif event_type == "column.updated":
-                await self.handle_column_updated(payload)
-            elif event_type == "column.deleted":
-                await self.handle_column_deleted(payload)
-            
-            # Handle board events
-            elif event_type == "board.updated":
-                await self.handle_board_updated(payload)
-            
-            # NEW: Handle project events
-            elif event_type == "project.renamed":
-                await self.handle_project_renamed(payload)
+            handler = board_events.get(event_type)
+            if handler is None:
+                await self.send_error(f"Unknown event type: {event_type}")
+                return
             
-            # NEW: Handle team events
-            elif event_type == "team.updated":
-                await self.handle_team_updated(payload)
+            try:
+                payload = handler.validate(payload)
+            except PayloadError as e:
+                await self.send_error(f"Invalid {event_type} payload: {str(e)}")
+                return
             
-            else:
-                await self.send_error(f"Unknown event type: {event_type}")
+            coalescing = get_coalescing()
+            if coalescing.defers(event_type):
+                # Merge this socket's rapid edits to the same entity and write once when the window closes
+                key = (event_type, payload["id"], self.channel_name)
+                flush = lambda merged, func=handler.func: func(self, merged)
+                if not coalescing.board(self.board_id).add(key, payload, merge_payloads, flush):
+                    # The pending edit expects another version: write it (and report its conflict) first
+                    await coalescing.board(self.board_id).flush_now()
+                    coalescing.board(self.board_id).add(key, payload, merge_payloads, flush)
                 return
+            if handler.mutates and not coalescing.coalesces(event_type):
+                # Deferred writes must land before any other change
+                await coalescing.flush(self.board_id)
+            
+            await handler.func(self, payload)
             
-        except json.JSONDecodeError:
+        except DecodeError:
             await self.send_error("Invalid JSON format")
         except Exception as e:
             logger.error(f"Unexpected error in WebSocket consumer: {str(e)}")
@@ -110,204 +141,193 @@ class BoardConsumer(AsyncWebsocketConsumer):
 
     # Authentication methods
     async def get_user_from_token(self):
-        """Extract and validate JWT token from query string or headers"""
-        try:
-            # Try to get token from query string first
-            query_string = self.scope.get('query_string', b'').decode()
-            query_params = parse_qs(query_string)
-            token = None
-            
-            if 'token' in query_params:
-                token = query_params['token'][0]
-            else:
-                # Try to get from headers
-                headers = dict(self.scope.get('headers', []))
-                auth_header = headers.get(b'authorization', b'').decode()
-                if auth_header.startswith('Bearer '):
-                    token = auth_header.split(' ')[1]
-            
+        """Return the user JWTAuthMiddleware resolved, authenticating here only if it did not run"""
+        if "user" not in self.scope:
+            token = get_token_from_scope(self.scope)
             if not token:
                 logger.warning("No token provided in WebSocket connection")
                 return None
-            
-            # Validate token
-            try:
-                UntypedToken(token)
-                decoded_data = jwt_decode(
-                    token, 
-                    settings.SECRET_KEY, 
-                    algorithms=["HS256"]
-                )
-                user_id = decoded_data.get('user_id')
-                user = await self.get_user_by_id(user_id)
-                return user
-            except (InvalidToken, TokenError, Exception) as e:
-                logger.warning(f"Invalid token: {str(e)}")
-                return None
-                
-        except Exception as e:
-            logger.error(f"Error extracting token: {str(e)}")
-            return None
+            self.scope["user"] = await get_user_from_token(token)
+        user = self.scope["user"]
+        return user if user.is_authenticated else None
 
-    @database_sync_to_async
-    def get_user_by_id(self, user_id):
+    def create_outbound_queue(self, last_seq):
+        """Bounded per-socket queue for group broadcasts (see core.backpressure)"""
+        config = outbound_queue_config()
+        stats = get_broadcast_stats()
+        return OutboundQueue(
+            send=lambda text: self.send(text_data=text),
+            resync=self.resync,
+            disconnect=lambda: self.close(code=4008),
+            max_frames=config['max_frames'],
+            policy=config['policy'],
+            last_seq=last_seq,
+            record=lambda **counters: stats.record_queue(self.room_group_name, **counters),
+        )
+
+    def get_last_seq(self):
+        """Read the client's last-seen event seq from the query string"""
+        query_params = parse_qs(self.scope.get('query_string', b'').decode())
         try:
-            return User.objects.get(id=user_id)
-        except ObjectDoesNotExist:
+            last_seq = int(query_params['last_seq'][0])
+        except (KeyError, ValueError):
             return None
+        # Seqs start at 1; a negative one cannot come from this server
+        return last_seq if last_seq >= 0 else None
 
-    @database_sync_to_async
-    def check_board_access(self, board_id, user):
-        """Check if user has access to this board"""
-        try:
-            # You can customize this logic based on your board permissions
-            board = Board.objects.get(id=board_id)
-            # For now, allow access to all authenticated users
-            # You can add more sophisticated permission checks here
-            return True
-        except ObjectDoesNotExist:
+    async def resync(self, last_seq):
+        """Replay missed events, or send a snapshot if they were evicted from the log"""
+        event_log = get_event_log()
+        missed = await event_log.asince(self.board_id, last_seq)
+        if missed is not None:
+            for event in missed:
+                await self.send(text_data=get_codec().dumps(event))
+            return
+
+        # Read the seq before the snapshot so no event can fall between the two;
+        # events that land in both are dropped by the client using their seq
+        seq = await event_log.acurrent_seq(self.board_id)
+        snapshot = await self.get_board_snapshot()
+        await self.send(text_data='{"type":"board.snapshot","seq":%d,"payload":%s}' % (seq, snapshot.decode('utf-8')))
+
+    @board_db
+    def get_board_snapshot(self):
+        board = Board.objects.get(id=self.board_id)
+        return cached_board_snapshot_bytes(board)
+
+    async def check_board_access(self, board_id, user):
+        """Check if user has access to this board, caching the decision briefly"""
+        auth_cache = get_auth_cache()
+        allowed = auth_cache.get_access(user.id, board_id)
+        if allowed is None:
+            allowed = await self.resolve_board_access(board_id, user)
+            auth_cache.set_access(user.id, board_id, allowed)
+        return allowed
+
+    @board_db
+    def resolve_board_access(self, board_id, user):
+        # Members of the board's project team only; one lookup on the access index
+        if not str(board_id).isdigit():
             return False
+        return has_board_access(user, board_id)
 
     # Card event handlers
+    @board_events.register("card.created", {
+        "column_id": Field(ID_TYPES, required=True),
+        "title": Field(str, required=True),
+        "description": Field(str),
+        "assignee": Field(ID_TYPES, nullable=True),
+        "position": Field(int),
+    })
     async def handle_card_created(self, payload):
         try:
             card = await self.create_card(payload)
-            response = {
-                "type": "card.created",
-                "payload": {
-                    "id": card.id,
-                    "title": card.title,
-                    "description": getattr(card, 'description', ''),
-                    "column_id": card.column_id,
-                    "assignee": card.assignee_id,
-                    "created_by": self.user.id,
-                    "created_at": card.created_at.isoformat() if hasattr(card, 'created_at') else None,
-                    "position": getattr(card, 'position', 0)  # Added position for ordering
-                }
-            }
-            await self.broadcast_event(response)
+            await self.broadcast_event(self.card_created_event(card))
+        except WipLimitError as e:
+            await self.send_wip_limit_exceeded(e)
         except Exception as e:
             await self.send_error(f"Failed to create card: {str(e)}")
 
+    @board_events.register("card.updated", {
+        "id": entity_id("card_id"),
+        "version": Field(int),
+        "title": Field(str),
+        "description": Field(str),
+        "column_id": Field(ID_TYPES),
+        "assignee": Field(ID_TYPES, nullable=True),
+        "position": Field(int),
+    })
     async def handle_card_updated(self, payload):
         try:
             card = await self.update_card(payload)
-            response = {
-                "type": "card.updated",
-                "payload": {
-                    "id": card.id,
-                    "title": card.title,
-                    "description": getattr(card, 'description', ''),
-                    "column_id": card.column_id,
-                    "assignee": card.assignee_id,
-                    "updated_by": self.user.id,
-                    "position": getattr(card, 'position', 0)
-                }
-            }
-            await self.broadcast_event(response)
+            await self.broadcast_event(self.card_updated_event(card))
+        except ConflictError as e:
+            await self.send_conflict(e)
+        except WipLimitError as e:
+            await self.send_wip_limit_exceeded(e)
         except Exception as e:
             await self.send_error(f"Failed to update card: {str(e)}")
 
     # NEW: Card move handler
+    @board_events.register("card.moved", {
+        "id": entity_id("card_id"),
+        "version": Field(int),
+        "new_column_id": Field(ID_TYPES),
+        "new_position": Field(int),
+        "old_column_id": Field(ID_TYPES, nullable=True),
+        "old_position": Field(int, nullable=True),
+    })
     async def handle_card_moved(self, payload):
         try:
             card = await self.move_card(payload)
-            response = {
-                "type": "card.moved",
-                "payload": {
-                    "id": card.id,
-                    "title": card.title,
-                    "description": getattr(card, 'description', ''),
-                    "old_column_id": payload.get("old_column_id"),
-                    "new_column_id": card.column_id,
-                    "old_position": payload.get("old_position"),
-                    "new_position": getattr(card, 'position', 0),
-                    "moved_by": self.user.id
-                }
-            }
-            await self.broadcast_event(response)
+            await self.broadcast_event(self.card_moved_event(card, payload))
+        except ConflictError as e:
+            await self.send_conflict(e)
+        except WipLimitError as e:
+            await self.send_wip_limit_exceeded(e)
         except Exception as e:
             await self.send_error(f"Failed to move card: {str(e)}")
 
+    @board_events.register("card.deleted", {
+        "id": entity_id("card_id"),
+    })
     async def handle_card_deleted(self, payload):
         try:
-            card_id = payload.get("id") or payload.get("card_id")
-            if not card_id:
-                await self.send_error("Missing card ID for deletion")
-                return
+            card_id = payload["id"]
             
-            # Get card info before deletion for broadcast
-            card_info = await self.get_card_info(card_id)
-            await self.delete_card(card_id)
+            # The deleted row comes back from the DELETE for the broadcast
+            card_info = await self.delete_card(card_id)
             
-            response = {
-                "type": "card.deleted",
-                "payload": {
-                    "id": card_id,
-                    "column_id": card_info.get("column_id") if card_info else None,
-                    "deleted_by": self.user.id
-                }
-            }
-            await self.broadcast_event(response)
+            await self.broadcast_event(self.card_deleted_event(card_id, card_info))
         except Exception as e:
             await self.send_error(f"Failed to delete card: {str(e)}")
 
     # Column event handlers
+    @board_events.register("column.created", {
+        "title": Field(str, required=True),
+        "position": Field(int),
+    })
     async def handle_column_created(self, payload):
         try:
             column = await self.create_column(payload)
-            response = {
-                "type": "column.created",
-                "payload": {
-                    "id": column.id,
-                    "title": column.title,
-                    "board_id": column.board_id,
-                    "position": getattr(column, 'position', 0),
-                    "created_by": self.user.id,
-                    "created_at": column.created_at.isoformat() if hasattr(column, 'created_at') else None
-                }
-            }
-            await self.broadcast_event(response)
+            await self.broadcast_event(self.column_created_event(column))
         except Exception as e:
             await self.send_error(f"Failed to create column: {str(e)}")
 
+    @board_events.register("column.updated", {
+        "id": entity_id("column_id"),
+        "version": Field(int),
+        "title": Field(str),
+        "position": Field(int),
+        "wip_limit": Field(int, nullable=True),
+    })
     async def handle_column_updated(self, payload):
         try:
             column = await self.update_column(payload)
-            response = {
-                "type": "column.updated",
-                "payload": {
-                    "id": column.id,
-                    "title": column.title,
-                    "board_id": column.board_id,
-                    "position": getattr(column, 'position', 0),
-                    "updated_by": self.user.id
-                }
-            }
-            await self.broadcast_event(response)
+            await self.broadcast_event(self.column_updated_event(column))
+        except ConflictError as e:
+            await self.send_conflict(e)
         except Exception as e:
             await self.send_error(f"Failed to update column: {str(e)}")
 
+    @board_events.register("column.deleted", {
+        "id": entity_id("column_id"),
+    })
     async def handle_column_deleted(self, payload):
         try:
-            column_id = payload.get("id") or payload.get("column_id")
-            if not column_id:
-                await self.send_error("Missing column ID for deletion")
-                return
+            column_id = payload["id"]
             
             await self.delete_column(column_id)
-            response = {
-                "type": "column.deleted",
-                "payload": {
-                    "id": column_id,
-                    "deleted_by": self.user.id
-                }
-            }
-            await self.broadcast_event(response)
+            await self.broadcast_event(self.column_deleted_event(column_id))
         except Exception as e:
             await self.send_error(f"Failed to delete column: {str(e)}")
 
     # Board event handlers
+    @board_events.register("board.updated", {
+        "version": Field(int),
+        "title": Field(str),
+        "description": Field(str),
+    })
     async def handle_board_updated(self, payload):
         try:
             board = await self.update_board(payload)
@@ -315,16 +335,24 @@ class BoardConsumer(AsyncWebsocketConsumer):
                 "type": "board.updated",
                 "payload": {
                     "id": board.id,
-                    "title": board.title,
+                    "title": board.name,
                     "description": getattr(board, 'description', ''),
+                    "version": board.version,
                     "updated_by": self.user.id
                 }
             }
             await self.broadcast_event(response)
+        except ConflictError as e:
+            await self.send_conflict(e)
         except Exception as e:
             await self.send_error(f"Failed to update board: {str(e)}")
 
     # NEW: Project event handlers
+    @board_events.register("project.renamed", {
+        "id": entity_id("project_id"),
+        "name": Field(str, required=True, aliases=("new_name",)),
+        "old_name": Field(str, nullable=True),
+    })
     async def handle_project_renamed(self, payload):
         try:
             project = await self.rename_project(payload)
@@ -342,11 +370,15 @@ class BoardConsumer(AsyncWebsocketConsumer):
             await self.send_error(f"Failed to rename project: {str(e)}")
 
     # NEW: Team event handlers
+    @board_events.register("team.updated", {
+        "id": entity_id("team_id"),
+        "name": Field(str),
+        "members": Field(list),
+    })
     async def handle_team_updated(self, payload):
         try:
-            team = await self.update_team(payload)
-            # Get team members for the response
-            team_members = await self.get_team_members(team.id)
+            # The member list comes back from the membership sync itself
+            team, team_members = await self.update_team(payload)
             
             response = {
                 "type": "team.updated",
@@ -361,189 +393,361 @@ class BoardConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             await self.send_error(f"Failed to update team: {str(e)}")
 
+    # Presence: clients heartbeat well within BOARD_PRESENCE['ttl'] and send focus on change.
+    # Neither is broadcast directly; viewers see throttled presence.diff events instead.
+    @board_events.register("presence.heartbeat", {
+        "card_id": Field(ID_TYPES, required=True, nullable=True),
+    }, mutates=False)
+    async def handle_presence_heartbeat(self, payload):
+        await self.update_presence(payload["card_id"])
+
+    @board_events.register("presence.focus", {
+        "card_id": Field(ID_TYPES, required=True, nullable=True),
+    }, mutates=False)
+    async def handle_presence_focus(self, payload):
+        await self.update_presence(payload["card_id"])
+
+    async def update_presence(self, card_id):
+        try:
+            card_id = int(card_id) if card_id is not None else None
+        except ValueError:
+            await self.send_error("Invalid card_id for presence")
+            return
+        presence = get_presence()
+        changed = await presence.atouch(self.board_id, self.channel_name, card_id)
+        if changed is None:
+            # Our entry expired (e.g. the client was suspended); join again
+            changed = await presence.ajoin(self.board_id, self.channel_name, self.user.id, self.user.username, card_id)
+        if changed:
+            get_presence_broadcaster().changed(self.board_id)
+
+    # Batch handler: many card/column operations in one transaction and one thread hop
+    @board_events.register("batch", {
+        "operations": Field(list, required=True),
+        "atomic": Field(bool),
+    })
+    async def handle_batch(self, payload):
+        try:
+            operations = payload["operations"]
+            if len(operations) > MAX_BATCH_OPERATIONS:
+                await self.send_error(f"Batch exceeds {MAX_BATCH_OPERATIONS} operations")
+                return
+            
+            results, events = await self.apply_batch(operations, payload.get("atomic", False))
+            if events:
+                await self.broadcast_event({
+                    "type": "batch",
+                    "payload": {
+                        "events": events,
+                        "updated_by": self.user.id
+                    }
+                })
+            
+            # Per-operation outcome goes back to the sender only
+            await self.send(text_data=get_codec().dumps({
+                "type": "batch.result",
+                "payload": {
+                    "results": results,
+                    "applied": len(events),
+                    "failed": len(results) - len(events)
+                }
+            }))
+        except Exception as e:
+            await self.send_error(f"Failed to apply batch: {str(e)}")
+
+    # Broadcast event builders
+    def card_created_event(self, card):
+        return {
+            "type": "card.created",
+            "payload": {
+                "id": card.id,
+                "title": card.title,
+                "description": getattr(card, 'description', ''),
+                "column_id": card.column_id,
+                "assignee": card.assignee_id,
+                "created_by": self.user.id,
+                "created_at": card.created_at.isoformat() if hasattr(card, 'created_at') else None,
+                "position": getattr(card, 'position', 0),  # Added position for ordering
+                "rank": card.rank,
+                "version": card.version
+            }
+        }
+
+    def card_updated_event(self, card):
+        return {
+            "type": "card.updated",
+            "payload": {
+                "id": card.id,
+                "title": card.title,
+                "description": getattr(card, 'description', ''),
+                "column_id": card.column_id,
+                "assignee": card.assignee_id,
+                "updated_by": self.user.id,
+                "position": getattr(card, 'position', 0),
+                "rank": card.rank,
+                "version": card.version
+            }
+        }
+
+    def card_moved_event(self, card, payload):
+        return {
+            "type": "card.moved",
+            "payload": {
+                "id": card.id,
+                "title": card.title,
+                "description": getattr(card, 'description', ''),
+                "old_column_id": payload.get("old_column_id"),
+                "new_column_id": card.column_id,
+                "old_position": payload.get("old_position"),
+                "new_position": getattr(card, 'position', 0),
+                "rank": card.rank,
+                "version": card.version,
+                "moved_by": self.user.id
+            }
+        }
+
+    def card_deleted_event(self, card_id, card_info):
+        return {
+            "type": "card.deleted",
+            "payload": {
+                "id": card_id,
+                "column_id": card_info.get("column_id") if card_info else None,
+                "deleted_by": self.user.id
+            }
+        }
+
+    def column_created_event(self, column):
+        return {
+            "type": "column.created",
+            "payload": {
+                "id": column.id,
+                "title": column.name,
+                "board_id": column.board_id,
+                "position": getattr(column, 'position', 0),
+                "rank": column.rank,
+                "wip_limit": column.wip_limit,
+                "version": column.version,
+                "created_by": self.user.id,
+                "created_at": column.created_at.isoformat() if hasattr(column, 'created_at') else None
+            }
+        }
+
+    def column_updated_event(self, column):
+        return {
+            "type": "column.updated",
+            "payload": {
+                "id": column.id,
+                "title": column.name,
+                "board_id": column.board_id,
+                "position": getattr(column, 'position', 0),
+                "rank": column.rank,
+                "wip_limit": column.wip_limit,
+                "version": column.version,
+                "updated_by": self.user.id
+            }
+        }
+
+    def column_deleted_event(self, column_id):
+        return {
+            "type": "column.deleted",
+            "payload": {
+                "id": column_id,
+                "deleted_by": self.user.id
+            }
+        }
+
     # Utility methods
     async def send_error(self, error_message):
         """Send error message to client"""
-        await self.send(text_data=json.dumps({
+        await self.send(text_data=get_codec().dumps({
             "type": "error",
             "payload": {
                 "message": error_message
             }
         }))
 
+    async def send_conflict(self, conflict):
+        """Tell the writer its update lost an optimistic-concurrency race"""
+        await self.send(text_data=get_codec().dumps({
+            "type": "conflict",
+            "payload": conflict.as_payload()
+        }))
+
+    async def send_wip_limit_exceeded(self, error):
+        """Tell the writer its card was refused by a full column"""
+        await self.send(text_data=get_codec().dumps({
+            "type": "wip_limit.exceeded",
+            "payload": error.as_payload()
+        }))
+
     async def broadcast_event(self, event):
         """Broadcast event to all connected clients in the board"""
+        if invalidates_snapshot(event["type"]):
+            await get_snapshot_cache().ainvalidate(self.board_id)
+        coalescing = get_coalescing()
+        coalescer = coalescing.buffer_for(self.board_id, event["type"])
+        if coalescer is not None:
+            merge = EVENT_MERGERS.get(event["type"], merge_latest)
+            coalescer.add((event["type"], event["payload"]["id"]), event, merge, self.publish_event)
+            return
+        # Anything still buffered goes out first so clients see events in order
+        await coalescing.flush(self.board_id)
+        await self.publish_event(event)
+
+    async def publish_event(self, event):
+        """Stamp the event with a seq and send it to the board group"""
+        await get_event_log().aappend(self.board_id, event)
+        # Serialize once here; every subscriber writes the same frame as-is
         await self.channel_layer.group_send(
             self.room_group_name,
             {
                 "type": "broadcast_message",  # Fixed: Changed from "broadcast_event" to avoid recursion
-                "event": event
+                "text": encode_broadcast(self.room_group_name, event),
+                "seq": event.get("seq"),
+                "key": [event["type"], event["payload"].get("id")] if "id" in event["payload"] else None
             }
         )
 
     async def broadcast_message(self, event):
-        """Handle broadcast from channel layer"""
-        await self.send(text_data=json.dumps(event["event"]))
+        """Handle broadcast from channel layer; the socket's writer task sends it"""
+        if self.outbound is None:
+            return
+        key = tuple(event["key"]) if event.get("key") else None
+        self.outbound.put(event["text"], seq=event.get("seq"), key=key)
 
     # Database operations - Cards
-    @database_sync_to_async
-    def create_card(self, payload):
-        try:
-            column = Column.objects.get(id=payload["column_id"])
-        except KeyError:
-            raise ValueError("Missing required field: column_id")
-        except ObjectDoesNotExist:
-            raise ValueError(f"Column with id {payload['column_id']} does not exist")
-        
-        try:
-            title = payload["title"]
-        except KeyError:
-            raise ValueError("Missing required field: title")
-        
-        assignee = None
+    def _create_card(self, payload):
+        # Column and assignee are checked by the INSERT itself
+        requires = [(Column, payload["column_id"])]
         if payload.get("assignee"):
-            try:
-                assignee = User.objects.get(id=payload["assignee"])
-            except ObjectDoesNotExist:
-                raise ValueError(f"User with id {payload['assignee']} does not exist")
+            requires.append((User, payload["assignee"]))
         
-        return Card.objects.create(
-            title=title,
-            description=payload.get("description", ""),
-            column=column,
-            assignee=assignee,
-            position=payload.get("position", 0)
-        )
+        # The column's WIP limit is checked (and its counter locked) by the INSERT too
+        card = insert_returning(Card, {
+            "title": payload["title"],
+            "description": payload.get("description", ""),
+            "column_id": payload["column_id"],
+            "assignee_id": payload.get("assignee") or None,
+            "rank": card_rank(payload["column_id"], payload.get("position")),
+        }, requires=requires, user=self.user, conditions=[WipGuard(payload["column_id"])])
+        card.position = payload.get("position", 0)
+        schedule_rebalance(card.rank, rebalance_cards, card.column_id)
+        return card
 
-    @database_sync_to_async
-    def update_card(self, payload):
-        card_id = payload.get("id") or payload.get("card_id")
-        if not card_id:
-            raise ValueError("Missing card ID (use 'id' or 'card_id')")
-        
-        try:
-            card = Card.objects.get(id=card_id)
-        except ObjectDoesNotExist:
-            raise ValueError(f"Card with id {card_id} does not exist")
+    create_card = board_db(_create_card)
+
+    def _update_card(self, payload):
+        card_id = payload["id"]
         
+        changes = {}
+        requires = []
+        conditions = []
         if "title" in payload:
-            card.title = payload["title"]
+            changes["title"] = payload["title"]
         
         if "description" in payload:
-            card.description = payload["description"]
+            changes["description"] = payload["description"]
         
         if "column_id" in payload:
-            try:
-                Column.objects.get(id=payload["column_id"])
-                card.column_id = payload["column_id"]
-            except ObjectDoesNotExist:
-                raise ValueError(f"Column with id {payload['column_id']} does not exist")
+            changes["column_id"] = payload["column_id"]
+            requires.append((Column, payload["column_id"]))
+            conditions.append(WipGuard(payload["column_id"], card_id))
         
-        if "assignee" in payload:
-            if payload["assignee"] is None:
-                card.assignee = None
-            else:
-                try:
-                    assignee = User.objects.get(id=payload["assignee"])
-                    card.assignee = assignee
-                except ObjectDoesNotExist:
-                    raise ValueError(f"User with id {payload['assignee']} does not exist")
+        # Re-rank when the card changes column or position; a move is a single-row update
+        if "column_id" in payload or "position" in payload:
+            column_id = changes.get("column_id", parent_id(Card, card_id, 'column_id'))
+            changes["rank"] = card_rank(column_id, payload.get("position"), exclude_id=card_id)
         
-        if "position" in payload:
-            card.position = payload["position"]
+        if "assignee" in payload:
+            changes["assignee_id"] = payload["assignee"]
+            if payload["assignee"] is not None:
+                requires.append((User, payload["assignee"]))
         
-        card.save()
+        # One conditional UPDATE ... RETURNING of the changed columns; raises ConflictError on a stale version
+        card = update_returning(Card, card_id, changes, payload.get("version"), requires, self.user, conditions)
+        if "rank" in changes:
+            card.position = payload.get("position", 0)
+        schedule_rebalance(card.rank, rebalance_cards, card.column_id)
         return card
 
+    # A move that loses a deadlock (e.g. to a batch touching the same columns) is retried
+    update_card = board_db(retrying(_update_card))
+
     # NEW: Move card method
-    @database_sync_to_async
-    def move_card(self, payload):
-        card_id = payload.get("id") or payload.get("card_id")
-        if not card_id:
-            raise ValueError("Missing card ID (use 'id' or 'card_id')")
+    def _move_card(self, payload):
+        card_id = payload["id"]
         
-        try:
-            card = Card.objects.get(id=card_id)
-        except ObjectDoesNotExist:
-            raise ValueError(f"Card with id {card_id} does not exist")
-        
-        # Update column if provided
+        changes = {}
+        requires = []
+        conditions = []
+        # Update column if provided; the database refuses it when the target is at its WIP limit
         if "new_column_id" in payload:
-            try:
-                new_column = Column.objects.get(id=payload["new_column_id"])
-                card.column = new_column
-            except ObjectDoesNotExist:
-                raise ValueError(f"Column with id {payload['new_column_id']} does not exist")
+            changes["column_id"] = payload["new_column_id"]
+            requires.append((Column, payload["new_column_id"]))
+            conditions.append(WipGuard(payload["new_column_id"], card_id))
         
-        # Update position if provided
-        if "new_position" in payload:
-            card.position = payload["new_position"]
+        # Rank between the new neighbours; no sibling rows are renumbered
+        if "new_column_id" in payload or "new_position" in payload:
+            column_id = changes.get("column_id", parent_id(Card, card_id, 'column_id'))
+            changes["rank"] = card_rank(column_id, payload.get("new_position"), exclude_id=card_id)
         
-        card.save()
+        card = update_returning(Card, card_id, changes, payload.get("version"), requires, self.user, conditions)
+        if "rank" in changes:
+            card.position = payload.get("new_position", 0)
+        schedule_rebalance(card.rank, rebalance_cards, card.column_id)
         return card
 
-    # NEW: Get card info method
-    @database_sync_to_async
-    def get_card_info(self, card_id):
-        try:
-            card = Card.objects.get(id=card_id)
-            return {
-                "id": card.id,
-                "title": card.title,
-                "column_id": card.column_id
-            }
-        except ObjectDoesNotExist:
-            return None
+    move_card = board_db(retrying(_move_card))
 
-    @database_sync_to_async
-    def delete_card(self, card_id):
-        try:
-            card = Card.objects.get(id=card_id)
-            card.delete()
-        except ObjectDoesNotExist:
-            raise ValueError(f"Card with id {card_id} does not exist")
+    def _delete_card(self, card_id):
+        card = delete_returning(Card, card_id, self.user)
+        return {
+            "id": card.id,
+            "title": card.title,
+            "column_id": card.column_id
+        }
+
+    delete_card = board_db(_delete_card)
 
     # Database operations - Columns
-    @database_sync_to_async
-    def create_column(self, payload):
-        try:
-            board = Board.objects.get(id=self.board_id)
-        except ObjectDoesNotExist:
-            raise ValueError(f"Board with id {self.board_id} does not exist")
-        
-        try:
-            title = payload["title"]
-        except KeyError:
-            raise ValueError("Missing required field: title")
-        
-        return Column.objects.create(
-            title=title,
-            board=board,
-            position=payload.get("position", 0)
-        )
+    def _create_column(self, payload):
+        column = insert_returning(Column, {
+            "name": payload["title"],
+            "board_id": self.board_id,
+            "rank": column_rank(self.board_id, payload.get("position")),
+        }, requires=[(Board, self.board_id)], user=self.user)
+        column.position = payload.get("position", 0)
+        schedule_rebalance(column.rank, rebalance_columns, column.board_id)
+        return column
 
-    @database_sync_to_async
-    def update_column(self, payload):
-        column_id = payload.get("id") or payload.get("column_id")
-        if not column_id:
-            raise ValueError("Missing column ID (use 'id' or 'column_id')")
-        
-        try:
-            column = Column.objects.get(id=column_id)
-        except ObjectDoesNotExist:
-            raise ValueError(f"Column with id {column_id} does not exist")
+    create_column = board_db(_create_column)
+
+    def _update_column(self, payload):
+        column_id = payload["id"]
         
+        changes = {}
         if "title" in payload:
-            column.title = payload["title"]
+            changes["name"] = payload["title"]
+        
+        # Lowering the limit below the current count keeps the cards but admits no more
+        if "wip_limit" in payload:
+            if payload["wip_limit"] is not None and payload["wip_limit"] < 0:
+                raise ValueError("wip_limit must be zero or more")
+            changes["wip_limit"] = payload["wip_limit"]
         
         if "position" in payload:
-            column.position = payload["position"]
+            board_id = parent_id(Column, column_id, 'board_id')
+            changes["rank"] = column_rank(board_id, payload["position"], exclude_id=column_id)
         
-        column.save()
+        column = update_returning(Column, column_id, changes, payload.get("version"), user=self.user)
+        if "position" in payload:
+            column.position = payload["position"]
+        schedule_rebalance(column.rank, rebalance_columns, column.board_id)
         return column
 
-    @database_sync_to_async
-    def delete_column(self, column_id):
+    update_column = board_db(_update_column)
+
+    def _delete_column(self, column_id):
         try:
             column = Column.objects.get(id=column_id)
             # Note: This will also delete all cards in the column due to CASCADE
@@ -551,91 +755,135 @@ class BoardConsumer(AsyncWebsocketConsumer):
         except ObjectDoesNotExist:
             raise ValueError(f"Column with id {column_id} does not exist")
 
+    delete_column = board_db(_delete_column)
+
+    # Database operations - Batch
+    def _batch_card_created(self, payload):
+        return self.card_created_event(self._create_card(payload))
+
+    def _batch_card_updated(self, payload):
+        return self.card_updated_event(self._update_card(payload))
+
+    def _batch_card_moved(self, payload):
+        return self.card_moved_event(self._move_card(payload), payload)
+
+    def _batch_card_deleted(self, payload):
+        card_info = self._delete_card(payload["id"])
+        return self.card_deleted_event(payload["id"], card_info)
+
+    def _batch_column_created(self, payload):
+        return self.column_created_event(self._create_column(payload))
+
+    def _batch_column_updated(self, payload):
+        return self.column_updated_event(self._update_column(payload))
+
+    def _batch_column_deleted(self, payload):
+        self._delete_column(payload["id"])
+        return self.column_deleted_event(payload["id"])
+
+    # Operations allowed inside a "batch" message -> sync apply returning the event
+    batch_operations = {
+        "card.created": _batch_card_created,
+        "card.updated": _batch_card_updated,
+        "card.moved": _batch_card_moved,
+        "card.deleted": _batch_card_deleted,
+        "column.created": _batch_column_created,
+        "column.updated": _batch_column_updated,
+        "column.deleted": _batch_column_deleted,
+    }
+
+    @board_db
+    def apply_batch(self, operations, atomic):
+        """
+        Apply operations in one transaction. Each runs in its own savepoint so a
+        failure only rolls back that operation, unless `atomic` is set, in which
+        case the first failure rolls back the whole batch.
+        """
+        results = []
+        events = []
+        with transaction.atomic():
+            for index, operation in enumerate(operations):
+                event_type = operation.get("type") if isinstance(operation, dict) else None
+                try:
+                    apply = self.batch_operations.get(event_type)
+                    if apply is None:
+                        raise PayloadError(f"Event type {event_type!r} cannot be batched")
+                    payload = board_events.get(event_type).validate(operation.get("payload"))
+                    with transaction.atomic():
+                        events.append(apply(self, payload))
+                    results.append({"index": index, "type": event_type, "ok": True})
+                except Exception as e:
+                    result = {"index": index, "type": event_type, "ok": False, "error": str(e)}
+                    if isinstance(e, ConflictError):
+                        result["conflict"] = e.as_payload()
+                    elif isinstance(e, WipLimitError):
+                        result["wip_limit"] = e.as_payload()
+                    results.append(result)
+                    if atomic:
+                        transaction.set_rollback(True)
+                        break
+        if atomic and len(events) < len(operations):
+            for result in results:
+                if result["ok"]:
+                    result.update(ok=False, error="Rolled back")
+            events = []
+        return results, events
+
     # Database operations - Board
-    @database_sync_to_async
+    @board_db
     def update_board(self, payload):
         try:
             board = Board.objects.get(id=self.board_id)
         except ObjectDoesNotExist:
             raise ValueError(f"Board with id {self.board_id} does not exist")
         
+        changes = {}
         if "title" in payload:
-            board.title = payload["title"]
+            changes["name"] = payload["title"]
         
+        # Board has no description column; echo it back without persisting
         if "description" in payload:
             board.description = payload["description"]
         
-        board.save()
+        versioned_update(board, changes, payload.get("version"), self.user)
         return board
 
     # NEW: Database operations - Project
-    @database_sync_to_async
+    @board_db
     def rename_project(self, payload):
-        project_id = payload.get("id") or payload.get("project_id")
-        if not project_id:
-            raise ValueError("Missing project ID (use 'id' or 'project_id')")
+        project_id = payload["id"]
         
         try:
             project = Project.objects.get(id=project_id)
         except ObjectDoesNotExist:
             raise ValueError(f"Project with id {project_id} does not exist")
         
-        if "name" in payload:
-            project.name = payload["name"]
-        elif "new_name" in payload:
-            project.name = payload["new_name"]
-        else:
-            raise ValueError("Missing required field: name or new_name")
+        project.name = payload["name"]
         
         project.save()
         return project
 
     # NEW: Database operations - Team
-    @database_sync_to_async
+    @board_db
     def update_team(self, payload):
-        team_id = payload.get("id") or payload.get("team_id")
-        if not team_id:
-            raise ValueError("Missing team ID (use 'id' or 'team_id')")
+        team_id = payload["id"]
         
         try:
             team = Team.objects.get(id=team_id)
         except ObjectDoesNotExist:
             raise ValueError(f"Team with id {team_id} does not exist")
         
-        if "name" in payload:
-            team.name = payload["name"]
-        
-        # Handle member updates if provided
-        if "members" in payload:
-            # Clear existing members and add new ones
-            team.members.clear()
-            for member_id in payload["members"]:
-                try:
-                    user = User.objects.get(id=member_id)
-                    team.members.add(user)
-                except ObjectDoesNotExist:
-                    logger.warning(f"User with id {member_id} does not exist, skipping")
-        
-        team.save()
-        return team
-
-    # NEW: Get team members
-    @database_sync_to_async
-    def get_team_members(self, team_id):
-        try:
-            team = Team.objects.get(id=team_id)
-            return [
-                {
-                    "id": member.id,
-                    "username": member.username,
-                    "email": getattr(member, 'email', ''),
-                    "first_name": getattr(member, 'first_name', ''),
-                    "last_name": getattr(member, 'last_name', '')
-                }
-                for member in team.members.all()
-            ]
-        except ObjectDoesNotExist:
-            return []
+        with transaction.atomic():
+            if "name" in payload:
+                team.name = payload["name"]
+                team.save()
+            
+            # Diff against the current members and bulk insert/delete only the changes
+            if "members" in payload:
+                members = sync_team_members(team, payload["members"], self.user)
+            else:
+                members = team_members(team.id)
+        return team, members
 
 # import json
 # import logging
@@ -0,0 +1,58 @@
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+
+# Threads used to run BoardConsumer database work. Each thread holds its own
+# database connection, so keep this below the server's connection limit. Off by
+# default: on SQLite the pool measured slower than channels' single DB thread.
+DEFAULT_BOARD_DB_THREADS = 0
+
+_executor = None
+_executor_size = None
+_executor_lock = threading.Lock()
+
+
+def configured_pool_size():
+    return getattr(settings, 'BOARD_DB_THREADS', DEFAULT_BOARD_DB_THREADS)
+
+
+def get_db_executor():
+    """
+    Thread pool for consumer database calls, or None when BOARD_DB_THREADS is 0,
+    which keeps channels' default of one shared thread per process
+    """
+    global _executor, _executor_size
+    size = configured_pool_size()
+    if size != _executor_size:
+        with _executor_lock:
+            if size != _executor_size:
+                old = _executor
+                _executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='board-db') if size else None
+                _executor_size = size
+                if old is not None:
+                    old.shutdown(wait=False)
+    return _executor
+
+
+def board_db(func):
+    """
+    Like channels' database_sync_to_async, but runs on the board database thread
+    pool so handlers for different sockets and boards do not queue behind one thread
+    """
+    # (executor, runner) for the executor currently configured
+    cached = [False, None]
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        executor = get_db_executor()
+        if cached[0] is not executor:
+            if executor is None:
+                cached[1] = DatabaseSyncToAsync(func)
+            else:
+                cached[1] = DatabaseSyncToAsync(func, thread_sensitive=False, executor=executor)
+            cached[0] = executor
+        return await cached[1](*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,97 @@
+ID_TYPES = (int, str)
+
+
+class PayloadError(ValueError):
+    """Raised when an incoming WebSocket payload does not match its schema"""
+
+
+class Field:
+    """
+    Declared payload field. `aliases` are alternative client-side names that
+    are normalized to the declared name before the handler runs.
+    """
+
+    __slots__ = ('types', 'required', 'nullable', 'aliases')
+
+    def __init__(self, types, required=False, nullable=False, aliases=()):
+        self.types = types if isinstance(types, tuple) else (types,)
+        self.required = required
+        self.nullable = nullable
+        self.aliases = tuple(aliases)
+
+
+def compile_schema(schema):
+    """
+    Turn a {name: Field} schema into a validator function. All per-field
+    decisions are made here once, so validating a message is a single pass
+    over a tuple of precomputed checks.
+    """
+    checks = tuple(
+        (name, (name,) + field.aliases, field.types, field.required, field.nullable)
+        for name, field in schema.items()
+    )
+
+    def validate(payload):
+        if not isinstance(payload, dict):
+            raise PayloadError("Payload must be an object")
+        cleaned = {}
+        for name, keys, types, required, nullable in checks:
+            for key in keys:
+                if key in payload:
+                    value = payload[key]
+                    break
+            else:
+                if required:
+                    raise PayloadError(f"Missing required field: {name}")
+                continue
+            if value is None:
+                if not nullable:
+                    raise PayloadError(f"Field '{name}' may not be null")
+            elif not isinstance(value, types) or (type(value) is bool and bool not in types):
+                raise PayloadError(f"Field '{name}' has invalid type {type(value).__name__}")
+            cleaned[name] = value
+        return cleaned
+
+    return validate
+
+
+class Handler:
+    __slots__ = ('event_type', 'func', 'validate', 'mutates')
+
+    def __init__(self, event_type, func, validate, mutates=True):
+        self.event_type = event_type
+        self.func = func
+        self.validate = validate
+        self.mutates = mutates
+
+
+class HandlerRegistry:
+    """Maps event types to handler coroutines and their compiled payload validators"""
+
+    def __init__(self):
+        self._handlers = {}
+
+    def register(self, event_type, schema=None, mutates=True):
+        """
+        Decorator registering a consumer method as the handler for `event_type`.
+        Pass mutates=False for events that change no board data (e.g. presence),
+        so they need not wait for deferred writes
+        """
+        validate = compile_schema(schema or {})
+
+        def decorator(func):
+            if event_type in self._handlers:
+                raise ValueError(f"Handler already registered for {event_type}")
+            self._handlers[event_type] = Handler(event_type, func, validate, mutates)
+            return func
+
+        return decorator
+
+    def get(self, event_type):
+        return self._handlers.get(event_type)
+
+    def event_types(self):
+        return list(self._handlers)
+
+    def __contains__(self, event_type):
+        return event_type in self._handlers
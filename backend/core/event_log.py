@@ -0,0 +1,167 @@
+import threading
+from collections import OrderedDict, deque
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .codec import get_codec
+
+DEFAULT_EVENT_LOG = {
+    'BACKEND': 'core.event_log.LocalEventLog',
+    'OPTIONS': {},
+}
+
+
+class BaseEventLog:
+    """
+    Per-board log of broadcast events. Every appended event is stamped with a
+    monotonically increasing per-board `seq`, and the most recent `max_events`
+    are kept so reconnecting clients can replay what they missed.
+    """
+
+    def append(self, board_id, event):
+        raise NotImplementedError
+
+    def current_seq(self, board_id):
+        raise NotImplementedError
+
+    def since(self, board_id, last_seq):
+        """
+        Events with seq > last_seq, oldest first, or None when part of that
+        range has already been evicted and the client needs a snapshot.
+        """
+        raise NotImplementedError
+
+    async def aappend(self, board_id, event):
+        return self.append(board_id, event)
+
+    async def acurrent_seq(self, board_id):
+        return self.current_seq(board_id)
+
+    async def asince(self, board_id, last_seq):
+        return self.since(board_id, last_seq)
+
+
+class LocalEventLog(BaseEventLog):
+    """In-process ring buffer per board, with LRU eviction of idle boards"""
+
+    def __init__(self, max_events=1000, max_boards=10000):
+        self.max_events = max_events
+        self.max_boards = max_boards
+        self._boards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _board(self, board_id):
+        board_id = str(board_id)
+        board = self._boards.get(board_id)
+        if board is None:
+            board = self._boards[board_id] = {'seq': 0, 'events': deque(maxlen=self.max_events)}
+            if len(self._boards) > self.max_boards:
+                self._boards.popitem(last=False)
+        else:
+            self._boards.move_to_end(board_id)
+        return board
+
+    def append(self, board_id, event):
+        with self._lock:
+            board = self._board(board_id)
+            board['seq'] += 1
+            event['seq'] = board['seq']
+            board['events'].append(event)
+            return board['seq']
+
+    def current_seq(self, board_id):
+        with self._lock:
+            board = self._boards.get(str(board_id))
+            return board['seq'] if board else 0
+
+    def since(self, board_id, last_seq):
+        with self._lock:
+            board = self._boards.get(str(board_id))
+            current = board['seq'] if board else 0
+            if last_seq == current:
+                return []
+            # Unknown future seq (e.g. the log was reset by a restart) or an evicted gap
+            if board is None or last_seq > current or not board['events'] or board['events'][0]['seq'] > last_seq + 1:
+                return None
+            return [event for event in board['events'] if event['seq'] > last_seq]
+
+
+class RedisEventLog(BaseEventLog):
+    """
+    Redis-backed log shared by all workers. Sequence numbers come from an INCR
+    counter and events are kept in a sorted set scored by seq, trimmed to
+    `max_events` entries.
+    """
+
+    def __init__(self, url='redis://localhost:6379/1', max_events=1000, timeout=86400,
+                 key_prefix='devboard:events'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.max_events = max_events
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    def _seq_key(self, board_id):
+        return f"{self.key_prefix}:{board_id}:seq"
+
+    def _events_key(self, board_id):
+        return f"{self.key_prefix}:{board_id}:log"
+
+    def append(self, board_id, event):
+        seq = self.client.incr(self._seq_key(board_id))
+        event['seq'] = seq
+        key = self._events_key(board_id)
+        pipe = self.client.pipeline()
+        pipe.zadd(key, {get_codec().dumps_bytes(event): seq})
+        pipe.zremrangebyrank(key, 0, -(self.max_events + 1))
+        pipe.expire(key, self.timeout)
+        pipe.expire(self._seq_key(board_id), self.timeout)
+        pipe.execute()
+        return seq
+
+    def current_seq(self, board_id):
+        return int(self.client.get(self._seq_key(board_id)) or 0)
+
+    def since(self, board_id, last_seq):
+        current = self.current_seq(board_id)
+        if last_seq == current:
+            return []
+        if last_seq > current:
+            return None
+        key = self._events_key(board_id)
+        oldest = self.client.zrange(key, 0, 0, withscores=True)
+        if not oldest or oldest[0][1] > last_seq + 1:
+            return None
+        return [get_codec().loads(raw) for raw in self.client.zrangebyscore(key, f"({last_seq}", '+inf')]
+
+    async def aappend(self, board_id, event):
+        return await sync_to_async(self.append)(board_id, event)
+
+    async def acurrent_seq(self, board_id):
+        return await sync_to_async(self.current_seq)(board_id)
+
+    async def asince(self, board_id, last_seq):
+        return await sync_to_async(self.since)(board_id, last_seq)
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_event_log():
+    """Return the process-wide event log configured by BOARD_EVENT_LOG"""
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                config = getattr(settings, 'BOARD_EVENT_LOG', DEFAULT_EVENT_LOG)
+                backend = import_string(config['BACKEND'])
+                _log = backend(**config.get('OPTIONS', {}))
+    return _log
+
+
+def reset_event_log():
+    """Drop the configured event log instance (used by tests and settings changes)"""
+    global _log
+    _log = None
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from .codec import get_codec
+from .event_log import get_event_log
+
+
+def empty_counters():
+    return {
+        'frames': 0, 'bytes': 0, 'encode_ns': 0,
+        # Slow-consumer handling (see core.backpressure)
+        'dropped': 0, 'resyncs': 0, 'disconnects': 0, 'max_queue_depth': 0,
+    }
+
+
+class BroadcastStats:
+    """Per-group broadcast counters: frames, encoded bytes, encode time and slow-consumer drops"""
+
+    def __init__(self, max_groups=10000):
+        self.max_groups = max_groups
+        self._groups = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _counters(self, group):
+        counters = self._groups.get(group)
+        if counters is None:
+            counters = self._groups[group] = empty_counters()
+            if len(self._groups) > self.max_groups:
+                self._groups.popitem(last=False)
+        else:
+            self._groups.move_to_end(group)
+        return counters
+
+    def record(self, group, size, encode_ns):
+        with self._lock:
+            counters = self._counters(group)
+            counters['frames'] += 1
+            counters['bytes'] += size
+            counters['encode_ns'] += encode_ns
+
+    def record_queue(self, group, dropped=0, resyncs=0, disconnects=0, depth=None):
+        with self._lock:
+            counters = self._counters(group)
+            counters['dropped'] += dropped
+            counters['resyncs'] += resyncs
+            counters['disconnects'] += disconnects
+            if depth is not None and depth > counters['max_queue_depth']:
+                counters['max_queue_depth'] = depth
+
+    def stats(self, group=None):
+        with self._lock:
+            if group is not None:
+                return dict(self._groups.get(group) or empty_counters())
+            return {name: dict(counters) for name, counters in self._groups.items()}
+
+
+def encode_broadcast(group, event):
+    """
+    Encode a broadcast once for the whole group. The resulting text frame is
+    what travels through the channel layer and is written to every socket.
+    """
+    start = time.perf_counter_ns()
+    data = get_codec().dumps_bytes(event)
+    get_broadcast_stats().record(group, len(data), time.perf_counter_ns() - start)
+    return data.decode('utf-8')
+
+
+def publish_board_event(board_id, event):
+    """
+    Log and broadcast a board event from synchronous code outside a consumer
+    (background jobs), the way BoardConsumer.publish_event does
+    """
+    get_event_log().append(board_id, event)
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    group = f"board_{board_id}"
+    async_to_sync(channel_layer.group_send)(group, {
+        "type": "broadcast_message",
+        "text": encode_broadcast(group, event),
+        "seq": event.get("seq"),
+        "key": None,
+    })
+
+
+_stats = None
+_stats_lock = threading.Lock()
+
+
+def get_broadcast_stats():
+    """Return the process-wide broadcast counters"""
+    global _stats
+    if _stats is None:
+        with _stats_lock:
+            if _stats is None:
+                _stats = BroadcastStats()
+    return _stats
+
+
+def reset_broadcast_stats():
+    """Drop all counters (used by tests)"""
+    global _stats
+    _stats = None
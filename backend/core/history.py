@@ -0,0 +1,401 @@
+import atexit
+import fcntl
+import glob
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from simple_history.models import HistoricalRecords
+from simple_history.signals import post_create_historical_record, pre_create_historical_record
+from simple_history.utils import get_change_reason_from_object
+from .codec import get_codec
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_RECORDING = {
+    'mode': 'sync',
+    'batch_size': 500,
+    'flush_interval_ms': 200,
+    'max_pending': 50000,
+    'journal_dir': None,
+}
+
+# sync     - insert each history row with the change, in the same transaction
+# buffered - queue rows in memory once the change commits and bulk insert them
+#            from a background thread; a crash loses up to one flush interval
+# journal  - like buffered, but each committed row is first appended to the
+#            process's own journal file in journal_dir; a journal left behind by
+#            a dead process is replayed by the next one to start, so a process
+#            crash loses nothing (rows may be inserted twice if it dies mid-flush)
+SYNC = 'sync'
+BUFFERED = 'buffered'
+JOURNAL = 'journal'
+MODES = (SYNC, BUFFERED, JOURNAL)
+
+# Flushes a row may fail on its own (while other rows insert fine) before it is dropped
+MAX_ROW_ATTEMPTS = 3
+
+
+def _insert(rows):
+    """Bulk insert history rows, one statement per historical model and batch"""
+    by_model = {}
+    for row in rows:
+        by_model.setdefault(type(row), []).append(row)
+    for model, model_rows in by_model.items():
+        model.objects.bulk_create(model_rows)
+
+
+def _announce(rows):
+    """Send post_create_historical_record for written rows that simple_history's signals built"""
+    for row in rows:
+        kwargs = row.__dict__.pop('_post_create', None)
+        if kwargs is None:
+            continue
+        for receiver, response in post_create_historical_record.send_robust(sender=type(row), history_instance=row, **kwargs):
+            if isinstance(response, Exception):
+                logger.error(f"post_create_historical_record receiver {receiver} failed: {str(response)}")
+
+
+class HistoryPipeline:
+    """
+    Where history rows go once built: straight to the database (sync) or onto
+    a queue drained in batches by a writer thread (buffered/journal).
+    """
+
+    def __init__(self, mode=SYNC, batch_size=500, flush_interval_ms=200, max_pending=50000, journal_dir=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown history mode {mode!r}; expected one of {MODES}")
+        if mode == JOURNAL and not journal_dir:
+            raise ValueError("History mode 'journal' needs a journal_dir")
+        self.mode = mode
+        self.batch_size = batch_size
+        self.interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self.journal_dir = journal_dir
+        self.journal_path = None
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._writer = None
+        self._journal = None
+        self._counters = {'recorded': 0, 'flushed': 0, 'batches': 0, 'errors': 0, 'dropped': 0}
+        self._last_flush_at = None
+        if mode == JOURNAL:
+            self._open_journal()
+            self._replay_orphaned_journals()
+
+    @property
+    def synchronous(self):
+        return self.mode == SYNC
+
+    def add(self, rows):
+        """Record unsaved history rows; queued ones are only released when the change commits"""
+        rows = list(rows)
+        if not rows:
+            return
+        if self.synchronous:
+            _insert(rows)
+            with self._lock:
+                self._counters['recorded'] += len(rows)
+                self._counters['flushed'] += len(rows)
+            return
+        transaction.on_commit(lambda: self._enqueue(rows))
+
+    def _enqueue(self, rows, journal=True):
+        now = time.monotonic()
+        with self._lock:
+            if journal and self.mode == JOURNAL:
+                self._append_journal(rows)
+            # (queued at, row, failed attempts)
+            self._pending.extend((now, row, 0) for row in rows)
+            self._counters['recorded'] += len(rows)
+            pending = len(self._pending)
+        if pending >= self.max_pending:
+            # The writer has fallen behind (e.g. the database is down); make writers wait
+            self.flush()
+            return
+        self._start_writer()
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def _start_writer(self):
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                    self._writer.start()
+                    atexit.register(self.close)
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Insert everything queued so far in batches; returns the number of rows written"""
+        written = 0
+        retry = []
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                if not batch:
+                    break
+                try:
+                    with transaction.atomic():
+                        _insert([row for _, row, _ in batch])
+                except Exception as e:
+                    logger.error(f"Writing {len(batch)} history rows failed: {str(e)}")
+                    with self._lock:
+                        self._counters['errors'] += 1
+                    if not connection.is_usable():
+                        # The database is away: keep everything, in order, for the next flush
+                        with self._lock:
+                            self._pending.extendleft(reversed(batch))
+                        break
+                    # Otherwise some rows are bad; write the rest and set those aside
+                    inserted, failed = self._write_isolating(batch)
+                    retry += self._retry_or_drop(failed)
+                    batch = inserted
+                    if not batch:
+                        continue
+                written += len(batch)
+                with self._lock:
+                    self._counters['flushed'] += len(batch)
+                    self._counters['batches'] += 1
+                    self._last_flush_at = timezone.now()
+                    if not self._pending and not retry and self.mode == JOURNAL:
+                        self._truncate_journal()
+                _announce([row for _, row, _ in batch])
+            if retry:
+                # Behind everything else, and not again in this flush
+                with self._lock:
+                    self._pending.extend(retry)
+        return written
+
+    def _write_isolating(self, batch):
+        """Insert a failed batch by halves down to single rows; returns (inserted, failed) entries"""
+        if len(batch) == 1:
+            try:
+                with transaction.atomic():
+                    _insert([batch[0][1]])
+            except Exception as e:
+                logger.error(f"History row {batch[0][1]._meta.label} for object {batch[0][1].id} failed: {str(e)}")
+                return [], batch
+            return batch, []
+        middle = len(batch) // 2
+        inserted = []
+        failed = []
+        for half in (batch[:middle], batch[middle:]):
+            try:
+                with transaction.atomic():
+                    _insert([row for _, row, _ in half])
+            except Exception:
+                half_inserted, half_failed = self._write_isolating(half)
+                inserted += half_inserted
+                failed += half_failed
+            else:
+                inserted += half
+        return inserted, failed
+
+    def _retry_or_drop(self, failed):
+        """Rows that failed on their own, to retry on a later flush; gives up on them after MAX_ROW_ATTEMPTS"""
+        retry = [(queued_at, row, attempts + 1) for queued_at, row, attempts in failed if attempts + 1 < MAX_ROW_ATTEMPTS]
+        dropped = [row for _, row, attempts in failed if attempts + 1 >= MAX_ROW_ATTEMPTS]
+        for row in dropped:
+            logger.error(f"Dropping history row after {MAX_ROW_ATTEMPTS} attempts: {self._journal_entry(row)}")
+        with self._lock:
+            self._counters['dropped'] += len(dropped)
+        return retry
+
+    def stats(self):
+        """Queue depth and lag (age of the oldest unwritten row) for the admin"""
+        with self._lock:
+            oldest = self._pending[0][0] if self._pending else None
+            return {
+                'mode': self.mode,
+                'pending': len(self._pending),
+                'lag_seconds': round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+                'last_flush_at': self._last_flush_at.isoformat() if self._last_flush_at else None,
+                **self._counters,
+            }
+
+    def close(self):
+        """Stop the writer after a final flush"""
+        self._stopped = True
+        self._wake.set()
+        if self._writer is not None and self._writer is not threading.current_thread():
+            self._writer.join(timeout=self.interval + 5)
+        self.flush()
+        if self._journal is not None:
+            if not self._pending:
+                os.remove(self.journal_path)
+            # Closing releases the lock, so what is left is replayed by the next process
+            self._journal.close()
+            self._journal = None
+
+    # Journal: one file per process, one JSON line per row ({"model": label, "fields": {attname: value}}).
+    # The owner holds an exclusive flock on it, so a journal nobody has locked was left by a dead process
+    def _open_journal(self):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        name = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}.journal"
+        self.journal_path = os.path.join(self.journal_dir, name)
+        self._journal = open(self.journal_path, 'ab')
+        fcntl.flock(self._journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _append_journal(self, rows):
+        codec = get_codec()
+        self._journal.write(b''.join(codec.dumps_bytes(self._journal_entry(row)) + b'\n' for row in rows))
+        self._journal.flush()
+
+    def _journal_entry(self, row):
+        fields = {
+            field.attname: getattr(row, field.attname)
+            for field in row._meta.concrete_fields if not field.primary_key
+        }
+        return {'model': row._meta.label, 'fields': fields}
+
+    def _truncate_journal(self):
+        if self._journal is not None:
+            self._journal.truncate(0)
+            self._journal.flush()
+
+    def _replay_orphaned_journals(self):
+        """Take over rows that dead processes journaled but did not get to insert"""
+        replayed = 0
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, '*.journal'))):
+            if path == self.journal_path:
+                continue
+            try:
+                journal = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            with journal:
+                try:
+                    fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Its process is still running
+                    continue
+                if not os.path.exists(path) or os.stat(path).st_ino != os.fstat(journal.fileno()).st_ino:
+                    # Another process replayed and removed it first
+                    continue
+                rows = self._read_journal(journal, path)
+                if rows:
+                    logger.info(f"Replaying {len(rows)} history rows from {path}")
+                    # Into our own journal first, so the rows survive us crashing too
+                    self._enqueue(rows)
+                    replayed += len(rows)
+                os.remove(path)
+        if replayed:
+            self.flush()
+
+    def _read_journal(self, journal, path):
+        codec = get_codec()
+        rows = []
+        for line in journal:
+            if not line.strip():
+                continue
+            try:
+                entry = codec.loads(line)
+            except Exception:
+                # A torn final line from a crash mid-write
+                logger.warning(f"Skipping unreadable history journal line in {path}")
+                continue
+            rows.append(apps.get_model(entry['model'])(**entry['fields']))
+        return rows
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_history_pipeline():
+    """Return the process-wide history pipeline configured by HISTORY_RECORDING"""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                config = {**DEFAULT_HISTORY_RECORDING, **getattr(settings, 'HISTORY_RECORDING', {})}
+                _pipeline = HistoryPipeline(**config)
+    return _pipeline
+
+
+def reset_history_pipeline():
+    """Flush and drop the pipeline (used by tests and settings changes)"""
+    global _pipeline
+    with _pipeline_lock:
+        pipeline, _pipeline = _pipeline, None
+    if pipeline is not None:
+        pipeline.close()
+
+
+def record_history(model, instances, history_type, user=None):
+    """
+    Build history rows for `instances` as simple_history would and hand them
+    to the pipeline. For writes that bypass the model signals (queryset
+    updates, raw SQL, bulk membership changes).
+    """
+    history = model.history.model
+    now = timezone.now()
+    get_history_pipeline().add(
+        history(
+            history_date=getattr(instance, '_history_date', now),
+            history_user=getattr(instance, '_history_user', user or history.get_default_history_user(instance)),
+            history_change_reason=get_change_reason_from_object(instance) or '',
+            history_type=history_type,
+            **{field.attname: getattr(instance, field.attname) for field in history.tracked_fields},
+        )
+        for instance in instances
+    )
+
+
+# HistoricalRecords whose signal handlers pass rows to the history pipeline instead of saving them inline
+class PipelineHistoricalRecords(HistoricalRecords):
+    def create_historical_record(self, instance, history_type, using=None):
+        pipeline = get_history_pipeline()
+        if pipeline.synchronous:
+            return super().create_historical_record(instance, history_type, using=using)
+
+        history_date = getattr(instance, '_history_date', timezone.now())
+        history_user = self.get_history_user(instance)
+        history_change_reason = self.get_change_reason_for_object(instance, history_type, using)
+        manager = getattr(instance, self.manager_name)
+        history_instance = manager.model(
+            history_date=history_date,
+            history_type=history_type,
+            history_user=history_user,
+            history_change_reason=history_change_reason,
+            **{field.attname: getattr(instance, field.attname) for field in self.fields_included(instance)},
+        )
+        pre_create_historical_record.send(
+            sender=manager.model,
+            instance=instance,
+            history_date=history_date,
+            history_user=history_user,
+            history_change_reason=history_change_reason,
+            history_instance=history_instance,
+            using=using,
+        )
+        # Sent by the pipeline once the row is actually written
+        history_instance._post_create = {
+            'instance': instance,
+            'history_date': history_date,
+            'history_user': history_user,
+            'history_change_reason': history_change_reason,
+            'using': using,
+        }
+        pipeline.add([history_instance])
@@ -0,0 +1,292 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import time
+import uuid
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer, InMemoryChannelLayer
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# A channel layer that spreads groups over several backend layers (shards) and
+# keeps each process's own sockets off the backends entirely.
+#
+# Sockets get process-local channel names served from in-process queues. A group
+# is joined on its shard once per process, by the process's node channel
+# ("sharded.<node>"); a reader task per shard hands whatever arrives there to
+# the local members. group_send delivers to the local members directly and goes
+# through the shard only when the shard says the group has other nodes in it,
+# so a board whose sockets all live in one worker costs the backend one
+# membership query per broadcast instead of the fan-out.
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hash ring: each shard owns `replicas` points and a key belongs to the next point along"""
+
+    def __init__(self, size, replicas=64):
+        points = sorted((_hash(f"shard-{index}-{replica}"), index) for index in range(size) for replica in range(replicas))
+        self._points = [point for point, _ in points]
+        self._shards = [index for _, index in points]
+
+    def shard(self, key):
+        return self._shards[bisect.bisect(self._points, _hash(key)) % len(self._points)]
+
+
+async def group_size(layer, group):
+    """How many channels a backend layer has in `group`, or None if the backend cannot say"""
+    if hasattr(layer, 'group_size'):
+        return await layer.group_size(group)
+    if isinstance(layer, InMemoryChannelLayer):
+        return len(layer.groups.get(group, ()))
+    if hasattr(layer, '_group_key') and hasattr(layer, 'consistent_hash'):
+        # channels_redis keeps the group as a sorted set of channel -> join time.
+        # These are its private internals: if they change, fall back to always sending
+        try:
+            connection = layer.connection(layer.consistent_hash(group))
+            return await connection.zcount(layer._group_key(group), int(time.time()) - layer.group_expiry, '+inf')
+        except (AttributeError, TypeError) as e:
+            logger.warning(f"Cannot read group size from {type(layer).__name__}: {str(e)}")
+    return None
+
+
+def build_layer(config):
+    """A backend layer from a {'BACKEND', 'CONFIG'} dict (an already built layer is used as is)"""
+    if isinstance(config, BaseChannelLayer):
+        return config
+    return import_string(config['BACKEND'])(**config.get('CONFIG', {}))
+
+
+class ShardedChannelLayer(BaseChannelLayer):
+    """
+    Channel layer over `shards` (a list of {'BACKEND', 'CONFIG'} dicts). Groups
+    are placed on shards by consistent hashing of the group name, so adding a
+    shard moves only about 1/n of the boards. A group seen with members on
+    other nodes is trusted to keep them for `membership_ttl` seconds before
+    the shard is asked again. Otherwise each group_send costs one membership
+    query on the shard (ZCOUNT on Redis) in place of the fan-out itself.
+
+    All of a process's cross-worker traffic on a shard arrives on its one
+    node channel, so that channel gets `node_capacity` slots on every shard
+    instead of the backend's per-channel default.
+
+    Only channels from this layer's new_channel() can join groups. Messages to
+    local members are shallow copies shared between the receivers, not
+    serialized, so consumers must not mutate nested values.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, shards, replicas=64, membership_ttl=5, node_capacity=10000, expiry=60, capacity=100,
+                 channel_capacity=None):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        if not shards:
+            raise ValueError("ShardedChannelLayer needs at least one shard")
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.shards = [build_layer(config) for config in shards]
+        for shard in self.shards:
+            # Ahead of the backend's own patterns; the in-memory layer leaves its dict uncompiled
+            existing = shard.channel_capacity
+            if isinstance(existing, dict):
+                existing = shard.compile_capacities(existing)
+            shard.channel_capacity = shard.compile_capacities({'sharded.*': node_capacity}) + list(existing)
+        self.ring = HashRing(len(self.shards), replicas)
+        self.membership_ttl = membership_ttl
+        self.node = uuid.uuid4().hex
+        self.node_channel = f"sharded.{self.node}"
+        self.counters = {'local_deliveries': 0, 'remote_sends': 0, 'fast_path_sends': 0}
+        # channel -> (event loop, queue) for every socket of this process
+        self._channels = {}
+        # group -> local channels, and channel -> its groups
+        self._groups = {}
+        self._memberships = {}
+        # group -> time until which it is known to have members on other nodes
+        self._shared_until = {}
+        self._readers = {}
+
+    def shard_for(self, name):
+        return self.ring.shard(name)
+
+    def _is_local(self, channel):
+        return '!' in channel and channel.split('!', 1)[0].endswith(f".{self.node}")
+
+    def _node_of(self, channel):
+        return channel.split('!', 1)[0].rsplit('.', 1)[-1]
+
+    # Local delivery
+
+    def _queue(self, channel):
+        loop = asyncio.get_running_loop()
+        entry = self._channels.get(channel)
+        if entry is None or entry[0] is not loop and entry[0].is_closed():
+            entry = self._channels[channel] = (loop, asyncio.Queue(maxsize=self.get_capacity(channel)))
+        return entry[1]
+
+    def _deliver(self, channel, message):
+        """Put a message on a local channel's queue; False if it is gone or full"""
+        entry = self._channels.get(channel)
+        if entry is None:
+            return False
+        loop, queue = entry
+        if queue.full():
+            return False
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if loop is running:
+            queue.put_nowait(dict(message))
+        elif loop.is_closed():
+            self._channels.pop(channel, None)
+            return False
+        else:
+            loop.call_soon_threadsafe(queue.put_nowait, dict(message))
+        self.counters['local_deliveries'] += 1
+        return True
+
+    def _deliver_group(self, group, message):
+        for channel in list(self._groups.get(group, ())):
+            self._deliver(channel, message)
+
+    # Shard readers
+
+    def _ensure_reader(self, index):
+        reader = self._readers.get(index)
+        if reader is None or reader.done() or reader.get_loop().is_closed():
+            self._readers[index] = asyncio.get_running_loop().create_task(self._read(index))
+
+    async def _read(self, index):
+        shard = self.shards[index]
+        while True:
+            try:
+                envelope = await shard.receive(self.node_channel)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Channel layer shard {index} receive failed: {str(e)}")
+                await asyncio.sleep(1)
+                continue
+            if envelope.get('type') == 'sharded.group':
+                # Our own sends already reached the local members
+                if envelope['origin'] != self.node:
+                    self._deliver_group(envelope['group'], envelope['message'])
+            elif envelope.get('type') == 'sharded.send':
+                self._deliver(envelope['channel'], envelope['message'])
+
+    async def _has_remote_members(self, group, shard):
+        now = time.monotonic()
+        if self._shared_until.get(group, 0) > now:
+            return True
+        size = await group_size(shard, group)
+        if size is None:
+            return True
+        if size - (1 if group in self._groups else 0) > 0:
+            self._shared_until[group] = now + self.membership_ttl
+            return True
+        return False
+
+    # Channel layer API
+
+    async def new_channel(self, prefix='specific'):
+        channel = f"{prefix}.{self.node}!{uuid.uuid4().hex}"
+        self._queue(channel)
+        # Direct sends from other nodes arrive on the shard owning our node channel
+        self._ensure_reader(self.shard_for(self.node_channel))
+        return channel
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        if self._is_local(channel):
+            if not self._deliver(channel, message) and channel in self._channels:
+                raise ChannelFull(channel)
+            return
+        if '!' not in channel:
+            await self.shards[self.shard_for(channel)].send(channel, message)
+            return
+        node_channel = f"sharded.{self._node_of(channel)}"
+        await self.shards[self.shard_for(node_channel)].send(node_channel, {
+            'type': 'sharded.send', 'channel': channel, 'message': message,
+        })
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        if not self._is_local(channel):
+            return await self.shards[self.shard_for(channel)].receive(channel)
+        queue = self._queue(channel)
+        try:
+            return await queue.get()
+        except asyncio.CancelledError:
+            # The consumer is shutting down; forget its queue unless it is still in a group
+            if channel not in self._memberships and queue.empty():
+                self._channels.pop(channel, None)
+            raise
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        if not self._is_local(channel):
+            raise ValueError(f"Only channels created by this layer can join groups, not {channel}")
+        self._groups.setdefault(group, set()).add(channel)
+        self._memberships.setdefault(channel, set()).add(group)
+        index = self.shard_for(group)
+        self._ensure_reader(index)
+        # Every join refreshes the node's membership so the backend's group expiry never drops it
+        await self.shards[index].group_add(group, self.node_channel)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        members = self._groups.get(group)
+        if members is None or channel not in members:
+            return
+        members.discard(channel)
+        groups = self._memberships.get(channel)
+        if groups is not None:
+            groups.discard(group)
+            if not groups:
+                del self._memberships[channel]
+        if members:
+            return
+        del self._groups[group]
+        shard = self.shards[self.shard_for(group)]
+        await shard.group_discard(group, self.node_channel)
+        # A local join while we were leaving: stay in the group
+        if group in self._groups:
+            await shard.group_add(group, self.node_channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_group_name(group)
+        self._deliver_group(group, message)
+        shard = self.shards[self.shard_for(group)]
+        if not await self._has_remote_members(group, shard):
+            self.counters['fast_path_sends'] += 1
+            return
+        self.counters['remote_sends'] += 1
+        await shard.group_send(group, {
+            'type': 'sharded.group', 'origin': self.node, 'group': group, 'message': message,
+        })
+
+    async def flush(self):
+        self._channels = {}
+        self._groups = {}
+        self._memberships = {}
+        self._shared_until = {}
+        for shard in self.shards:
+            if hasattr(shard, 'flush'):
+                await shard.flush()
+
+    async def close(self):
+        for reader in self._readers.values():
+            if not reader.get_loop().is_closed():
+                reader.cancel()
+        self._readers = {}
+        for shard in self.shards:
+            if hasattr(shard, 'close'):
+                await shard.close()
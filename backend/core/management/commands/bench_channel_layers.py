@@ -0,0 +1,152 @@
+import asyncio
+import random
+import statistics
+import time
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+from core.layers import ShardedChannelLayer
+
+
+class StandInLayer(InMemoryChannelLayer):
+    """
+    In-process stand-in for one Redis-backed channel layer: every call costs a
+    round trip of `latency_ms`, and a single-threaded server spends `service_us`
+    on it (plus that again per member on group_send), so calls to one backend
+    queue up behind each other the way they do on one Redis
+    """
+
+    def __init__(self, latency_ms=0.2, service_us=20, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency_ms / 1000
+        self.service = service_us / 1e6
+        self.calls = 0
+        self._free_at = 0.0
+
+    async def _round_trip(self, work=1):
+        self.calls += 1
+        now = time.perf_counter()
+        self._free_at = max(now, self._free_at) + self.service * work
+        await asyncio.sleep(self._free_at - now + self.latency)
+
+    async def send(self, channel, message):
+        await self._round_trip()
+        await super().send(channel, message)
+
+    async def receive(self, channel):
+        message = await super().receive(channel)
+        await self._round_trip()
+        return message
+
+    async def group_add(self, group, channel):
+        await self._round_trip()
+        await super().group_add(group, channel)
+
+    async def group_discard(self, group, channel):
+        await self._round_trip()
+        await super().group_discard(group, channel)
+
+    async def group_send(self, group, message):
+        members = list(self.groups.get(group, ()))
+        await self._round_trip(1 + len(members))
+        for channel in members:
+            try:
+                await super().send(channel, message)
+            except ChannelFull:
+                pass
+
+    async def group_size(self, group):
+        await self._round_trip()
+        return len(self.groups.get(group, ()))
+
+
+class Command(BaseCommand):
+    help = (
+        "Board broadcast fan-out through one shared backend versus the sharded channel layer, "
+        "with in-process stand-ins for the Redis backends (no external services needed)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=4, help="Worker processes simulated")
+        parser.add_argument('--shards', type=int, default=4)
+        parser.add_argument('--boards', type=int, default=200)
+        parser.add_argument('--sockets', type=int, default=5, help="Sockets per board")
+        parser.add_argument('--messages', type=int, default=20, help="Broadcasts per board")
+        parser.add_argument('--latency-ms', type=float, default=0.2, help="Round trip to a backend")
+        parser.add_argument('--service-us', type=float, default=20.0, help="Backend time per call")
+        parser.add_argument('--seed', type=int, default=7)
+
+    def backends(self, count, options):
+        return [
+            StandInLayer(latency_ms=options['latency_ms'], service_us=options['service_us'], capacity=10000)
+            for _ in range(count)
+        ]
+
+    async def run(self, options, layers, placement):
+        """Join every socket through its node's layer, broadcast, and wait for every delivery"""
+        latencies = []
+        expected = options['messages']
+        sockets = []
+        for board in range(options['boards']):
+            for node in placement(board):
+                channel = await layers[node].new_channel()
+                await layers[node].group_add(f"board_{board}", channel)
+                sockets.append((layers[node], channel))
+
+        async def receive(layer, channel):
+            for _ in range(expected):
+                message = await layer.receive(channel)
+                latencies.append(time.perf_counter() - message['sent'])
+
+        async def broadcast(board):
+            layer = layers[self.random.choice(placement(board))]
+            for n in range(expected):
+                await layer.group_send(f"board_{board}", {
+                    'type': 'broadcast_message', 'text': f'{{"type": "card.updated", "n": {n}}}',
+                    'sent': time.perf_counter(),
+                })
+
+        receivers = [asyncio.ensure_future(receive(layer, channel)) for layer, channel in sockets]
+        start = time.perf_counter()
+        await asyncio.gather(*(broadcast(board) for board in range(options['boards'])))
+        await asyncio.wait_for(asyncio.gather(*receivers), timeout=120)
+        elapsed = time.perf_counter() - start
+        for layer in set(layers):
+            await layer.close()
+        return elapsed, sorted(latencies)
+
+    def report(self, label, elapsed, latencies, backends):
+        calls = [backend.calls for backend in backends]
+        p50 = statistics.median(latencies) * 1000
+        p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000
+        self.stdout.write(
+            f"{label:<22}{len(latencies) / elapsed:>12.0f}{p50:>9.2f}{p99:>9.2f}{sum(calls):>10}{max(calls):>10}"
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        nodes, size = options['nodes'], min(options['sockets'], options['nodes'])
+
+        def spread(board):
+            # The board's sockets land on different workers
+            return [(board + offset) % nodes for offset in range(options['sockets'])]
+
+        def sticky(board):
+            # The load balancer routes a board's sockets to one worker
+            return [board % nodes] * options['sockets']
+
+        self.stdout.write(
+            f"{options['boards']} boards x {options['sockets']} sockets on {nodes} workers "
+            f"({size} workers per board when spread), {options['messages']} broadcasts per board"
+        )
+        self.stdout.write(f"{'layer':<22}{'deliveries/s':>12}{'p50 ms':>9}{'p99 ms':>9}{'calls':>10}{'busiest':>10}")
+
+        backend = self.backends(1, options)
+        elapsed, latencies = asyncio.run(self.run(options, backend * nodes, spread))
+        self.report('single backend', elapsed, latencies, backend)
+
+        for label, placement in (('sharded, spread', spread), ('sharded, sticky', sticky)):
+            backends = self.backends(options['shards'], options)
+            layers = [ShardedChannelLayer(shards=backends, capacity=10000) for _ in range(nodes)]
+            elapsed, latencies = asyncio.run(self.run(options, layers, placement))
+            self.report(label, elapsed, latencies, backends)
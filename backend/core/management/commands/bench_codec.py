@@ -0,0 +1,55 @@
+import timeit
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.codec import MsgspecCodec, OrjsonCodec, StdlibCodec
+from core.models import User, Team, TeamMembership, Project, Board, Column, Card
+from core.ranking import spread_ranks
+from core.snapshot import build_board_snapshot
+
+CODECS = (StdlibCodec, OrjsonCodec, MsgspecCodec)
+
+
+class Command(BaseCommand):
+    help = "Compare JSON codec backends on a generated board snapshot and a card event (rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--columns', type=int, default=8)
+        parser.add_argument('--cards', type=int, default=250, help="Cards per column")
+        parser.add_argument('--number', type=int, default=200, help="Iterations per measurement")
+
+    def build_payloads(self, columns, cards):
+        user = User.objects.create_user(username='bench-codec')
+        team = Team.objects.create(name='Bench')
+        TeamMembership.objects.create(user=user, team=team, role='admin')
+        board = Board.objects.create(name='Bench', project=Project.objects.create(name='Bench', team=team))
+        for c, column_rank in enumerate(spread_ranks(columns)):
+            column = Column.objects.create(name=f"Column {c}", board=board, rank=column_rank)
+            Card.objects.bulk_create([
+                Card(title=f"Card {c}.{i} – ünïcode", description="Lorem ipsum dolor sit amet " * 8,
+                     column=column, assignee=user, rank=rank)
+                for i, rank in enumerate(spread_ranks(cards))
+            ])
+        snapshot = build_board_snapshot(board)
+        event = {"type": "card.updated", "seq": 1042, "payload": snapshot["columns"][0]["cards"][0]}
+        return {'snapshot': snapshot, 'card event': event}
+
+    def handle(self, *args, **options):
+        number = options['number']
+        with transaction.atomic():
+            payloads = self.build_payloads(options['columns'], options['cards'])
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{'payload':<12}{'codec':<9}{'bytes':>9}{'encode':>14}{'decode':>14}")
+        for label, payload in payloads.items():
+            for codec_class in CODECS:
+                try:
+                    codec = codec_class()
+                except ImportError:
+                    self.stdout.write(f"{label:<12}{codec_class.name:<9}{'not installed':>23}")
+                    continue
+                encoded = codec.dumps_bytes(payload)
+                encode = timeit.timeit(lambda: codec.dumps_bytes(payload), number=number) / number
+                decode = timeit.timeit(lambda: codec.loads(encoded), number=number) / number
+                self.stdout.write(
+                    f"{label:<12}{codec.name:<9}{len(encoded):>9}{encode * 1e6:>11.1f} us{decode * 1e6:>11.1f} us"
+                )
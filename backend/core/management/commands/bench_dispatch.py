@@ -0,0 +1,52 @@
+import json
+import timeit
+from django.core.management.base import BaseCommand
+from core.codec import get_codec
+from core.consumers import board_events
+
+# One representative client message per registered event type
+SAMPLE_MESSAGES = {
+    "card.created": {"column_id": 3, "title": "Write release notes", "description": "For v2", "assignee": 7},
+    "card.updated": {"card_id": 42, "title": "Write release notes (draft)", "position": 2},
+    "card.moved": {"id": 42, "old_column_id": 3, "new_column_id": 4, "old_position": 2, "new_position": 0},
+    "card.deleted": {"id": 42},
+    "column.created": {"title": "Review", "position": 3},
+    "column.updated": {"column_id": 4, "title": "In review"},
+    "column.deleted": {"id": 4},
+    "board.updated": {"title": "Sprint 12", "description": "Release sprint"},
+    "project.renamed": {"id": 1, "old_name": "Web", "new_name": "Web app"},
+    "team.updated": {"team_id": 2, "name": "Platform", "members": [1, 2, 3, 5, 8]},
+    "presence.heartbeat": {"card_id": None},
+    "presence.focus": {"card_id": 42},
+    "batch": {"operations": [{"type": "card.moved", "payload": {"id": 42, "new_position": 1}}]},
+}
+
+
+def dispatch_and_validate(text_data):
+    data = get_codec().loads(text_data)
+    handler = board_events.get(data["type"])
+    return handler.func, handler.validate(data["payload"])
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark BoardConsumer message dispatch plus payload validation per event type"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=100000, help="Messages per event type")
+
+    def handle(self, *args, **options):
+        number = options['number']
+        missing = set(board_events.event_types()) - set(SAMPLE_MESSAGES)
+        if missing:
+            self.stderr.write(f"No sample message for: {', '.join(sorted(missing))}")
+
+        self.stdout.write(f"{'event type':<18}{'decode+dispatch+validate':>28}{'dispatch+validate':>20}")
+        for event_type, payload in SAMPLE_MESSAGES.items():
+            text_data = json.dumps({"type": event_type, "payload": payload})
+            total = timeit.timeit(lambda: dispatch_and_validate(text_data), number=number)
+            dispatch_only = timeit.timeit(
+                lambda: board_events.get(event_type).validate(payload), number=number
+            )
+            self.stdout.write(
+                f"{event_type:<18}{total / number * 1e9:>25.0f} ns{dispatch_only / number * 1e9:>17.0f} ns"
+            )
@@ -0,0 +1,99 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from core.access import accessible_board_ids
+from core.models import User, Team, TeamMembership, Project, Board, Column, Card
+from core.search import search_cards
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        "Card search latency at scale: bulk-loads generated cards (rolled back afterwards) and "
+        "times a results page plus its count for common, rare, multi-term and prefix queries"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=1000000)
+        parser.add_argument('--columns', type=int, default=100)
+        parser.add_argument('--vocabulary', type=int, default=20000, help="Distinct generated words")
+        parser.add_argument('--queries', type=int, default=50, help="Timed runs per query kind")
+        parser.add_argument('--target-ms', type=float, default=50.0, help="p95 latency target per page")
+        parser.add_argument('--seed', type=int, default=7)
+
+    def words(self, count):
+        syllables = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'de', 'pa', 'go', 'xe', 'zu', 'bri', 'ston']
+        words = set()
+        while len(words) < count:
+            words.add(''.join(self.random.choice(syllables) for _ in range(self.random.randint(2, 4))))
+        return sorted(words)
+
+    def text(self, words, weights, count):
+        return ' '.join(self.random.choices(words, cum_weights=weights, k=count))
+
+    def load(self, options):
+        user = User.objects.create_user(username='bench-search')
+        team = Team.objects.create(name='Bench search')
+        TeamMembership.objects.create(user=user, team=team, role='admin')
+        board = Board.objects.create(name='Bench', project=Project.objects.create(name='Bench', team=team))
+        columns = [Column.objects.create(name=f"Column {n}", board=board, rank=str(n)) for n in range(options['columns'])]
+
+        words = self.words(options['vocabulary'])
+        # Zipf-like frequencies, so some words are in most cards and most words are rare
+        weights = []
+        total = 0
+        for rank in range(1, len(words) + 1):
+            total += 1 / rank
+            weights.append(total)
+
+        start = time.perf_counter()
+        for offset in range(0, options['cards'], BATCH_SIZE):
+            Card.objects.bulk_create([
+                Card(
+                    title=self.text(words, weights, self.random.randint(3, 6)),
+                    description=self.text(words, weights, self.random.randint(10, 40)),
+                    column=columns[n % len(columns)],
+                    rank='i',
+                )
+                for n in range(offset, min(offset + BATCH_SIZE, options['cards']))
+            ])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Loaded {options['cards']} cards in {elapsed:.1f}s "
+                          f"({options['cards'] / elapsed:.0f} cards/s including index maintenance)")
+        return user, words
+
+    def time_query(self, user, query, runs):
+        latencies = []
+        matches = 0
+        for _ in range(runs):
+            start = time.perf_counter()
+            results = search_cards(Card.objects.filter(column__board_id__in=accessible_board_ids(user)), query)
+            matches = results.count()
+            list(results.values('id', 'title', 'search_rank')[:20])
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        return matches, statistics.median(latencies), latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        with transaction.atomic():
+            user, words = self.load(options)
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE core_card")
+            queries = {
+                'common': words[0],
+                'mid': words[len(words) // 100],
+                'rare': words[-1],
+                'two terms': f"{words[1]} {words[len(words) // 50]}",
+                'prefix': words[len(words) // 100][:3],
+            }
+            self.stdout.write(f"{'query':<11}{'terms':<28}{'matches':>9}{'p50 ms':>9}{'p95 ms':>9}  target")
+            for label, query in queries.items():
+                matches, p50, p95 = self.time_query(user, query, options['queries'])
+                verdict = 'ok' if p95 <= options['target_ms'] else 'MISS'
+                self.stdout.write(f"{label:<11}{query[:27]:<28}{matches:>9}{p50:>9.1f}{p95:>9.1f}  {verdict}")
+            transaction.set_rollback(True)
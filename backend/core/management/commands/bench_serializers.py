@@ -0,0 +1,49 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import User, Team, Project, Board, Column, Card
+from core.serializers import CardSerializer, values_serializer
+
+
+class Command(BaseCommand):
+    help = "Compare CardSerializer(many=True) with the values() fast path on generated rows (rolled back)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', default='1000,10000,100000', help="Comma-separated card counts")
+        parser.add_argument('--repeat', type=int, default=3, help="Best of N runs per path")
+
+    def best_of(self, repeat, func):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def handle(self, *args, **options):
+        counts = [int(count) for count in options['rows'].split(',') if count]
+        repeat = options['repeat']
+        fast = values_serializer(CardSerializer)
+
+        self.stdout.write(f"{'rows':>8}{'ModelSerializer':>18}{'values() path':>16}{'speedup':>10}")
+        with transaction.atomic():
+            user = User.objects.create_user(username='bench-serializers')
+            project = Project.objects.create(name='Bench', team=Team.objects.create(name='Bench'))
+            column = Column.objects.create(name='Bench', board=Board.objects.create(name='Bench', project=project))
+            created = 0
+            for count in counts:
+                Card.objects.bulk_create(
+                    [Card(title=f"Card {i}", description="x" * 200, column=column, assignee=user, rank=f"{i:08d}")
+                     for i in range(created, count)],
+                    batch_size=5000,
+                )
+                created = max(created, count)
+                queryset = Card.objects.filter(column=column).order_by('id')[:count]
+
+                slow = self.best_of(repeat, lambda: CardSerializer(queryset, many=True).data)
+                quick = self.best_of(repeat, lambda: fast.serialize(fast.values(queryset)))
+                self.stdout.write(
+                    f"{count:>8}{slow * 1000:>15.1f} ms{quick * 1000:>13.1f} ms{slow / quick:>9.1f}x"
+                )
+            transaction.set_rollback(True)
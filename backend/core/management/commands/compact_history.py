@@ -0,0 +1,60 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core.retention import compact_model, history_models, table_bytes, vacuum
+
+
+def format_bytes(count):
+    if count is None:
+        return 'n/a'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if count < 1024 or unit == 'GB':
+            return f"{count:.0f} {unit}" if unit == 'B' else f"{count:.1f} {unit}"
+        count /= 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply HISTORY_RETENTION to the history tables: collapse runs of position-only "
+        "changes, keep one row per object per day past keep_all_days, drop rows past "
+        "delete_after_days. Reports the rows and space reclaimed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be removed without deleting")
+        parser.add_argument('--vacuum', action='store_true',
+                            help="VACUUM afterwards and measure the tables again")
+        parser.add_argument('--every', type=int, default=0,
+                            help="Keep running, compacting every N seconds (for the scheduled job)")
+
+    def handle(self, *args, **options):
+        while True:
+            self.compact(options['dry_run'], options['vacuum'])
+            if not options['every']:
+                return
+            close_old_connections()
+            time.sleep(options['every'])
+
+    def compact(self, dry_run, run_vacuum):
+        models = history_models()
+        reports = [compact_model(model, history, dry_run=dry_run) for model, history in models]
+        if run_vacuum and not dry_run:
+            vacuum([history for _, history in models])
+            for report, (_, history) in zip(reports, models):
+                report['bytes_after'] = table_bytes(history)
+
+        # reclaimed is rows removed x average row size: Postgres only hands the space back to
+        # new rows after VACUUM, and never shrinks the files without VACUUM FULL
+        self.stdout.write(
+            f"{'table':<32}{'rows':>10}{'collapsed':>11}{'downsampled':>13}{'expired':>9}"
+            f"{'size':>11}{'reclaimed':>11}{'after':>11}"
+        )
+        for report in reports:
+            self.stdout.write(
+                f"{report['table']:<32}{report['rows_before']:>10}{report['collapsed']:>11}"
+                f"{report['downsampled']:>13}{report['expired']:>9}{format_bytes(report['bytes_before']):>11}"
+                f"{format_bytes(report['reclaimed_bytes']):>11}{format_bytes(report.get('bytes_after')):>11}"
+            )
+        removed = sum(report['rows_before'] - report['rows_after'] for report in reports)
+        verb = "Would remove" if dry_run else "Removed"
+        self.stdout.write(f"{verb} {removed} history rows")
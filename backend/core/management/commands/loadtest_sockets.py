@@ -0,0 +1,82 @@
+import asyncio
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from core.coalesce import reset_coalescing
+from core.models import User, Team, TeamMembership, Project, Board, Column, Card
+from core.testing import BoardSocket
+
+
+class Command(BaseCommand):
+    help = (
+        "In-process WebSocket load test: N sockets, each on its own board, send card.updated "
+        "messages and wait for the broadcast. Compares BOARD_DB_THREADS settings. "
+        "Creates and then deletes its own users and boards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', default='1,8,32,64', help="Comma-separated concurrency levels")
+        parser.add_argument('--messages', type=int, default=20, help="Messages per socket")
+        parser.add_argument('--threads', default='0,16',
+                            help="Comma-separated BOARD_DB_THREADS values; 0 is channels' single DB thread")
+
+    def create_fixtures(self, count):
+        fixtures = []
+        for n in range(count):
+            user = User.objects.create_user(username=f"loadtest-{n}")
+            team = Team.objects.create(name=f"loadtest-{n}")
+            TeamMembership.objects.create(user=user, team=team, role='admin')
+            board = Board.objects.create(name='Load', project=Project.objects.create(name='Load', team=team))
+            card = Card.objects.create(title='Load', column=Column.objects.create(name='Load', board=board, rank='i'))
+            fixtures.append((str(AccessToken.for_user(user)), board.id, card.id))
+        return fixtures
+
+    async def drive_socket(self, token, board_id, card_id, messages, latencies):
+        socket = BoardSocket(f"/ws/boards/{board_id}/", f"token={token}")
+        if not await socket.connect():
+            raise RuntimeError(f"Socket for board {board_id} was rejected")
+        await socket.receive_json_from(10)
+        for n in range(messages):
+            start = time.perf_counter()
+            await socket.send_json_to({'type': 'card.updated', 'payload': {'id': card_id, 'title': f"Load {n}"}})
+            frame = await socket.receive_json_from(30)
+            if frame['type'] != 'card.updated':
+                raise RuntimeError(f"Unexpected frame {frame['type']}: {frame['payload']}")
+            latencies.append(time.perf_counter() - start)
+        await socket.disconnect()
+
+    async def run_level(self, fixtures, messages):
+        latencies = []
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            self.drive_socket(token, board_id, card_id, messages, latencies)
+            for token, board_id, card_id in fixtures
+        ])
+        return time.perf_counter() - start, latencies
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['sockets'].split(',') if level]
+        thread_settings = [int(threads) for threads in options['threads'].split(',') if threads]
+        messages = options['messages']
+        fixtures = self.create_fixtures(max(levels))
+
+        self.stdout.write(f"{'db threads':>10}{'sockets':>9}{'msgs/s':>10}{'p50 ms':>9}{'p95 ms':>9}")
+        try:
+            for threads in thread_settings:
+                # Coalescing would hold every echo for its window; measure the handlers themselves
+                with override_settings(BOARD_DB_THREADS=threads, BOARD_EVENT_COALESCING={'window_ms': 0}):
+                    reset_coalescing()
+                    for level in levels:
+                        elapsed, latencies = asyncio.run(self.run_level(fixtures[:level], messages))
+                        latencies.sort()
+                        self.stdout.write(
+                            f"{threads:>10}{level:>9}{len(latencies) / elapsed:>10.0f}"
+                            f"{statistics.median(latencies) * 1000:>9.1f}"
+                            f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:>9.1f}"
+                        )
+        finally:
+            reset_coalescing()
+            Team.objects.filter(name__startswith='loadtest-').delete()
+            User.objects.filter(username__startswith='loadtest-').delete()
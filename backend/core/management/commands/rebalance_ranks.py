@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db.models.functions import Length
+from core.models import Card, Column
+from core.ranking import MAX_RANK_LENGTH, rebalance_cards, rebalance_columns
+
+
+class Command(BaseCommand):
+    help = "Respace card/column rank keys that have grown too long (or all of them with --all)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Rebalance every column and board")
+        parser.add_argument('--max-length', type=int, default=MAX_RANK_LENGTH)
+
+    def handle(self, *args, **options):
+        cards = Card.objects.all()
+        columns = Column.objects.all()
+        if not options['all']:
+            cards = cards.annotate(rank_length=Length('rank')).filter(rank_length__gt=options['max_length'])
+            columns = columns.annotate(rank_length=Length('rank')).filter(rank_length__gt=options['max_length'])
+
+        column_ids = set(cards.values_list('column_id', flat=True))
+        board_ids = set(columns.values_list('board_id', flat=True))
+        rows = sum(rebalance_cards(column_id) for column_id in column_ids)
+        rows += sum(rebalance_columns(board_id) for board_id in board_ids)
+        self.stdout.write(
+            f"Rebalanced {len(column_ids)} columns and {len(board_ids)} boards ({rows} rows)"
+        )
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.access import rebuild_board_access
+
+
+class Command(BaseCommand):
+    help = "Recompute the user -> board access index from team memberships"
+
+    def handle(self, *args, **options):
+        added, removed = rebuild_board_access()
+        self.stdout.write(f"Board access index rebuilt: {added} added, {removed} removed")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from core.aggregates import repair_card_counts
+
+
+class Command(BaseCommand):
+    help = "Recount cards per board, column and assignee and fix any drift in the card count table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--board', type=int, action='append', dest='boards',
+                            help="Only this board (repeatable)")
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without fixing it")
+
+    def handle(self, *args, **options):
+        drift = repair_card_counts(options['boards'], dry_run=options['dry_run'])
+        for item in drift:
+            assignee = item['assignee'] if item['assignee'] is not None else '-'
+            self.stdout.write(
+                f"board {item['board']} column {item['column']} assignee {assignee}: "
+                f"stored {item['stored']}, actual {item['actual']}"
+            )
+        verb = "found" if options['dry_run'] else "repaired"
+        self.stdout.write(f"Card counts checked: {len(drift)} drifted rows {verb}")
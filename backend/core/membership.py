@@ -0,0 +1,61 @@
+import logging
+from django.db import connection, transaction
+from .access import sync_users_access
+from .auth_cache import get_auth_cache
+from .history import record_history
+from .models import TeamMembership, User
+
+logger = logging.getLogger(__name__)
+
+MEMBER_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name')
+
+DEFAULT_ROLE = 'member'
+
+
+def team_members(team_id):
+    """Member rows for the team.updated broadcast"""
+    return list(User.objects.filter(teams=team_id).order_by('id').values(*MEMBER_FIELDS))
+
+
+def sync_team_members(team, member_ids, user=None):
+    """
+    Make `member_ids` the team's members in one transaction, inserting and
+    deleting only the difference. Kept members keep their role; new ones join
+    as DEFAULT_ROLE; unknown user ids are skipped. Returns the new member rows,
+    read by the same query that validates the ids.
+    """
+    member_ids = {int(member_id) for member_id in member_ids}
+    with transaction.atomic():
+        members = list(User.objects.filter(id__in=member_ids).order_by('id').values(*MEMBER_FIELDS))
+        desired = {member['id'] for member in members}
+        unknown = member_ids - desired
+        if unknown:
+            logger.warning(f"Users {sorted(unknown)} do not exist, skipping")
+
+        existing = {
+            membership.user_id: membership
+            for membership in TeamMembership.objects.filter(team=team)
+        }
+        removed = [membership for user_id, membership in existing.items() if user_id not in desired]
+        added = TeamMembership.objects.bulk_create([
+            TeamMembership(user_id=user_id, team=team, role=DEFAULT_ROLE)
+            for user_id in sorted(desired - existing.keys())
+        ])
+        if removed:
+            # A plain delete() would fetch the rows again and fire the per-row signals
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {connection.ops.quote_name(TeamMembership._meta.db_table)} "
+                    f"WHERE id IN ({', '.join(['%s'] * len(removed))})",
+                    [membership.pk for membership in removed],
+                )
+            record_history(TeamMembership, removed, '-', user)
+        if added:
+            record_history(TeamMembership, added, '+', user)
+
+        # The access signals do not see bulk writes; resync every affected user at once
+        changed = [membership.user_id for membership in added + removed]
+        sync_users_access(changed)
+    for user_id in changed:
+        get_auth_cache().invalidate_user(user_id)
+    return members
@@ -1,19 +1,19 @@
 from urllib.parse import parse_qs
-from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
 from rest_framework_simplejwt.tokens import UntypedToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from jwt import decode as jwt_decode
-from django.conf import settings
+from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
 from django.db import close_old_connections
+from .auth_cache import get_auth_cache
+from .db import board_db
 import logging
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
-@database_sync_to_async
+@board_db
 def get_user_by_id(user_id):
     """Get user by ID from database"""
     try:
@@ -22,24 +22,24 @@ def get_user_by_id(user_id):
         return AnonymousUser()
 
 async def get_user_from_token(token):
-    """Validate JWT token and return user"""
+    """Validate JWT token and return user, served from the auth cache when possible"""
+    auth_cache = get_auth_cache()
+    user = auth_cache.get_user(token)
+    if user is not None:
+        return user
+
     try:
-        # Validate token using SimpleJWT
-        UntypedToken(token)
-        
-        # Decode token to get user data
-        decoded_data = jwt_decode(
-            token, 
-            settings.SECRET_KEY, 
-            algorithms=["HS256"]
-        )
+        # Validates signature and expiry and decodes the claims in one pass
+        validated_token = UntypedToken(token)
         
-        user_id = decoded_data.get('user_id')
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
         if not user_id:
             logger.warning("No user_id found in token")
             return AnonymousUser()
         
         user = await get_user_by_id(user_id)
+        if user.is_authenticated:
+            auth_cache.set_user(token, user, validated_token.get('exp'))
         return user
         
     except (InvalidToken, TokenError) as e:
@@ -49,6 +49,41 @@ async def get_user_from_token(token):
         logger.error(f"Error validating token: {str(e)}")
         return AnonymousUser()
 
+def get_token_from_scope(scope):
+    """Extract JWT token from WebSocket scope (query string or headers)"""
+    token = None
+    
+    try:
+        # Try to get token from query string first
+        query_string = scope.get('query_string', b'').decode()
+        query_params = parse_qs(query_string)
+        
+        if 'token' in query_params:
+            token = query_params['token'][0]
+            logger.debug("Token found in query string")
+            return token
+        
+        # Try to get from headers as fallback
+        headers = dict(scope.get('headers', []))
+        auth_header = headers.get(b'authorization', b'').decode()
+        
+        if auth_header.startswith('Bearer '):
+            token = auth_header.split(' ')[1]
+            logger.debug("Token found in Authorization header")
+            return token
+        
+        # Also check for lowercase 'authorization' header
+        auth_header = headers.get(b'Authorization', b'').decode()
+        if auth_header.startswith('Bearer '):
+            token = auth_header.split(' ')[1]
+            logger.debug("Token found in Authorization header (capitalized)")
+            return token
+            
+    except Exception as e:
+        logger.error(f"Error extracting token from scope: {str(e)}")
+    
+    return None
+
 class JWTAuthMiddleware(BaseMiddleware):
     """
     Custom middleware to authenticate WebSocket connections using JWT tokens.
@@ -62,7 +97,7 @@ class JWTAuthMiddleware(BaseMiddleware):
         close_old_connections()
         
         # Extract token from query string or headers
-        token = await self.get_token_from_scope(scope)
+        token = get_token_from_scope(scope)
         
         if token:
             # Authenticate user with token
@@ -72,38 +107,3 @@ class JWTAuthMiddleware(BaseMiddleware):
             scope["user"] = AnonymousUser()
         
         return await super().__call__(scope, receive, send)
-    
-    async def get_token_from_scope(self, scope):
-        """Extract JWT token from WebSocket scope (query string or headers)"""
-        token = None
-        
-        try:
-            # Try to get token from query string first
-            query_string = scope.get('query_string', b'').decode()
-            query_params = parse_qs(query_string)
-            
-            if 'token' in query_params:
-                token = query_params['token'][0]
-                logger.debug("Token found in query string")
-                return token
-            
-            # Try to get from headers as fallback
-            headers = dict(scope.get('headers', []))
-            auth_header = headers.get(b'authorization', b'').decode()
-            
-            if auth_header.startswith('Bearer '):
-                token = auth_header.split(' ')[1]
-                logger.debug("Token found in Authorization header")
-                return token
-            
-            # Also check for lowercase 'authorization' header
-            auth_header = headers.get(b'Authorization', b'').decode()
-            if auth_header.startswith('Bearer '):
-                token = auth_header.split(' ')[1]
-                logger.debug("Token found in Authorization header (capitalized)")
-                return token
-                
-        except Exception as e:
-            logger.error(f"Error extracting token from scope: {str(e)}")
-        
-        return None
\ No newline at end of file
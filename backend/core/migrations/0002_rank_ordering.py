@@ -0,0 +1,76 @@
+# Generated by Django 5.2.2 on 2026-10-18 02:06
+
+from django.db import migrations, models
+
+# A frozen copy of core.ranking.spread_ranks, so later changes to the key
+# format cannot change what this migration writes
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(ALPHABET)
+
+
+def spread_ranks(count):
+    """Evenly spaced keys for `count` items, as short as possible"""
+    width = 1
+    while BASE ** width <= count:
+        width += 1
+    step = BASE ** width // (count + 1)
+    ranks = []
+    for n in range(1, count + 1):
+        value = n * step
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            digits.append(ALPHABET[digit])
+        ranks.append(''.join(reversed(digits)).rstrip('0'))
+    return ranks
+
+
+def assign_initial_ranks(apps, schema_editor):
+    """Give existing cards and columns evenly spaced ranks in id order"""
+    Column = apps.get_model('core', 'Column')
+    Card = apps.get_model('core', 'Card')
+    for model, scope in ((Column, 'board_id'), (Card, 'column_id')):
+        for scope_id in model.objects.values_list(scope, flat=True).distinct():
+            rows = list(model.objects.filter(**{scope: scope_id}).order_by('id').only('id'))
+            for row, rank in zip(rows, spread_ranks(len(rows))):
+                row.rank = rank
+            model.objects.bulk_update(rows, ['rank'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='rank',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='column',
+            name='rank',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='historicalcard',
+            name='rank',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='historicalcolumn',
+            name='rank',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['column', 'rank'], name='core_card_column_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='column',
+            index=models.Index(fields=['board', 'rank'], name='core_column_board_rank_idx'),
+        ),
+        migrations.RunPython(assign_initial_ranks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.2 on 2026-10-18 02:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_board_access(apps, schema_editor):
+    """Index every (member, board) pair reachable through existing teams"""
+    TeamMembership = apps.get_model('core', 'TeamMembership')
+    BoardAccess = apps.get_model('core', 'BoardAccess')
+    pairs = (
+        TeamMembership.objects
+        .filter(team__project__board__isnull=False)
+        .values_list('user_id', 'team__project__board__id')
+        .distinct()
+    )
+    BoardAccess.objects.bulk_create(
+        [BoardAccess(user_id=user_id, board_id=board_id) for user_id, board_id in pairs],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_row_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access', to='core.board')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='board_access', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'board'), name='core_boardaccess_user_board_uniq')],
+            },
+        ),
+        migrations.RunPython(populate_board_access, migrations.RunPython.noop),
+    ]
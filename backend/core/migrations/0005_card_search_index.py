@@ -0,0 +1,76 @@
+# Generated by Django 5.2.2 on 2026-10-18 14:05
+
+from django.db import migrations
+
+# The card search index as this migration created it. A frozen copy rather than
+# an import of core.search, so later changes there cannot change this step.
+
+POSTGRES_INDEX_SQL = [
+    """
+    ALTER TABLE core_card ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS core_card_search_vector_idx ON core_card USING GIN (search_vector)",
+]
+POSTGRES_DROP_SQL = [
+    "DROP INDEX IF EXISTS core_card_search_vector_idx",
+    "ALTER TABLE core_card DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_INDEX_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS core_card_search USING fts5(
+        title, description, content='core_card', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_card_search_insert AFTER INSERT ON core_card BEGIN
+        INSERT INTO core_card_search (rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_card_search_delete AFTER DELETE ON core_card BEGIN
+        INSERT INTO core_card_search (core_card_search, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_card_search_update AFTER UPDATE OF title, description ON core_card BEGIN
+        INSERT INTO core_card_search (core_card_search, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO core_card_search (rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    "INSERT INTO core_card_search (core_card_search) VALUES ('rebuild')",
+]
+SQLITE_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS core_card_search_insert",
+    "DROP TRIGGER IF EXISTS core_card_search_delete",
+    "DROP TRIGGER IF EXISTS core_card_search_update",
+    "DROP TABLE IF EXISTS core_card_search",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_board_access_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRES_INDEX_SQL, 'sqlite': SQLITE_INDEX_SQL}),
+            run({'postgresql': POSTGRES_DROP_SQL, 'sqlite': SQLITE_DROP_SQL}),
+        ),
+    ]
@@ -0,0 +1,164 @@
+# Generated by Django 5.2.2 on 2026-10-18 02:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# The card count triggers as this migration created them. A frozen copy rather
+# than an import of core.aggregates, so later changes there cannot change this step.
+
+_INCREMENT = [
+    """
+    INSERT INTO core_cardcount (board_id, column_id, assignee_id, cards)
+    SELECT board_id, id, NEW.assignee_id, 1 FROM core_column
+    WHERE id = NEW.column_id AND NEW.assignee_id IS NOT NULL
+    ON CONFLICT (column_id, assignee_id) WHERE assignee_id IS NOT NULL
+    DO UPDATE SET cards = core_cardcount.cards + 1
+    """,
+    """
+    INSERT INTO core_cardcount (board_id, column_id, assignee_id, cards)
+    SELECT board_id, id, NULL, 1 FROM core_column
+    WHERE id = NEW.column_id AND NEW.assignee_id IS NULL
+    ON CONFLICT (column_id) WHERE assignee_id IS NULL
+    DO UPDATE SET cards = core_cardcount.cards + 1
+    """,
+]
+_DECREMENT = [
+    """
+    UPDATE core_cardcount SET cards = cards - 1
+    WHERE column_id = OLD.column_id AND assignee_id IS NOT DISTINCT FROM OLD.assignee_id
+    """,
+]
+_MOVE_COLUMN = [
+    "UPDATE core_cardcount SET board_id = NEW.board_id WHERE column_id = NEW.id",
+]
+_CHANGED = "OLD.column_id IS DISTINCT FROM NEW.column_id OR OLD.assignee_id IS DISTINCT FROM NEW.assignee_id"
+
+
+def _body(statements):
+    return ';\n'.join(statement.strip() for statement in statements) + ';'
+
+
+POSTGRES_TRIGGER_SQL = [
+    f"""
+    CREATE OR REPLACE FUNCTION core_card_count_changed() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            {_body(_DECREMENT)}
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            {_body(_INCREMENT)}
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION core_column_count_moved() RETURNS trigger AS $$
+    BEGIN
+        {_body(_MOVE_COLUMN)}
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS core_card_count_insert_delete ON core_card",
+    """
+    CREATE TRIGGER core_card_count_insert_delete AFTER INSERT OR DELETE ON core_card
+    FOR EACH ROW EXECUTE FUNCTION core_card_count_changed()
+    """,
+    "DROP TRIGGER IF EXISTS core_card_count_update ON core_card",
+    f"""
+    CREATE TRIGGER core_card_count_update AFTER UPDATE OF column_id, assignee_id ON core_card
+    FOR EACH ROW WHEN ({_CHANGED}) EXECUTE FUNCTION core_card_count_changed()
+    """,
+    "DROP TRIGGER IF EXISTS core_column_count_moved ON core_column",
+    """
+    CREATE TRIGGER core_column_count_moved AFTER UPDATE OF board_id ON core_column
+    FOR EACH ROW WHEN (OLD.board_id IS DISTINCT FROM NEW.board_id) EXECUTE FUNCTION core_column_count_moved()
+    """,
+]
+POSTGRES_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS core_card_count_insert_delete ON core_card",
+    "DROP TRIGGER IF EXISTS core_card_count_update ON core_card",
+    "DROP TRIGGER IF EXISTS core_column_count_moved ON core_column",
+    "DROP FUNCTION IF EXISTS core_card_count_changed()",
+    "DROP FUNCTION IF EXISTS core_column_count_moved()",
+]
+
+SQLITE_TRIGGER_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_card_count_insert AFTER INSERT ON core_card BEGIN
+        {_body(_INCREMENT)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_card_count_delete AFTER DELETE ON core_card BEGIN
+        {_body(_DECREMENT)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_card_count_update AFTER UPDATE OF column_id, assignee_id ON core_card
+    WHEN {_CHANGED} BEGIN
+        {_body(_DECREMENT + _INCREMENT)}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_column_count_moved AFTER UPDATE OF board_id ON core_column
+    WHEN OLD.board_id IS NOT NEW.board_id BEGIN
+        {_body(_MOVE_COLUMN)}
+    END
+    """,
+]
+SQLITE_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS core_card_count_insert",
+    "DROP TRIGGER IF EXISTS core_card_count_delete",
+    "DROP TRIGGER IF EXISTS core_card_count_update",
+    "DROP TRIGGER IF EXISTS core_column_count_moved",
+]
+
+
+BACKFILL_SQL = """
+    INSERT INTO core_cardcount (board_id, column_id, assignee_id, cards)
+    SELECT core_column.board_id, core_card.column_id, core_card.assignee_id, COUNT(*)
+    FROM core_card JOIN core_column ON core_column.id = core_card.column_id
+    GROUP BY core_column.board_id, core_card.column_id, core_card.assignee_id
+"""
+
+
+def create_triggers(apps, schema_editor):
+    statements = {'postgresql': POSTGRES_TRIGGER_SQL, 'sqlite': SQLITE_TRIGGER_SQL}.get(schema_editor.connection.vendor)
+    if statements is None:
+        return
+    schema_editor.execute(BACKFILL_SQL)
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_triggers(apps, schema_editor):
+    for sql in {'postgresql': POSTGRES_DROP_SQL, 'sqlite': SQLITE_DROP_SQL}.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_card_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cards', models.IntegerField(default=0)),
+                ('assignee', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='card_counts', to=settings.AUTH_USER_MODEL)),
+                ('board', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='card_counts', to='core.board')),
+                ('column', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='card_counts', to='core.column')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['board', 'column'], name='core_cardcount_board_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('assignee__isnull', False)), fields=('column', 'assignee'), name='core_cardcount_column_assignee_uniq'), models.UniqueConstraint(condition=models.Q(('assignee__isnull', True)), fields=('column',), name='core_cardcount_column_unassigned_uniq')],
+            },
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
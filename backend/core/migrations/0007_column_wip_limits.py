@@ -0,0 +1,137 @@
+# Generated by Django 5.2.2 on 2026-10-18 02:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The column counter triggers as this migration created them. A frozen copy rather
+# than an import of core.wip, so later changes there cannot change this step.
+
+_ENTER = "UPDATE core_columncount SET cards = cards + 1 WHERE column_id = NEW.column_id"
+_LEAVE = "UPDATE core_columncount SET cards = cards - 1 WHERE column_id = OLD.column_id"
+_CREATE = "INSERT INTO core_columncount (column_id, cards) VALUES (NEW.id, 0) ON CONFLICT (column_id) DO NOTHING"
+
+POSTGRES_TRIGGER_SQL = [
+    f"""
+    CREATE OR REPLACE FUNCTION core_column_count_changed() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            {_LEAVE};
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            {_ENTER};
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION core_column_count_created() RETURNS trigger AS $$
+    BEGIN
+        {_CREATE};
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS core_column_count_insert_delete ON core_card",
+    """
+    CREATE TRIGGER core_column_count_insert_delete AFTER INSERT OR DELETE ON core_card
+    FOR EACH ROW EXECUTE FUNCTION core_column_count_changed()
+    """,
+    "DROP TRIGGER IF EXISTS core_column_count_update ON core_card",
+    """
+    CREATE TRIGGER core_column_count_update AFTER UPDATE OF column_id ON core_card
+    FOR EACH ROW WHEN (OLD.column_id IS DISTINCT FROM NEW.column_id) EXECUTE FUNCTION core_column_count_changed()
+    """,
+    "DROP TRIGGER IF EXISTS core_column_count_created ON core_column",
+    """
+    CREATE TRIGGER core_column_count_created AFTER INSERT ON core_column
+    FOR EACH ROW EXECUTE FUNCTION core_column_count_created()
+    """,
+]
+POSTGRES_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS core_column_count_insert_delete ON core_card",
+    "DROP TRIGGER IF EXISTS core_column_count_update ON core_card",
+    "DROP TRIGGER IF EXISTS core_column_count_created ON core_column",
+    "DROP FUNCTION IF EXISTS core_column_count_changed()",
+    "DROP FUNCTION IF EXISTS core_column_count_created()",
+]
+
+SQLITE_TRIGGER_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_column_count_insert AFTER INSERT ON core_card BEGIN
+        {_ENTER};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_column_count_delete AFTER DELETE ON core_card BEGIN
+        {_LEAVE};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_column_count_update AFTER UPDATE OF column_id ON core_card
+    WHEN OLD.column_id IS NOT NEW.column_id BEGIN
+        {_LEAVE};
+        {_ENTER};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_column_count_created AFTER INSERT ON core_column BEGIN
+        {_CREATE};
+    END
+    """,
+]
+SQLITE_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS core_column_count_insert",
+    "DROP TRIGGER IF EXISTS core_column_count_delete",
+    "DROP TRIGGER IF EXISTS core_column_count_update",
+    "DROP TRIGGER IF EXISTS core_column_count_created",
+]
+
+BACKFILL_SQL = """
+    INSERT INTO core_columncount (column_id, cards)
+    SELECT core_column.id, (SELECT COUNT(*) FROM core_card WHERE core_card.column_id = core_column.id)
+    FROM core_column
+"""
+
+
+
+def create_triggers(apps, schema_editor):
+    statements = {'postgresql': POSTGRES_TRIGGER_SQL, 'sqlite': SQLITE_TRIGGER_SQL}.get(schema_editor.connection.vendor)
+    if statements is None:
+        return
+    schema_editor.execute(BACKFILL_SQL)
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_triggers(apps, schema_editor):
+    for sql in {'postgresql': POSTGRES_DROP_SQL, 'sqlite': SQLITE_DROP_SQL}.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_card_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ColumnCount',
+            fields=[
+                ('column', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='count', serialize=False, to='core.column')),
+                ('cards', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='column',
+            name='wip_limit',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='historicalcolumn',
+            name='wip_limit',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
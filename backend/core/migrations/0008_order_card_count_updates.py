@@ -0,0 +1,74 @@
+from django.db import migrations
+
+# core_card_count_changed() as this migration leaves it, and as 0006 created it
+# (for the reverse). Frozen copies rather than an import of core.aggregates, so
+# later changes there cannot change this step. The SQLite triggers are unchanged.
+
+INCREMENT = """
+            INSERT INTO core_cardcount (board_id, column_id, assignee_id, cards)
+            SELECT board_id, id, NEW.assignee_id, 1 FROM core_column
+            WHERE id = NEW.column_id AND NEW.assignee_id IS NOT NULL
+            ON CONFLICT (column_id, assignee_id) WHERE assignee_id IS NOT NULL
+            DO UPDATE SET cards = core_cardcount.cards + 1;
+            INSERT INTO core_cardcount (board_id, column_id, assignee_id, cards)
+            SELECT board_id, id, NULL, 1 FROM core_column
+            WHERE id = NEW.column_id AND NEW.assignee_id IS NULL
+            ON CONFLICT (column_id) WHERE assignee_id IS NULL
+            DO UPDATE SET cards = core_cardcount.cards + 1;
+"""
+DECREMENT = """
+            UPDATE core_cardcount SET cards = cards - 1
+            WHERE column_id = OLD.column_id AND assignee_id IS NOT DISTINCT FROM OLD.assignee_id;
+"""
+
+ORDERED_FUNCTION_SQL = f"""
+    CREATE OR REPLACE FUNCTION core_card_count_changed() RETURNS trigger AS $$
+    BEGIN
+        -- A move locks the lower column's row first, so opposite moves cannot deadlock
+        IF TG_OP = 'UPDATE' AND NEW.column_id < OLD.column_id THEN
+            {INCREMENT}
+            {DECREMENT}
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            {DECREMENT}
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            {INCREMENT}
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+ORIGINAL_FUNCTION_SQL = f"""
+    CREATE OR REPLACE FUNCTION core_card_count_changed() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            {DECREMENT}
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            {INCREMENT}
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+
+def replace_function(sql):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_column_wip_limits'),
+    ]
+
+    operations = [
+        migrations.RunPython(replace_function(ORDERED_FUNCTION_SQL), replace_function(ORIGINAL_FUNCTION_SQL)),
+    ]
@@ -0,0 +1,103 @@
+import importlib
+from django.db import migrations
+
+# The WIP limit guard triggers as this migration creates them. A frozen copy
+# rather than an import of core.wip, so later changes there cannot change this
+# step. The column counters it replaces are dropped (and, in reverse, recreated)
+# with 0007's own frozen SQL.
+
+column_counts = importlib.import_module('core.migrations.0007_column_wip_limits')
+
+WIP_LIMIT_EXCEEDED = 'wip_limit_exceeded'
+
+POSTGRES_TRIGGER_SQL = [
+    f"""
+    CREATE OR REPLACE FUNCTION core_card_wip_guard() RETURNS trigger AS $$
+    DECLARE
+        column_limit integer;
+        column_cards integer;
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM core_column WHERE id = NEW.column_id AND wip_limit IS NOT NULL) THEN
+            RETURN NEW;
+        END IF;
+        SELECT wip_limit INTO column_limit FROM core_column WHERE id = NEW.column_id FOR NO KEY UPDATE;
+        SELECT COALESCE(SUM(cards), 0) INTO column_cards FROM core_cardcount WHERE column_id = NEW.column_id;
+        IF column_cards >= column_limit THEN
+            RAISE EXCEPTION '{WIP_LIMIT_EXCEEDED}: % of % cards', column_cards, column_limit
+                USING ERRCODE = 'check_violation';
+        END IF;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS core_card_wip_insert ON core_card",
+    """
+    CREATE TRIGGER core_card_wip_insert BEFORE INSERT ON core_card
+    FOR EACH ROW EXECUTE FUNCTION core_card_wip_guard()
+    """,
+    "DROP TRIGGER IF EXISTS core_card_wip_update ON core_card",
+    """
+    CREATE TRIGGER core_card_wip_update BEFORE UPDATE OF column_id ON core_card
+    FOR EACH ROW WHEN (OLD.column_id IS DISTINCT FROM NEW.column_id) EXECUTE FUNCTION core_card_wip_guard()
+    """,
+]
+POSTGRES_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS core_card_wip_insert ON core_card",
+    "DROP TRIGGER IF EXISTS core_card_wip_update ON core_card",
+    "DROP FUNCTION IF EXISTS core_card_wip_guard()",
+]
+
+_FULL = """
+    (SELECT COALESCE(SUM(cards), 0) FROM core_cardcount WHERE column_id = NEW.column_id)
+    >= (SELECT wip_limit FROM core_column WHERE id = NEW.column_id)
+"""
+
+SQLITE_TRIGGER_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_card_wip_insert BEFORE INSERT ON core_card
+    WHEN {_FULL} BEGIN
+        SELECT RAISE(ABORT, '{WIP_LIMIT_EXCEEDED}');
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_card_wip_update BEFORE UPDATE OF column_id ON core_card
+    WHEN OLD.column_id IS NOT NEW.column_id AND {_FULL} BEGIN
+        SELECT RAISE(ABORT, '{WIP_LIMIT_EXCEEDED}');
+    END
+    """,
+]
+SQLITE_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS core_card_wip_insert",
+    "DROP TRIGGER IF EXISTS core_card_wip_update",
+]
+
+
+
+def run(statements, schema_editor):
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def guard_on_card_counts(apps, schema_editor):
+    column_counts.drop_triggers(apps, schema_editor)
+    run({'postgresql': POSTGRES_TRIGGER_SQL, 'sqlite': SQLITE_TRIGGER_SQL}, schema_editor)
+
+
+def guard_on_column_counts(apps, schema_editor):
+    run({'postgresql': POSTGRES_DROP_SQL, 'sqlite': SQLITE_DROP_SQL}, schema_editor)
+    column_counts.create_triggers(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_order_card_count_updates'),
+    ]
+
+    # In reverse, the ColumnCount table is recreated before its triggers backfill it
+    operations = [
+        migrations.RunPython(guard_on_card_counts, guard_on_column_counts),
+        migrations.DeleteModel(
+            name='ColumnCount',
+        ),
+    ]
@@ -1,6 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
-from simple_history.models import HistoricalRecords
+from .history import PipelineHistoricalRecords
 
 # Custom user model (extensible)
 class User(AbstractUser):
@@ -14,7 +14,7 @@ class Team(models.Model):
         through='TeamMembership',
         related_name='teams'
     )
-    history = HistoricalRecords()
+    history = PipelineHistoricalRecords()
 
     def __str__(self):
         return self.name
@@ -28,7 +28,7 @@ class TeamMembership(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     team = models.ForeignKey(Team, on_delete=models.CASCADE)
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
-    history = HistoricalRecords()
+    history = PipelineHistoricalRecords()
 
     class Meta:
         unique_together = ('user', 'team')
@@ -37,40 +37,95 @@ class TeamMembership(models.Model):
 class Project(models.Model):
     name = models.CharField(max_length=100)
     team = models.ForeignKey(Team, on_delete=models.CASCADE)
-    history = HistoricalRecords()
+    history = PipelineHistoricalRecords()
 
     def __str__(self):
         return self.name
 
-# Board belongs to a Project
+# Board belongs to a Project; version is bumped on every write (optimistic concurrency)
 class Board(models.Model):
     name = models.CharField(max_length=100)
     project = models.ForeignKey(Project, on_delete=models.CASCADE)
-    history = HistoricalRecords()
+    version = models.PositiveIntegerField(default=1)
+    history = PipelineHistoricalRecords()
 
     def __str__(self):
         return self.name
 
-# Column belongs to a Board
+# Column belongs to a Board; rank is a lexicographic ordering key (see core.ranking).
+# wip_limit caps the cards it may hold (null = no limit), enforced by core.wip.
 class Column(models.Model):
     name = models.CharField(max_length=100)
     board = models.ForeignKey(Board, on_delete=models.CASCADE)
-    history = HistoricalRecords()
+    rank = models.CharField(max_length=64, blank=True, default='')
+    wip_limit = models.PositiveIntegerField(null=True, blank=True)
+    version = models.PositiveIntegerField(default=1)
+    history = PipelineHistoricalRecords()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['board', 'rank'], name='core_column_board_rank_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
-# Card belongs to a Column and optionally assigned to a User
+# Card belongs to a Column and optionally assigned to a User; ordered by rank within its column
 class Card(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     column = models.ForeignKey(Column, on_delete=models.CASCADE)
     assignee = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
-    history = HistoricalRecords()
+    rank = models.CharField(max_length=64, blank=True, default='')
+    version = models.PositiveIntegerField(default=1)
+    history = PipelineHistoricalRecords()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['column', 'rank'], name='core_card_column_rank_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+# Materialized user -> board access index, derived from team membership (see core.access).
+# Not history-tracked: it is rebuilt from TeamMembership/Project/Board on every change.
+class BoardAccess(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='board_access')
+    board = models.ForeignKey(Board, on_delete=models.CASCADE, related_name='access')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'board'], name='core_boardaccess_user_board_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.board_id}"
+
+# Denormalized card counts per (board, column, assignee), maintained by database
+# triggers on core_card (see core.aggregates). Column and board totals are sums
+# over a handful of rows. Not history-tracked: it is derived from Card.
+class CardCount(models.Model):
+    board = models.ForeignKey(Board, on_delete=models.CASCADE, related_name='card_counts')
+    column = models.ForeignKey(Column, on_delete=models.CASCADE, related_name='card_counts')
+    assignee = models.ForeignKey(User, on_delete=models.CASCADE, null=True, related_name='card_counts')
+    cards = models.IntegerField(default=0)
+
+    class Meta:
+        # Two partial indexes so unassigned cards also have exactly one row per column
+        constraints = [
+            models.UniqueConstraint(fields=['column', 'assignee'], condition=models.Q(assignee__isnull=False),
+                                    name='core_cardcount_column_assignee_uniq'),
+            models.UniqueConstraint(fields=['column'], condition=models.Q(assignee__isnull=True),
+                                    name='core_cardcount_column_unassigned_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['board', 'column'], name='core_cardcount_board_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.column_id}/{self.assignee_id}: {self.cards}"
+
 # from django.contrib.auth.models import AbstractUser
 # from django.db import models
 # from django.contrib.auth.models import User
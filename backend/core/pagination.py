@@ -0,0 +1,25 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key: each page is
+    WHERE id > <cursor> ORDER BY id LIMIT n, served straight off the pk index,
+    so deep pages cost the same as the first one.
+    """
+
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class SearchPagination(PageNumberPagination):
+    """
+    Search results are ordered by relevance rather than id, so they cannot be
+    keyset-paginated; pages are numbered and kept small.
+    """
+
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
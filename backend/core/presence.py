@@ -0,0 +1,322 @@
+import asyncio
+import logging
+import threading
+import time
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils.module_loading import import_string
+from .fanout import encode_broadcast
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BOARD_PRESENCE = {
+    'BACKEND': 'core.presence.LocalPresence',
+    'OPTIONS': {},
+    'ttl': 60,
+    'broadcast_interval_ms': 1000,
+}
+
+UNCHANGED = object()
+
+
+def group_viewers(entries):
+    """
+    Fold per-connection entries [(user_id, username, card_id)] into one viewer
+    per user: {user_id, username, card_ids, connections}, ordered by user id
+    """
+    viewers = {}
+    for user_id, username, card_id in entries:
+        viewer = viewers.get(user_id)
+        if viewer is None:
+            viewer = viewers[user_id] = {'user_id': user_id, 'username': username, 'card_ids': [], 'connections': 0}
+        viewer['connections'] += 1
+        if card_id is not None and card_id not in viewer['card_ids']:
+            viewer['card_ids'].append(card_id)
+    return [viewers[user_id] for user_id in sorted(viewers)]
+
+
+class BasePresence:
+    """
+    Who has each board open: one small entry per socket (user, focused card,
+    expiry), refreshed by heartbeats. Entries whose heartbeat lapses are dropped
+    the next time the board is touched or read, so a worker that died without
+    running disconnect() cannot leave ghosts behind.
+
+    join/touch/leave return whether the board's viewer list may have changed.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+
+    def join(self, board_id, connection, user_id, username, card_id=None):
+        raise NotImplementedError
+
+    def touch(self, board_id, connection, card_id=UNCHANGED):
+        """Heartbeat; also moves the connection's focus when `card_id` is given"""
+        raise NotImplementedError
+
+    def leave(self, board_id, connection):
+        raise NotImplementedError
+
+    def viewers(self, board_id):
+        raise NotImplementedError
+
+    async def ajoin(self, board_id, connection, user_id, username, card_id=None):
+        return self.join(board_id, connection, user_id, username, card_id)
+
+    async def atouch(self, board_id, connection, card_id=UNCHANGED):
+        return self.touch(board_id, connection, card_id)
+
+    async def aleave(self, board_id, connection):
+        return self.leave(board_id, connection)
+
+    async def aviewers(self, board_id):
+        return self.viewers(board_id)
+
+
+class LocalPresence(BasePresence):
+    """In-process presence: {board_id: {connection: [user_id, username, card_id, expires_at]}}"""
+
+    def __init__(self, ttl=60):
+        super().__init__(ttl)
+        self._boards = {}
+        self._lock = threading.Lock()
+
+    def _expire(self, board_id, now):
+        board = self._boards.get(board_id)
+        if not board:
+            return False
+        stale = [connection for connection, entry in board.items() if entry[3] <= now]
+        for connection in stale:
+            del board[connection]
+        if not board:
+            del self._boards[board_id]
+        return bool(stale)
+
+    def join(self, board_id, connection, user_id, username, card_id=None):
+        board_id = str(board_id)
+        with self._lock:
+            self._boards.setdefault(board_id, {})[connection] = [user_id, username, card_id, time.time() + self.ttl]
+        return True
+
+    def touch(self, board_id, connection, card_id=UNCHANGED):
+        board_id = str(board_id)
+        now = time.time()
+        with self._lock:
+            changed = self._expire(board_id, now)
+            entry = self._boards.get(board_id, {}).get(connection)
+            if entry is None:
+                # Expired (or never joined on this worker); the caller rejoins
+                return None
+            entry[3] = now + self.ttl
+            if card_id is not UNCHANGED and card_id != entry[2]:
+                entry[2] = card_id
+                changed = True
+            return changed
+
+    def leave(self, board_id, connection):
+        board_id = str(board_id)
+        with self._lock:
+            board = self._boards.get(board_id)
+            if board is None or board.pop(connection, None) is None:
+                return False
+            if not board:
+                del self._boards[board_id]
+            return True
+
+    def viewers(self, board_id):
+        board_id = str(board_id)
+        with self._lock:
+            self._expire(board_id, time.time())
+            entries = [tuple(entry[:3]) for entry in self._boards.get(board_id, {}).values()]
+        return group_viewers(entries)
+
+
+class RedisPresence(BasePresence):
+    """
+    Presence shared by all workers. Per board: a hash of connection ->
+    "user_id|card_id|username" and a sorted set of connection -> expiry time.
+    Both keys expire on their own once a board has gone quiet for a ttl.
+    """
+
+    def __init__(self, url='redis://localhost:6379/1', ttl=60, key_prefix='devboard:presence'):
+        import redis
+
+        super().__init__(ttl)
+        self.client = redis.Redis.from_url(url)
+        self.key_prefix = key_prefix
+
+    def _keys(self, board_id):
+        return f"{self.key_prefix}:{board_id}", f"{self.key_prefix}:{board_id}:expiry"
+
+    def _pack(self, user_id, username, card_id):
+        return f"{user_id}|{'' if card_id is None else card_id}|{username}"
+
+    def _unpack(self, value):
+        user_id, card_id, username = value.decode().split('|', 2)
+        return int(user_id), username, int(card_id) if card_id else None
+
+    def _expire(self, board_id, now):
+        entries, expiry = self._keys(board_id)
+        stale = self.client.zrangebyscore(expiry, '-inf', now)
+        if stale:
+            pipe = self.client.pipeline()
+            pipe.hdel(entries, *stale)
+            pipe.zrem(expiry, *stale)
+            pipe.execute()
+        return bool(stale)
+
+    def join(self, board_id, connection, user_id, username, card_id=None):
+        entries, expiry = self._keys(board_id)
+        pipe = self.client.pipeline()
+        pipe.hset(entries, connection, self._pack(user_id, username, card_id))
+        pipe.zadd(expiry, {connection: time.time() + self.ttl})
+        pipe.expire(entries, self.ttl * 2)
+        pipe.expire(expiry, self.ttl * 2)
+        pipe.execute()
+        return True
+
+    def touch(self, board_id, connection, card_id=UNCHANGED):
+        entries, expiry = self._keys(board_id)
+        now = time.time()
+        changed = self._expire(board_id, now)
+        current = self.client.hget(entries, connection)
+        if current is None:
+            return None
+        pipe = self.client.pipeline()
+        pipe.zadd(expiry, {connection: now + self.ttl})
+        pipe.expire(entries, self.ttl * 2)
+        pipe.expire(expiry, self.ttl * 2)
+        user_id, username, focused = self._unpack(current)
+        if card_id is not UNCHANGED and card_id != focused:
+            pipe.hset(entries, connection, self._pack(user_id, username, card_id))
+            changed = True
+        pipe.execute()
+        return changed
+
+    def leave(self, board_id, connection):
+        entries, expiry = self._keys(board_id)
+        pipe = self.client.pipeline()
+        pipe.hdel(entries, connection)
+        pipe.zrem(expiry, connection)
+        removed, _ = pipe.execute()
+        return bool(removed)
+
+    def viewers(self, board_id):
+        self._expire(board_id, time.time())
+        entries, _ = self._keys(board_id)
+        return group_viewers(self._unpack(value) for value in self.client.hvals(entries))
+
+    async def ajoin(self, board_id, connection, user_id, username, card_id=None):
+        return await sync_to_async(self.join)(board_id, connection, user_id, username, card_id)
+
+    async def atouch(self, board_id, connection, card_id=UNCHANGED):
+        return await sync_to_async(self.touch)(board_id, connection, card_id)
+
+    async def aleave(self, board_id, connection):
+        return await sync_to_async(self.leave)(board_id, connection)
+
+    async def aviewers(self, board_id):
+        return await sync_to_async(self.viewers)(board_id)
+
+
+class PresenceBroadcaster:
+    """
+    Turns presence changes into at most one `presence.diff` group broadcast per
+    board per interval. A change opens the window; when it closes, the board's
+    viewer list is read once and compared with the last list this process
+    sent. The diff carries the full state of each changed viewer plus the ids
+    of users who left, so applying it twice (e.g. from two workers) is harmless.
+    """
+
+    def __init__(self, presence, interval_ms=1000):
+        self.presence = presence
+        self.interval = interval_ms / 1000
+        self._sent = {}
+        self._timers = {}
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def changed(self, board_id):
+        board_id = str(board_id)
+        if not self.enabled or board_id in self._timers:
+            return
+        self._timers[board_id] = asyncio.get_running_loop().create_task(self._flush_after_window(board_id))
+
+    async def _flush_after_window(self, board_id):
+        await asyncio.sleep(self.interval)
+        self._timers.pop(board_id, None)
+        try:
+            await self.flush(board_id)
+        except Exception as e:
+            logger.error(f"Presence broadcast for board {board_id} failed: {str(e)}")
+
+    def diff(self, board_id, viewers):
+        """Changed viewers and departed user ids since the last broadcast, updating what was sent"""
+        before = self._sent.get(board_id, {})
+        after = {viewer['user_id']: viewer for viewer in viewers}
+        changed = [viewer for user_id, viewer in after.items() if before.get(user_id) != viewer]
+        left = sorted(user_id for user_id in before if user_id not in after)
+        if after:
+            self._sent[board_id] = after
+        else:
+            self._sent.pop(board_id, None)
+        return changed, left
+
+    async def flush(self, board_id):
+        board_id = str(board_id)
+        changed, left = self.diff(board_id, await self.presence.aviewers(board_id))
+        if not changed and not left:
+            return
+        group = f"board_{board_id}"
+        event = {"type": "presence.diff", "payload": {"board_id": board_id, "viewers": changed, "left": left}}
+        # Presence is not replayed on resync, so it skips the event log and carries no seq
+        await get_channel_layer().group_send(group, {
+            "type": "broadcast_message",
+            "text": encode_broadcast(group, event),
+            "seq": None,
+            "key": None,
+        })
+
+
+_presence = None
+_broadcaster = None
+_presence_lock = threading.Lock()
+
+
+def presence_config():
+    return {**DEFAULT_BOARD_PRESENCE, **getattr(settings, 'BOARD_PRESENCE', {})}
+
+
+def get_presence():
+    """Return the process-wide presence store configured by BOARD_PRESENCE"""
+    global _presence
+    if _presence is None:
+        with _presence_lock:
+            if _presence is None:
+                config = presence_config()
+                backend = import_string(config['BACKEND'])
+                _presence = backend(ttl=config['ttl'], **config['OPTIONS'])
+    return _presence
+
+
+def get_presence_broadcaster():
+    """Return the process-wide presence diff broadcaster"""
+    global _broadcaster
+    if _broadcaster is None:
+        presence = get_presence()
+        with _presence_lock:
+            if _broadcaster is None:
+                _broadcaster = PresenceBroadcaster(presence, presence_config()['broadcast_interval_ms'])
+    return _broadcaster
+
+
+def reset_presence():
+    """Drop the presence store and broadcaster (used by tests and settings changes)"""
+    global _presence, _broadcaster
+    with _presence_lock:
+        _presence = None
+        _broadcaster = None
@@ -0,0 +1,150 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.db import close_old_connections, transaction
+from .fanout import publish_board_event
+from .models import Card, Column
+from .snapshot_cache import get_snapshot_cache
+
+logger = logging.getLogger(__name__)
+
+# Rank keys are base-36 fractions written without the leading "0.", so plain
+# string comparison orders them. Keys never end in "0", which guarantees there
+# is always room for another key between any two distinct keys.
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(ALPHABET)
+DIGIT = {char: index for index, char in enumerate(ALPHABET)}
+
+# Keys longer than this trigger a background rebalance of their column/board
+MAX_RANK_LENGTH = 24
+RANK_FIELD_LENGTH = 64
+
+
+def rank_between(before=None, after=None):
+    """Return a key strictly between `before` and `after` (None means open-ended)"""
+    before = before or ''
+    if after is not None and before >= after:
+        raise ValueError(f"Cannot rank between {before!r} and {after!r}")
+    result = []
+    i = 0
+    while True:
+        lo = DIGIT[before[i]] if i < len(before) else 0
+        hi = DIGIT[after[i]] if after is not None and i < len(after) else BASE
+        if hi - lo > 1:
+            result.append(ALPHABET[(lo + hi) // 2])
+            return ''.join(result)
+        result.append(ALPHABET[lo])
+        if hi - lo == 1:
+            # The prefix is now below `after`, so only `before` still constrains us
+            after = None
+        i += 1
+
+
+def spread_ranks(count):
+    """Evenly spaced keys for `count` items, as short as possible"""
+    width = 1
+    while BASE ** width <= count:
+        width += 1
+    step = BASE ** width // (count + 1)
+    ranks = []
+    for n in range(1, count + 1):
+        value = n * step
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            digits.append(ALPHABET[digit])
+        ranks.append(''.join(reversed(digits)).rstrip('0'))
+    return ranks
+
+
+def rank_at(siblings, position, respace):
+    """
+    Rank for inserting at index `position` among `siblings` (a queryset of the
+    other rows in the same column/board). Fetches at most the two neighbours;
+    `respace()` rebalances the whole column/board when there is no room.
+    """
+    ordered = siblings.order_by('rank', 'id').values_list('rank', flat=True)
+    if position is None:
+        last = ordered.reverse().first()
+        return rank_between(last, None)
+    position = max(position, 0)
+    if position == 0:
+        neighbours = [None] + list(ordered[:1])
+    else:
+        neighbours = list(ordered[position - 1:position + 1])
+    if not neighbours:
+        # Past the end of the list
+        return rank_at(siblings, None, respace)
+    before = neighbours[0]
+    after = neighbours[1] if len(neighbours) > 1 else None
+    if after is not None and before is not None and before >= after:
+        # Two rows share a key (e.g. concurrent inserts); respace and retry
+        respace()
+        return rank_at(siblings, position, respace)
+    rank = rank_between(before, after)
+    if len(rank) > RANK_FIELD_LENGTH:
+        respace()
+        return rank_at(siblings, position, respace)
+    return rank
+
+
+def rebalance(queryset, board_id, event_type, scope):
+    """
+    Rewrite the ranks of every row in `queryset` as short evenly spaced keys.
+    bulk_update skips the usual write path, so once the new keys commit the
+    board's snapshot is dropped and clients get the keys as an `event_type`
+    event (with `scope` in its payload) to re-sort by.
+    """
+    with transaction.atomic():
+        rows = list(queryset.select_for_update().order_by('rank', 'id').only('id', 'rank'))
+        for row, rank in zip(rows, spread_ranks(len(rows))):
+            row.rank = rank
+        queryset.model.objects.bulk_update(rows, ['rank'])
+        event = {"type": event_type, "payload": {**scope, "ranks": {str(row.id): row.rank for row in rows}}}
+        transaction.on_commit(lambda: publish_rebalance(board_id, event), robust=True)
+    return len(rows)
+
+
+def publish_rebalance(board_id, event):
+    get_snapshot_cache().invalidate(board_id)
+    publish_board_event(board_id, event)
+
+
+def card_rank(column_id, position=None, exclude_id=None):
+    """Rank for a card placed at `position` in a column (None appends)"""
+    siblings = Card.objects.filter(column_id=column_id).exclude(id=exclude_id)
+    return rank_at(siblings, position, lambda: rebalance_cards(column_id))
+
+
+def column_rank(board_id, position=None, exclude_id=None):
+    """Rank for a column placed at `position` on a board (None appends)"""
+    siblings = Column.objects.filter(board_id=board_id).exclude(id=exclude_id)
+    return rank_at(siblings, position, lambda: rebalance_columns(board_id))
+
+
+def rebalance_cards(column_id):
+    board_id = Column.objects.values_list('board_id', flat=True).get(id=column_id)
+    return rebalance(Card.objects.filter(column_id=column_id), board_id, "cards.reranked", {"column_id": column_id})
+
+
+def rebalance_columns(board_id):
+    return rebalance(Column.objects.filter(board_id=board_id), board_id, "columns.reranked", {"board_id": board_id})
+
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rank-rebalance')
+
+
+def _run_rebalance(func, scope_id):
+    close_old_connections()
+    try:
+        count = func(scope_id)
+        logger.info(f"Rebalanced {count} ranks via {func.__name__}({scope_id})")
+    except Exception as e:
+        logger.error(f"Rank rebalance {func.__name__}({scope_id}) failed: {str(e)}")
+    finally:
+        close_old_connections()
+
+
+def schedule_rebalance(rank, func, scope_id):
+    """Queue a background rebalance once `rank` has grown too long"""
+    if len(rank) > MAX_RANK_LENGTH:
+        transaction.on_commit(lambda: _executor.submit(_run_rebalance, func, scope_id))
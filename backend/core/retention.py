@@ -0,0 +1,176 @@
+import datetime
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+DEFAULT_HISTORY_RETENTION = {
+    'collapse_after_hours': 1,
+    'keep_all_days': 30,
+    'delete_after_days': None,
+    'models': {},
+}
+
+# Fields a drag-and-drop changes. A history row that differs from the rows on
+# either side of it only in these (and version) is an intermediate position.
+POSITION_FIELDS = {
+    'card': ('column_id', 'rank'),
+    'column': ('rank',),
+}
+IGNORED_FIELDS = ('version',)
+
+DELETE_CHUNK = 1000
+ITERATOR_CHUNK = 2000
+
+
+def retention_policy(model_name):
+    """HISTORY_RETENTION merged over the defaults, with the per-model overrides applied"""
+    config = {**DEFAULT_HISTORY_RETENTION, **getattr(settings, 'HISTORY_RETENTION', {})}
+    overrides = config.pop('models')
+    return {**config, **overrides.get(model_name, {})}
+
+
+def history_models():
+    """(tracked model, historical model) pairs for every history-tracked core model"""
+    return [
+        (model, model.history.model)
+        for model in apps.get_app_config('core').get_models()
+        if getattr(model._meta, 'simple_history_manager_attribute', None)
+    ]
+
+
+def month_windows(start, end):
+    """[window_start, window_end) calendar-month windows covering start..end"""
+    window_start = start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while window_start < end:
+        if window_start.month == 12:
+            window_end = window_start.replace(year=window_start.year + 1, month=1)
+        else:
+            window_end = window_start.replace(month=window_start.month + 1)
+        yield window_start, min(window_end, end)
+        window_start = window_end
+
+
+def table_bytes(model):
+    """On-disk size of the model's table and indexes, or None where the database cannot tell"""
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT pg_total_relation_size(%s)", [table])
+            elif connection.vendor == 'sqlite':
+                cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = %s", [table])
+            else:
+                return None
+            return cursor.fetchone()[0] or 0
+    except DatabaseError:
+        # SQLite builds without the dbstat virtual table
+        return None
+
+
+def collapse_candidates(rows, compared):
+    """
+    History ids of intermediate positions: '~' rows whose only differences
+    from both the previous and the next row of the same object are position
+    fields. A run of moves keeps its first and last row.
+    """
+    candidates = []
+    previous = current = None
+    for row in rows.order_by('id', 'history_date', 'history_id').values('history_id', 'id', 'history_type', *compared).iterator(ITERATOR_CHUNK):
+        if current is not None and current['id'] != row['id']:
+            previous = current = None
+        if (previous is not None and current['history_type'] == '~' and row['history_type'] == '~'
+                and all(previous[field] == current[field] == row[field] for field in compared)):
+            candidates.append(current['history_id'])
+        previous, current = current, row
+    return candidates
+
+
+def downsample_candidates(rows):
+    """History ids of every '~' row that is not the last row of its object's day"""
+    candidates = []
+    day = None
+    for row in rows.order_by('id', 'history_date', 'history_id').values('history_id', 'id', 'history_date', 'history_type').iterator(ITERATOR_CHUNK):
+        key = (row['id'], row['history_date'].date())
+        if day is not None and day[0] == key and day[1]['history_type'] == '~':
+            candidates.append(day[1]['history_id'])
+        day = (key, row)
+    return candidates
+
+
+def _delete(history, history_ids):
+    with transaction.atomic():
+        for start in range(0, len(history_ids), DELETE_CHUNK):
+            history.objects.filter(history_id__in=history_ids[start:start + DELETE_CHUNK]).delete()
+
+
+def compact_model(model, history, now=None, dry_run=False):
+    """
+    Apply the retention policy to one historical table, a calendar month at a
+    time so each pass reads and deletes a bounded slice of the history_date
+    index. Returns a report of the rows removed by each stage.
+    """
+    now = now or timezone.now()
+    name = model._meta.model_name
+    policy = retention_policy(name)
+    collapse_before = now - datetime.timedelta(hours=policy['collapse_after_hours'])
+    keep_all_after = now - datetime.timedelta(days=policy['keep_all_days'])
+    delete_before = None
+    if policy['delete_after_days'] is not None:
+        delete_before = now - datetime.timedelta(days=policy['delete_after_days'])
+
+    positions = POSITION_FIELDS.get(name, ())
+    compared = [
+        field.attname for field in history.tracked_fields
+        if field.attname not in positions and field.attname not in IGNORED_FIELDS
+    ]
+    report = {
+        'table': history._meta.db_table,
+        'rows_before': history.objects.count(),
+        'bytes_before': table_bytes(history),
+        'expired': 0,
+        'collapsed': 0,
+        'downsampled': 0,
+    }
+    oldest = history.objects.order_by('history_date').values_list('history_date', flat=True).first()
+    windows = month_windows(oldest, collapse_before) if oldest is not None else []
+
+    for window_start, window_end in windows:
+        window = history.objects.filter(history_date__gte=window_start, history_date__lt=window_end)
+        if delete_before is not None and window_start < delete_before:
+            expired = window.filter(history_date__lt=delete_before)
+            report['expired'] += expired.count()
+            if not dry_run:
+                expired.delete()
+            window = window.filter(history_date__gte=delete_before)
+
+        collapsed = collapse_candidates(window, compared) if positions else []
+        downsampled = []
+        if window_start < keep_all_after:
+            skip = set(collapsed)
+            downsampled = [
+                history_id for history_id in downsample_candidates(window.filter(history_date__lt=keep_all_after))
+                if history_id not in skip
+            ]
+        report['collapsed'] += len(collapsed)
+        report['downsampled'] += len(downsampled)
+        if not dry_run:
+            _delete(history, collapsed + downsampled)
+
+    removed = report['expired'] + report['collapsed'] + report['downsampled']
+    report['rows_after'] = report['rows_before'] - removed
+    # Rows removed x average row size
+    report['reclaimed_bytes'] = None
+    if report['bytes_before'] is not None:
+        report['reclaimed_bytes'] = report['bytes_before'] * removed // report['rows_before'] if removed else 0
+    return report
+
+
+def vacuum(models):
+    """Return freed pages to the database (SQLite) or mark them reusable (Postgres)"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for model in models:
+                cursor.execute(f"VACUUM (ANALYZE) {connection.ops.quote_name(model._meta.db_table)}")
+        elif connection.vendor == 'sqlite':
+            cursor.execute("VACUUM")
@@ -0,0 +1,183 @@
+from django.db import DatabaseError, connection
+from django.db.models import Subquery
+from django.db.models.signals import post_delete
+from .concurrency import ConflictError
+from .history import record_history
+
+# Single-statement writes for the WebSocket mutation paths. Each returns the
+# written row (INSERT/UPDATE/DELETE ... RETURNING, supported by PostgreSQL and
+# SQLite 3.35+), so a mutation needs no read before or after the write. Rows
+# the write depends on (a card's column, its assignee) are checked with EXISTS
+# guards in the same statement; only a failed write pays for a follow-up read
+# to explain what went wrong. Other conditions supply their own `sql`/`params`
+# (sql None when a trigger enforces them, as for core.wip.WipGuard), a `check()`
+# that raises when they filtered the row out and an `explain(error)` that raises
+# when a database error was theirs.
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _table(model):
+    return _quote(model._meta.db_table)
+
+
+def _returning(model):
+    return ", ".join(_quote(field.column) for field in model._meta.concrete_fields)
+
+
+def _guards(requires):
+    """EXISTS clauses for each (model, pk) that must exist for the write to apply"""
+    sql = []
+    params = []
+    for model, pk in requires:
+        sql.append(f"EXISTS (SELECT 1 FROM {_table(model)} WHERE {_quote(model._meta.pk.column)} = %s)")
+        params.append(_pk(model, pk))
+    return sql, params
+
+
+def _execute(model, sql, params):
+    """Run a RETURNING statement and build the model instance from its row, or None"""
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    fields = model._meta.concrete_fields
+    values = []
+    for field, value in zip(fields, row):
+        col = field.get_col(model._meta.db_table)
+        for converter in connection.ops.get_db_converters(col) + field.get_db_converters(connection):
+            value = converter(value, col, connection)
+        values.append(value)
+    return model.from_db(connection.alias, [field.attname for field in fields], values)
+
+
+def _prep(model, attname, value):
+    return model._meta.get_field(attname).get_db_prep_save(value, connection)
+
+
+def _pk(model, pk):
+    """Validate an id the way a queryset filter would (a non-numeric id raises ValueError)"""
+    return _prep(model, model._meta.pk.attname, pk)
+
+
+def _check_requires(requires):
+    for model, pk in requires:
+        if not model.objects.filter(pk=pk).exists():
+            raise model.DoesNotExist(f"{model.__name__} with id {pk} does not exist")
+
+
+def parent_id(model, pk, field):
+    """
+    Subquery for a row's `field` (e.g. a card's column_id), so a sibling lookup
+    such as a rank can be scoped to it without reading the row first
+    """
+    return Subquery(model.objects.filter(pk=pk).values(field)[:1])
+
+
+def _conditions(conditions):
+    conditions = [condition for condition in conditions if condition.sql is not None]
+    return [condition.sql for condition in conditions], [param for condition in conditions for param in condition.params]
+
+
+def _execute_guarded(model, sql, params, conditions):
+    try:
+        return _execute(model, sql, params)
+    except DatabaseError as e:
+        for condition in conditions:
+            condition.explain(e)
+        raise
+
+
+def insert_returning(model, values, requires=(), user=None, conditions=()):
+    """
+    INSERT ... SELECT ... WHERE EXISTS (...) RETURNING: creates the row only if
+    every row in `requires` exists and every condition holds. Fields missing from
+    `values` ({attname: value}) take their defaults. Raises DoesNotExist naming
+    the missing row, or the failed condition's error.
+    """
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    params = [
+        _prep(model, field.attname, values[field.attname] if field.attname in values else field.get_default())
+        for field in fields
+    ]
+    guards, guard_params = _guards(requires)
+    extra, extra_params = _conditions(conditions)
+    guards, guard_params = guards + extra, guard_params + extra_params
+    sql = (
+        f"INSERT INTO {_table(model)} ({', '.join(_quote(field.column) for field in fields)}) "
+        f"SELECT {', '.join(['%s'] * len(fields))}"
+        f"{' WHERE ' + ' AND '.join(guards) if guards else ''} "
+        f"RETURNING {_returning(model)}"
+    )
+    instance = _execute_guarded(model, sql, params + guard_params, conditions)
+    if instance is None:
+        _check_requires(requires)
+        for condition in conditions:
+            condition.check()
+        raise model.DoesNotExist(f"Could not create {model.__name__}")
+    # Raw writes bypass post_save, so record the history row explicitly
+    record_history(model, [instance], '+', user)
+    return instance
+
+
+def update_returning(model, pk, changes, expected_version=None, requires=(), user=None, conditions=()):
+    """
+    Versioned UPDATE ... SET ..., version = version + 1 ... RETURNING of only the
+    columns in `changes` ({attname: value}). The version is checked when
+    `expected_version` is given; every row in `requires` must exist and every
+    condition hold. Raises DoesNotExist for a missing row, ConflictError for a
+    stale version and the condition's error for a failed condition.
+    """
+    if not changes:
+        instance = model.objects.filter(pk=pk).first()
+        if instance is None:
+            raise model.DoesNotExist(f"{model.__name__} with id {pk} does not exist")
+        return instance
+
+    assignments = [f"{_quote(model._meta.get_field(attname).column)} = %s" for attname in changes]
+    assignments.append(f"{_quote('version')} = {_quote('version')} + 1")
+    params = [_prep(model, attname, value) for attname, value in changes.items()]
+    where = [f"{_quote(model._meta.pk.column)} = %s"]
+    params.append(_pk(model, pk))
+    if expected_version is not None:
+        where.append(f"{_quote('version')} = %s")
+        params.append(expected_version)
+    guards, guard_params = _guards(requires)
+    extra, extra_params = _conditions(conditions)
+    guards, guard_params = guards + extra, guard_params + extra_params
+    sql = (
+        f"UPDATE {_table(model)} SET {', '.join(assignments)} "
+        f"WHERE {' AND '.join(where + guards)} "
+        f"RETURNING {_returning(model)}"
+    )
+    instance = _execute_guarded(model, sql, params + guard_params, conditions)
+    if instance is None:
+        current = model.objects.filter(pk=pk).first()
+        if current is None:
+            raise model.DoesNotExist(f"{model.__name__} with id {pk} does not exist")
+        _check_requires(requires)
+        if expected_version is None or current.version == expected_version:
+            for condition in conditions:
+                condition.check()
+        raise ConflictError(current, expected_version, current)
+    record_history(model, [instance], '~', user)
+    return instance
+
+
+def delete_returning(model, pk, user=None):
+    """
+    DELETE ... RETURNING: removes the row and returns it, or raises DoesNotExist.
+    Only for rows nothing else references, since CASCADE is emulated by Django
+    rather than the database.
+    """
+    sql = f"DELETE FROM {_table(model)} WHERE {_quote(model._meta.pk.column)} = %s RETURNING {_returning(model)}"
+    instance = _execute(model, sql, [_pk(model, pk)])
+    if instance is None:
+        raise model.DoesNotExist(f"{model.__name__} with id {pk} does not exist")
+    # Send post_delete as Model.delete() would, which records the history row
+    instance._history_user = user
+    post_delete.send(sender=model, instance=instance, using=connection.alias, origin=instance)
+    return instance
@@ -0,0 +1,131 @@
+import re
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+# Card search index, maintained by the database on every card write (including
+# raw SQL and queryset updates) so no application code has to keep it current.
+#
+# PostgreSQL: a stored generated tsvector column (title weighted above
+# description) with a GIN index.
+# SQLite: an external-content FTS5 table (an inverted index) kept in step by
+# triggers. It does not stem; the prefix matching below covers most of that.
+# Django rebuilds SQLite tables on some ALTERs, which drops the triggers, so
+# they are re-created after every migrate (see CoreConfig.ready).
+
+SEARCH_CONFIG = 'english'
+MAX_TERMS = 8
+
+POSTGRES_INDEX_SQL = [
+    f"""
+    ALTER TABLE core_card ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS core_card_search_vector_idx ON core_card USING GIN (search_vector)",
+]
+POSTGRES_DROP_SQL = [
+    "DROP INDEX IF EXISTS core_card_search_vector_idx",
+    "ALTER TABLE core_card DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_INDEX_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS core_card_search USING fts5(
+        title, description, content='core_card', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_card_search_insert AFTER INSERT ON core_card BEGIN
+        INSERT INTO core_card_search (rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_card_search_delete AFTER DELETE ON core_card BEGIN
+        INSERT INTO core_card_search (core_card_search, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_card_search_update AFTER UPDATE OF title, description ON core_card BEGIN
+        INSERT INTO core_card_search (core_card_search, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO core_card_search (rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+SQLITE_REBUILD_SQL = "INSERT INTO core_card_search (core_card_search) VALUES ('rebuild')"
+SQLITE_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS core_card_search_insert",
+    "DROP TRIGGER IF EXISTS core_card_search_delete",
+    "DROP TRIGGER IF EXISTS core_card_search_update",
+    "DROP TABLE IF EXISTS core_card_search",
+]
+
+
+def install_search_index(schema_editor, rebuild=True):
+    """Create the vendor's card search index; `rebuild` reindexes existing cards on SQLite"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for sql in POSTGRES_INDEX_SQL:
+            schema_editor.execute(sql)
+    elif vendor == 'sqlite':
+        for sql in SQLITE_INDEX_SQL:
+            schema_editor.execute(sql)
+        if rebuild:
+            schema_editor.execute(SQLITE_REBUILD_SQL)
+
+
+def drop_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for sql in POSTGRES_DROP_SQL:
+            schema_editor.execute(sql)
+    elif vendor == 'sqlite':
+        for sql in SQLITE_DROP_SQL:
+            schema_editor.execute(sql)
+
+
+def search_terms(query):
+    """Word tokens of a user query; operators and quotes are never passed through"""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def search_cards(queryset, query):
+    """
+    Cards in `queryset` matching every term of `query` (each as a prefix, so
+    partial words match while typing), annotated with `search_rank` and
+    ordered best match first
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f"{term}:*" for term in terms)
+        match = RawSQL(
+            f"core_card.search_vector @@ to_tsquery('{SEARCH_CONFIG}', %s)", [tsquery], output_field=BooleanField()
+        )
+        rank = RawSQL(
+            f"ts_rank_cd(core_card.search_vector, to_tsquery('{SEARCH_CONFIG}', %s))", [tsquery],
+            output_field=FloatField(),
+        )
+    elif connection.vendor == 'sqlite':
+        # The MATCH runs once for the id filter; bm25 (lower is better) is then read
+        # per matching card by rowid, with title matches weighted above description ones
+        fts_query = ' '.join(f'"{term}"*' for term in terms)
+        match = Q(id__in=RawSQL("SELECT rowid FROM core_card_search WHERE core_card_search MATCH %s", [fts_query]))
+        rank = RawSQL(
+            "SELECT -bm25(core_card_search, 4.0, 1.0) FROM core_card_search"
+            " WHERE core_card_search MATCH %s AND core_card_search.rowid = core_card.id",
+            [fts_query], output_field=FloatField(),
+        )
+    else:
+        # Unindexed scan for other backends
+        match = Q()
+        for term in terms:
+            match &= Q(title__icontains=term) | Q(description__icontains=term)
+        rank = Value(0.0, output_field=FloatField())
+    return queryset.filter(match).annotate(search_rank=rank).order_by('-search_rank', 'id')
@@ -1,6 +1,101 @@
+from functools import lru_cache
+from operator import itemgetter
 from rest_framework import serializers
 from .models import User, Team, TeamMembership, Project, Board, Column, Card
 from django.contrib.auth.password_validation import validate_password
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+
+def requested_fields(request, available):
+    """
+    Field names selected by ?fields=a,b or ?exclude=c,d on a read request,
+    or None when the full representation is wanted
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    fields = request.query_params.get('fields')
+    exclude = request.query_params.get('exclude')
+    if not fields and not exclude:
+        return None
+    available = list(available)
+    selected = [name for name in fields.split(',') if name] if fields else available
+    excluded = [name for name in exclude.split(',') if name] if exclude else []
+    unknown = set(selected + excluded) - set(available)
+    if unknown:
+        raise ValidationError({'fields': f"Unknown fields: {', '.join(sorted(unknown))}"})
+    selected = [name for name in selected if name not in excluded]
+    if not selected:
+        raise ValidationError({'fields': "At least one field must be selected."})
+    return selected
+
+
+class SparseFieldsetMixin:
+    """Drop serializer fields not selected with ?fields= / ?exclude="""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = requested_fields(self.context.get('request'), self.fields)
+        if selected is not None:
+            for name in set(self.fields) - set(selected):
+                self.fields.pop(name)
+
+# DRF fields whose to_representation is the identity for values read from the database
+PASSTHROUGH_FIELDS = (
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.BooleanField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+
+class ValuesSerializer:
+    """
+    Read-only fast path for a ModelSerializer: serializes values() rows
+    without hydrating model instances. Field getters and converters are
+    resolved once, and output matches the ModelSerializer's. Only concrete
+    model fields are supported, so many-to-many serializers are rejected.
+    """
+
+    def __init__(self, serializer_class, fields=None):
+        model = serializer_class.Meta.model
+        names, columns, converters = [], [], []
+        for name, field in serializer_class().fields.items():
+            if field.write_only or (fields is not None and name not in fields):
+                continue
+            model_field = model._meta.get_field(field.source)
+            if not model_field.concrete or model_field.many_to_many:
+                raise ValueError(f"{serializer_class.__name__}.{name} cannot be read from values()")
+            names.append(name)
+            columns.append(model_field.attname)
+            if not isinstance(field, PASSTHROUGH_FIELDS):
+                converters.append((name, field.to_representation))
+        self.names = tuple(names)
+        self.columns = tuple(columns)
+        self.converters = tuple(converters)
+        # Keyset pagination reads the pk from every row, even when ?fields= leaves it out
+        self.selected = self.columns if model._meta.pk.attname in columns else (*columns, model._meta.pk.attname)
+        self._getter = itemgetter(*columns) if len(columns) > 1 else (lambda row: (row[columns[0]],))
+
+    def values(self, queryset):
+        """The queryset narrowed to the columns this serializer reads"""
+        return queryset.values(*self.selected)
+
+    def serialize(self, rows):
+        names, getter = self.names, self._getter
+        data = [dict(zip(names, getter(row))) for row in rows]
+        for name, convert in self.converters:
+            for item in data:
+                if item[name] is not None:
+                    item[name] = convert(item[name])
+        return data
+
+
+@lru_cache(maxsize=64)
+def values_serializer(serializer_class, fields=None):
+    """Shared ValuesSerializer per (serializer class, selected fields)"""
+    return ValuesSerializer(serializer_class, fields)
+
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -21,35 +116,38 @@ class RegisterSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         return User.objects.create_user(**validated_data)
 
-class TeamSerializer(serializers.ModelSerializer):
+class TeamSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Team
         fields = '__all__'
 
-class TeamMembershipSerializer(serializers.ModelSerializer):
+class TeamMembershipSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = TeamMembership
         fields = '__all__'
 
-class ProjectSerializer(serializers.ModelSerializer):
+class ProjectSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Project
         fields = '__all__'
 
-class BoardSerializer(serializers.ModelSerializer):
+class BoardSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Board
         fields = '__all__'
+        read_only_fields = ['version']
 
-class ColumnSerializer(serializers.ModelSerializer):
+class ColumnSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Column
         fields = '__all__'
+        read_only_fields = ['rank', 'version']
 
-class CardSerializer(serializers.ModelSerializer):
+class CardSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Card
         fields = '__all__'
+        read_only_fields = ['rank', 'version']
 
 # from rest_framework import serializers
 # from .models import User, Team, TeamMembership, Project, Board, Column, Card
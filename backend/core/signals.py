@@ -0,0 +1,54 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .access import sync_board_access, sync_users_access
+from .auth_cache import get_auth_cache
+from .models import Board, Project, TeamMembership, User
+
+
+# A membership handed to another user must also be taken from the one it had
+@receiver(pre_save, sender=TeamMembership)
+def remember_membership_user(sender, instance, **kwargs):
+    instance._stored_user_id = None
+    if instance.pk is not None:
+        instance._stored_user_id = (
+            TeamMembership.objects.filter(pk=instance.pk).values_list('user_id', flat=True).first()
+        )
+
+
+# Membership changes alter which boards a user can open
+@receiver(post_save, sender=TeamMembership)
+@receiver(post_delete, sender=TeamMembership)
+def update_membership_access(sender, instance, **kwargs):
+    user_ids = {instance.user_id, getattr(instance, '_stored_user_id', None)} - {None}
+    sync_users_access(user_ids)
+    for user_id in user_ids:
+        get_auth_cache().invalidate_user(user_id)
+
+
+# A project moving to another team changes access to all of its boards
+@receiver(post_save, sender=Project)
+def update_project_access(sender, instance, created, **kwargs):
+    if created:
+        return
+    board_ids = list(Board.objects.filter(project=instance).values_list('id', flat=True))
+    sync_board_access(board_ids)
+    for board_id in board_ids:
+        get_auth_cache().invalidate_board(board_id)
+
+
+@receiver(post_save, sender=Board)
+def update_board_access(sender, instance, **kwargs):
+    sync_board_access([instance.pk])
+    get_auth_cache().invalidate_board(instance.pk)
+
+
+# Drop cached tokens so a deactivated or edited user is reloaded on next connect
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_auth(sender, instance, **kwargs):
+    get_auth_cache().invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=Board)
+def invalidate_board_access(sender, instance, **kwargs):
+    get_auth_cache().invalidate_board(instance.pk)
@@ -0,0 +1,74 @@
+from django.db.models import Prefetch
+from .codec import get_codec
+from .models import Card, Column
+from .snapshot_cache import get_snapshot_cache
+
+
+def card_queryset():
+    """Cards with their assignee joined in, in board display order"""
+    return (
+        Card.objects
+        .select_related('assignee')
+        .only('id', 'title', 'description', 'column_id', 'rank', 'version', 'assignee__username')
+        .order_by('rank', 'id')
+    )
+
+
+def column_queryset(board_id):
+    """Columns of a board with their cards prefetched in one extra query"""
+    return (
+        Column.objects
+        .filter(board_id=board_id)
+        .only('id', 'name', 'board_id', 'rank', 'wip_limit', 'version')
+        .order_by('rank', 'id')
+        .prefetch_related(Prefetch('card_set', queryset=card_queryset(), to_attr='ordered_cards'))
+    )
+
+
+def build_board_snapshot(board):
+    """Build the full-board dict (columns, cards, assignees) in a constant number of queries"""
+    return {
+        'id': board.id,
+        'name': board.name,
+        'version': board.version,
+        'columns': [
+            {
+                'id': col.id,
+                'name': col.name,
+                'position': col_position,
+                'rank': col.rank,
+                'wip_limit': col.wip_limit,
+                'version': col.version,
+                'cards': [
+                    {
+                        'id': card.id,
+                        'title': card.title,
+                        'description': card.description,
+                        'column_id': col.id,
+                        'position': position,
+                        'rank': card.rank,
+                        'version': card.version,
+                        'assignee': card.assignee_id,
+                        'assigned_to': card.assignee.username if card.assignee_id else None,
+                    }
+                    for position, card in enumerate(col.ordered_cards)
+                ]
+            }
+            for col_position, col in enumerate(column_queryset(board.id))
+        ]
+    }
+
+
+def encode_snapshot(snapshot):
+    """Serialize a snapshot straight to JSON bytes"""
+    return get_codec().dumps_bytes(snapshot)
+
+
+def board_snapshot_bytes(board):
+    """Load and encode a full-board snapshot"""
+    return encode_snapshot(build_board_snapshot(board))
+
+
+def cached_board_snapshot_bytes(board):
+    """Encoded snapshot served from the board snapshot cache when current"""
+    return get_snapshot_cache().get_or_build(board.id, lambda: board_snapshot_bytes(board))
@@ -0,0 +1,192 @@
+import threading
+from collections import OrderedDict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_SNAPSHOT_CACHE = {
+    'BACKEND': 'core.snapshot_cache.LocalSnapshotCache',
+    'OPTIONS': {},
+}
+
+# Event types whose broadcast means the board snapshot is stale
+SNAPSHOT_EVENT_PREFIXES = ('card.', 'column.', 'board.', 'batch')
+
+
+class BaseSnapshotCache:
+    """
+    Board snapshot cache keyed by (board id, board version).
+    Invalidating a board bumps its version, so snapshots built against an
+    older version can never be served again.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get_version(self, board_id):
+        raise NotImplementedError
+
+    def get(self, board_id, version):
+        raise NotImplementedError
+
+    def set(self, board_id, version, data):
+        raise NotImplementedError
+
+    def invalidate(self, board_id):
+        raise NotImplementedError
+
+    async def ainvalidate(self, board_id):
+        return self.invalidate(board_id)
+
+    def get_or_build(self, board_id, build):
+        """Return cached snapshot bytes for the board, building them on a miss"""
+        version = self.get_version(board_id)
+        data = self.get(board_id, version)
+        if data is not None:
+            self.hits += 1
+            return data
+        self.misses += 1
+        data = build()
+        self.set(board_id, version, data)
+        return data
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'evictions': self.evictions,
+        }
+
+
+class LocalSnapshotCache(BaseSnapshotCache):
+    """In-process LRU cache bounded by entry count and total bytes"""
+
+    def __init__(self, max_entries=512, max_bytes=64 * 1024 * 1024):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get_version(self, board_id):
+        return self._versions.get(str(board_id), 0)
+
+    def get(self, board_id, version):
+        key = (str(board_id), version)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def set(self, board_id, version, data):
+        board_id = str(board_id)
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            # The board changed while the snapshot was being built
+            if self._versions.get(board_id, 0) != version:
+                return
+            key = (board_id, version)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = data
+            self._size += len(data)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, board_id):
+        board_id = str(board_id)
+        with self._lock:
+            version = self._versions.get(board_id, 0)
+            self._versions[board_id] = version + 1
+            old = self._entries.pop((board_id, version), None)
+            if old is not None:
+                self._size -= len(old)
+            self.invalidations += 1
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({'entries': len(self._entries), 'bytes': self._size})
+        return stats
+
+
+class RedisSnapshotCache(BaseSnapshotCache):
+    """
+    Redis-backed cache shared by all workers. Versions live in an INCR counter
+    per board; snapshots expire after `timeout` seconds and are subject to the
+    server's maxmemory eviction policy.
+    """
+
+    def __init__(self, url='redis://localhost:6379/1', timeout=300, max_bytes=8 * 1024 * 1024,
+                 key_prefix='devboard:snapshot'):
+        super().__init__()
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.key_prefix = key_prefix
+
+    def _version_key(self, board_id):
+        return f"{self.key_prefix}:{board_id}:version"
+
+    def _data_key(self, board_id, version):
+        return f"{self.key_prefix}:{board_id}:{version}"
+
+    def get_version(self, board_id):
+        return int(self.client.get(self._version_key(board_id)) or 0)
+
+    def get(self, board_id, version):
+        return self.client.get(self._data_key(board_id, version))
+
+    def set(self, board_id, version, data):
+        if len(data) > self.max_bytes:
+            return
+        self.client.set(self._data_key(board_id, version), data, ex=self.timeout)
+
+    def invalidate(self, board_id):
+        version = self.client.incr(self._version_key(board_id))
+        self.client.delete(self._data_key(board_id, version - 1))
+        self.invalidations += 1
+
+    async def ainvalidate(self, board_id):
+        return await sync_to_async(self.invalidate)(board_id)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_snapshot_cache():
+    """Return the process-wide snapshot cache configured by BOARD_SNAPSHOT_CACHE"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = getattr(settings, 'BOARD_SNAPSHOT_CACHE', DEFAULT_SNAPSHOT_CACHE)
+                backend = import_string(config['BACKEND'])
+                _cache = backend(**config.get('OPTIONS', {}))
+    return _cache
+
+
+def reset_snapshot_cache():
+    """Drop the configured cache instance (used by tests and settings changes)"""
+    global _cache
+    _cache = None
+
+
+def invalidates_snapshot(event_type):
+    return event_type.startswith(SNAPSHOT_EVENT_PREFIXES)
@@ -0,0 +1,49 @@
+import json
+from asgiref.testing import ApplicationCommunicator
+from channels.routing import URLRouter
+from rest_framework_simplejwt.tokens import AccessToken
+from .middleware import JWTAuthMiddleware
+from .routing import websocket_urlpatterns
+
+# The websocket stack as mounted in backend.asgi, for in-process clients
+websocket_application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+
+class BoardSocket(ApplicationCommunicator):
+    """
+    Minimal in-process WebSocket client for BoardConsumer, used by the tests and
+    the socket load test (channels.testing needs daphne, which the backend does
+    not depend on)
+    """
+
+    def __init__(self, path, query_string):
+        super().__init__(websocket_application, {
+            'type': 'websocket',
+            'path': path,
+            'query_string': query_string.encode(),
+            'headers': [],
+            'subprotocols': [],
+        })
+
+    async def connect(self):
+        await self.send_input({'type': 'websocket.connect'})
+        return (await self.receive_output(1))['type'] == 'websocket.accept'
+
+    async def send_json_to(self, data):
+        await self.send_input({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def receive_json_from(self, timeout=1):
+        return json.loads((await self.receive_output(timeout))['text'])
+
+    async def disconnect(self):
+        await self.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await self.wait(1)
+
+
+async def connect_socket(user, board, query='', token=None):
+    """Open an authenticated BoardConsumer socket and return it with its welcome frame"""
+    token = token or str(AccessToken.for_user(user))
+    socket = BoardSocket(f"/ws/boards/{board.id}/", f"token={token}{query}")
+    assert await socket.connect()
+    welcome = await socket.receive_json_from()
+    return socket, welcome
@@ -1,3 +1,1831 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import decimal
+import io
+import json
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from unittest import mock, skipUnless
+from channels.db import database_sync_to_async
+from channels.layers import InMemoryChannelLayer
+from django.conf import settings
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, UntypedToken
+from simple_history.signals import post_create_historical_record
+from .models import User, Team, TeamMembership, Project, Board, Column, Card, BoardAccess, CardCount
+from .snapshot_cache import LocalSnapshotCache, get_snapshot_cache, reset_snapshot_cache
+from .event_log import LocalEventLog, get_event_log, reset_event_log
+from .fanout import get_broadcast_stats, reset_broadcast_stats
+from .coalesce import EventCoalescing, get_coalescing, merge_latest, reset_coalescing
+from .backpressure import OutboundQueue, outbound_queue_config
+from .dispatch import Field, PayloadError, compile_schema, ID_TYPES
+from .consumers import BoardConsumer, board_events
+from .concurrency import ConflictError, versioned_update
+from .returning import update_returning
+from .ranking import rank_between, spread_ranks, card_rank, rebalance_cards
+from .management.commands.bench_dispatch import SAMPLE_MESSAGES
+from .access import rebuild_board_access, sync_users_access
+from .aggregates import board_counts, repair_card_counts
+from .wip import WipLimitError, wip_limit_refusals
+from .presence import LocalPresence, PresenceBroadcaster, get_presence, reset_presence
+from .layers import HashRing, ShardedChannelLayer
+from .membership import sync_team_members
+from .db import board_db, get_db_executor
+from .history import HistoryPipeline, get_history_pipeline, reset_history_pipeline
+from .retention import compact_model
+from .codec import DecodeError, OrjsonCodec, StdlibCodec, get_codec, load_codec
+from .serializers import BoardSerializer, CardSerializer, ColumnSerializer, TeamSerializer, values_serializer
+from .auth_cache import AuthCache, get_auth_cache, reset_auth_cache
+from .middleware import get_user_from_token
+from .testing import BoardSocket, connect_socket
 
-# Create your tests here.
+
+# Socket and broadcast tests run on an in-process channel layer with presence diffs
+# off, so frame sequences are exact; presence tests turn diffs back on per test
+in_process_board = override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    BOARD_PRESENCE={**settings.BOARD_PRESENCE, 'broadcast_interval_ms': 0},
+)
+
+def make_board(owner, columns, cards_per_column, name='Board'):
+    """Create a board owned by `owner`'s team with the given shape"""
+    team = Team.objects.create(name=f"{name} team")
+    TeamMembership.objects.create(user=owner, team=team, role='admin')
+    project = Project.objects.create(name=f"{name} project", team=team)
+    board = Board.objects.create(name=name, project=project)
+    for c, column_rank in enumerate(spread_ranks(columns)):
+        column = Column.objects.create(name=f"Column {c}", board=board, rank=column_rank)
+        for i, rank in enumerate(spread_ranks(cards_per_column)):
+            Card.objects.create(title=f"Card {c}.{i}", column=column, assignee=owner, rank=rank)
+    return board
+
+
+class FullBoardSnapshotTests(TestCase):
+    def setUp(self):
+        reset_snapshot_cache()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def full_board_queries(self, board):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/boards/{board.id}/full_board/')
+        self.assertEqual(response.status_code, 200)
+        return response, len(ctx.captured_queries)
+
+    def test_snapshot_contents(self):
+        board = make_board(self.user, columns=2, cards_per_column=2)
+        response, _ = self.full_board_queries(board)
+        data = response.json()
+        self.assertEqual(data['id'], board.id)
+        self.assertEqual([len(col['cards']) for col in data['columns']], [2, 2])
+        card = data['columns'][0]['cards'][0]
+        self.assertEqual(card['title'], 'Card 0.0')
+        self.assertEqual(card['assigned_to'], 'alice')
+
+    def test_query_count_does_not_grow_with_board_size(self):
+        small = make_board(self.user, columns=1, cards_per_column=1, name='Small')
+        large = make_board(self.user, columns=30, cards_per_column=20, name='Large')
+        _, small_queries = self.full_board_queries(small)
+        _, large_queries = self.full_board_queries(large)
+        self.assertEqual(small_queries, large_queries)
+
+    def test_cached_snapshot_skips_board_queries(self):
+        board = make_board(self.user, columns=3, cards_per_column=3)
+        _, cold_queries = self.full_board_queries(board)
+        _, warm_queries = self.full_board_queries(board)
+        self.assertLess(warm_queries, cold_queries)
+        stats = get_snapshot_cache().stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_rest_write_invalidates_snapshot(self):
+        board = make_board(self.user, columns=1, cards_per_column=1)
+        self.full_board_queries(board)
+        column = board.column_set.get()
+        response = self.client.post('/api/cards/', {'title': 'New', 'column': column.id})
+        self.assertEqual(response.status_code, 201)
+        response, _ = self.full_board_queries(board)
+        self.assertEqual(len(response.json()['columns'][0]['cards']), 2)
+
+
+class LocalSnapshotCacheTests(TestCase):
+    def test_invalidate_bumps_version(self):
+        cache = LocalSnapshotCache()
+        cache.set(1, 0, b'old')
+        cache.invalidate(1)
+        self.assertEqual(cache.get_version(1), 1)
+        self.assertIsNone(cache.get(1, 1))
+        self.assertEqual(cache.get_or_build(1, lambda: b'new'), b'new')
+        self.assertEqual(cache.get_or_build(1, lambda: b'unused'), b'new')
+
+    def test_stale_build_is_not_stored(self):
+        cache = LocalSnapshotCache()
+        cache.invalidate(1)
+        cache.set(1, 0, b'stale')
+        self.assertIsNone(cache.get(1, 0))
+
+    def test_lru_eviction_by_entries_and_bytes(self):
+        cache = LocalSnapshotCache(max_entries=2, max_bytes=10)
+        cache.set(1, 0, b'aaaa')
+        cache.set(2, 0, b'bbbb')
+        cache.get(1, 0)
+        cache.set(3, 0, b'cccc')
+        self.assertIsNone(cache.get(2, 0))
+        self.assertEqual(cache.get(1, 0), b'aaaa')
+        cache.set(4, 0, b'dddddddd')
+        self.assertEqual(cache.stats()['entries'], 1)
+        self.assertLessEqual(cache.stats()['bytes'], 10)
+
+
+class LocalEventLogTests(TestCase):
+    def test_since_returns_missed_events(self):
+        log = LocalEventLog(max_events=3)
+        for i in range(3):
+            log.append(1, {'type': 'card.updated', 'payload': {'i': i}})
+        self.assertEqual([e['seq'] for e in log.since(1, 1)], [2, 3])
+        self.assertEqual(log.since(1, 3), [])
+
+    def test_since_reports_evicted_gap(self):
+        log = LocalEventLog(max_events=2)
+        for i in range(5):
+            log.append(1, {'type': 'card.updated', 'payload': {}})
+        self.assertIsNone(log.since(1, 1))
+        self.assertEqual([e['seq'] for e in log.since(1, 3)], [4, 5])
+        # A seq from before a restart is ahead of the log
+        self.assertIsNone(log.since(2, 7))
+        # A board with no events yet never has missed events to replay
+        self.assertEqual(log.since(3, 0), [])
+        self.assertIsNone(log.since(3, -1))
+
+
+@in_process_board
+class BoardConsumerResyncTests(TransactionTestCase):
+    def setUp(self):
+        reset_snapshot_cache()
+        reset_event_log()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.board = make_board(self.user, columns=1, cards_per_column=2)
+        self.cards = list(Card.objects.order_by('id'))
+
+    async def rename_card(self, socket, card, title):
+        await socket.send_json_to({'type': 'card.updated', 'payload': {'id': card.id, 'title': title}})
+        return await socket.receive_json_from()
+
+    async def test_broadcast_events_carry_seq(self):
+        socket, welcome = await connect_socket(self.user, self.board)
+        self.assertEqual(welcome['payload']['seq'], 0)
+        first = await self.rename_card(socket, self.cards[0], 'One')
+        second = await self.rename_card(socket, self.cards[1], 'Two')
+        self.assertEqual((first['seq'], second['seq']), (1, 2))
+        await socket.disconnect()
+
+    async def test_reconnect_replays_only_missed_events(self):
+        socket, _ = await connect_socket(self.user, self.board)
+        await self.rename_card(socket, self.cards[0], 'One')
+        await self.rename_card(socket, self.cards[1], 'Two')
+        await socket.disconnect()
+
+        socket, _ = await connect_socket(self.user, self.board, '&last_seq=1')
+        missed = await socket.receive_json_from()
+        self.assertEqual((missed['seq'], missed['payload']['title']), (2, 'Two'))
+        self.assertTrue(await socket.receive_nothing())
+        await socket.disconnect()
+
+    async def test_reconnect_after_eviction_gets_snapshot(self):
+        socket, _ = await connect_socket(self.user, self.board, '&last_seq=5')
+        snapshot = await socket.receive_json_from()
+        self.assertEqual(snapshot['type'], 'board.snapshot')
+        self.assertEqual(snapshot['seq'], 0)
+        self.assertEqual(len(snapshot['payload']['columns'][0]['cards']), 2)
+        await socket.disconnect()
+
+    async def test_negative_last_seq_is_ignored(self):
+        socket, _ = await connect_socket(self.user, self.board, '&last_seq=-1')
+        self.assertTrue(await socket.receive_nothing())
+        await socket.disconnect()
+
+
+class PayloadSchemaTests(TestCase):
+    def setUp(self):
+        self.validate = compile_schema({
+            'id': Field(ID_TYPES, required=True, aliases=('card_id',)),
+            'title': Field(str),
+            'assignee': Field(ID_TYPES, nullable=True),
+        })
+
+    def test_aliases_are_normalized_and_unknown_fields_dropped(self):
+        self.assertEqual(self.validate({'card_id': 5, 'extra': 1}), {'id': 5})
+
+    def test_missing_required_field(self):
+        with self.assertRaisesMessage(PayloadError, 'Missing required field: id'):
+            self.validate({'title': 'x'})
+
+    def test_type_and_null_checks(self):
+        with self.assertRaises(PayloadError):
+            self.validate({'id': 1, 'title': 3})
+        with self.assertRaises(PayloadError):
+            self.validate({'id': True})
+        with self.assertRaises(PayloadError):
+            self.validate({'id': None})
+        self.assertEqual(self.validate({'id': 1, 'assignee': None}), {'id': 1, 'assignee': None})
+
+    def test_all_consumer_event_types_registered(self):
+        self.assertEqual(set(board_events.event_types()), set(SAMPLE_MESSAGES))
+
+
+@in_process_board
+class BoardConsumerDispatchTests(TransactionTestCase):
+    def setUp(self):
+        reset_event_log()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.board = make_board(self.user, columns=1, cards_per_column=1)
+
+    async def test_invalid_payload_is_rejected_before_handler(self):
+        socket, _ = await connect_socket(self.user, self.board)
+        await socket.send_json_to({'type': 'card.updated', 'payload': {'title': 'No id'}})
+        error = await socket.receive_json_from()
+        self.assertEqual(error['type'], 'error')
+        self.assertIn('Missing required field: id', error['payload']['message'])
+        await socket.send_json_to({'type': 'card.exploded', 'payload': {'id': 1}})
+        error = await socket.receive_json_from()
+        self.assertIn('Unknown event type', error['payload']['message'])
+        await socket.disconnect()
+
+    async def test_card_moved_reranks_into_target_column(self):
+        column = await database_sync_to_async(Column.objects.create)(name='Done', board=self.board, rank='z')
+        await database_sync_to_async(Card.objects.create)(title='Existing', column=column, rank='i')
+        card = await database_sync_to_async(Card.objects.get)(title='Card 0.0')
+        socket, _ = await connect_socket(self.user, self.board)
+        await socket.send_json_to({'type': 'card.moved', 'payload': {
+            'id': card.id, 'new_column_id': column.id, 'new_position': 0,
+        }})
+        event = await socket.receive_json_from()
+        self.assertEqual(event['type'], 'card.moved')
+        self.assertLess(event['payload']['rank'], 'i')
+        await socket.disconnect()
+
+
+@in_process_board
+class BoardConsumerBatchTests(TransactionTestCase):
+    def setUp(self):
+        reset_event_log()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.board = make_board(self.user, columns=1, cards_per_column=2)
+        self.cards = list(Card.objects.order_by('id'))
+
+    async def send_batch(self, operations, atomic=False):
+        socket, _ = await connect_socket(self.user, self.board)
+        await socket.send_json_to({'type': 'batch', 'payload': {'operations': operations, 'atomic': atomic}})
+        frames = {}
+        for _ in range(2):
+            frame = await socket.receive_json_from()
+            frames[frame['type']] = frame
+        self.assertTrue(await socket.receive_nothing())
+        await socket.disconnect()
+        return frames
+
+    def rename(self, card_id, title):
+        return {'type': 'card.updated', 'payload': {'id': card_id, 'title': title}}
+
+    async def test_batch_reports_partial_failure_and_broadcasts_once(self):
+        frames = await self.send_batch([
+            self.rename(self.cards[0].id, 'One'),
+            self.rename(999999, 'Missing'),
+            self.rename(self.cards[1].id, 'Two'),
+            {'type': 'team.updated', 'payload': {'id': 1}},
+        ])
+        results = frames['batch.result']['payload']['results']
+        self.assertEqual([r['ok'] for r in results], [True, False, True, False])
+        self.assertEqual(frames['batch.result']['payload']['applied'], 2)
+        events = frames['batch']['payload']['events']
+        self.assertEqual([e['payload']['title'] for e in events], ['One', 'Two'])
+        self.assertEqual(frames['batch']['seq'], 1)
+        titles = await database_sync_to_async(lambda: list(Card.objects.order_by('id').values_list('title', flat=True)))()
+        self.assertEqual(titles, ['One', 'Two'])
+
+    async def test_atomic_batch_rolls_back_on_failure(self):
+        socket, _ = await connect_socket(self.user, self.board)
+        await socket.send_json_to({'type': 'batch', 'payload': {'atomic': True, 'operations': [
+            self.rename(self.cards[0].id, 'One'),
+            self.rename(999999, 'Missing'),
+        ]}})
+        result = await socket.receive_json_from()
+        self.assertEqual(result['type'], 'batch.result')
+        self.assertEqual([r['ok'] for r in result['payload']['results']], [False, False])
+        self.assertTrue(await socket.receive_nothing())
+        await socket.disconnect()
+        title = await database_sync_to_async(lambda: Card.objects.get(id=self.cards[0].id).title)()
+        self.assertEqual(title, 'Card 0.0')
+
+
+class RankKeyTests(TestCase):
+    def test_rank_between_stays_ordered_under_random_inserts(self):
+        rng = random.Random(6)
+        keys = []
+        for _ in range(2000):
+            position = rng.randint(0, len(keys))
+            before = keys[position - 1] if position else None
+            after = keys[position] if position < len(keys) else None
+            key = rank_between(before, after)
+            self.assertTrue(before is None or before < key)
+            self.assertTrue(after is None or key < after)
+            self.assertFalse(key.endswith('0'))
+            keys.insert(position, key)
+        self.assertEqual(keys, sorted(keys))
+
+    def test_repeated_inserts_at_the_front_grow_slowly(self):
+        key = None
+        first = rank_between(None, None)
+        for _ in range(100):
+            key = rank_between(None, first)
+            first = key
+        self.assertLess(len(key), 30)
+
+    def test_spread_ranks_are_sorted_and_unique(self):
+        ranks = spread_ranks(5000)
+        self.assertEqual(ranks, sorted(set(ranks)))
+        self.assertTrue(all(len(rank) <= 3 for rank in ranks))
+
+
+@in_process_board
+class CardOrderingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.board = make_board(self.user, columns=1, cards_per_column=4)
+        self.column = self.board.column_set.get()
+
+    def ordered_titles(self):
+        return list(Card.objects.filter(column=self.column).order_by('rank', 'id').values_list('title', flat=True))
+
+    def move(self, card, position):
+        card.rank = card_rank(self.column.id, position, exclude_id=card.id)
+        card.save(update_fields=['rank'])
+
+    def test_move_is_a_single_row_update(self):
+        card = Card.objects.get(title='Card 0.3')
+        with CaptureQueriesContext(connection) as ctx:
+            self.move(card, 1)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.ordered_titles(), ['Card 0.0', 'Card 0.3', 'Card 0.1', 'Card 0.2'])
+
+    def test_concurrent_moves_into_the_same_gap(self):
+        # Both clients read the same neighbours before either write lands
+        first, second = Card.objects.get(title='Card 0.2'), Card.objects.get(title='Card 0.3')
+        first.rank = card_rank(self.column.id, 1, exclude_id=first.id)
+        second.rank = card_rank(self.column.id, 1, exclude_id=first.id)
+        first.save(update_fields=['rank'])
+        second.save(update_fields=['rank'])
+        titles = self.ordered_titles()
+        self.assertEqual(titles[0], 'Card 0.0')
+        self.assertEqual(titles[3], 'Card 0.1')
+        self.assertEqual(set(titles[1:3]), {'Card 0.2', 'Card 0.3'})
+
+        # Inserting between the two tied cards respaces the column first
+        Card.objects.create(title='New', column=self.column, rank=card_rank(self.column.id, 2))
+        titles = self.ordered_titles()
+        self.assertEqual(titles.index('New'), 2)
+        ranks = list(Card.objects.filter(column=self.column).order_by('rank', 'id').values_list('rank', flat=True))
+        self.assertEqual(len(set(ranks)), len(ranks))
+
+    def test_rebalance_preserves_order_and_shortens_keys(self):
+        card = Card.objects.get(title='Card 0.3')
+        for _ in range(60):
+            self.move(card, 0)
+            self.move(Card.objects.get(title='Card 0.0'), 0)
+        before = self.ordered_titles()
+        rebalance_cards(self.column.id)
+        self.assertEqual(self.ordered_titles(), before)
+        self.assertTrue(all(len(rank) <= 1 for rank in Card.objects.values_list('rank', flat=True)))
+
+    def test_rebalance_drops_the_snapshot_and_tells_clients_once_committed(self):
+        reset_event_log()
+        reset_snapshot_cache()
+        with self.captureOnCommitCallbacks() as callbacks:
+            rebalance_cards(self.column.id)
+            self.assertEqual(get_event_log().current_seq(self.board.id), 0)
+        for callback in callbacks:
+            callback()
+        [event] = get_event_log().since(self.board.id, 0)
+        self.assertEqual(event['type'], 'cards.reranked')
+        self.assertEqual(event['payload']['column_id'], self.column.id)
+        self.assertEqual(
+            event['payload']['ranks'],
+            {str(card_id): rank for card_id, rank in Card.objects.values_list('id', 'rank')},
+        )
+        self.assertEqual(get_snapshot_cache().stats()['invalidations'], 1)
+
+
+@in_process_board
+class OptimisticConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        reset_event_log()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.board = make_board(self.user, columns=1, cards_per_column=1)
+        self.card = Card.objects.get()
+
+    def test_versioned_update_writes_only_changed_fields(self):
+        with CaptureQueriesContext(connection) as ctx:
+            versioned_update(self.card, {'title': 'Renamed'})
+        update = next(q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE'))
+        self.assertIn('"title"', update)
+        self.assertNotIn('"description"', update)
+        self.card.refresh_from_db()
+        self.assertEqual((self.card.title, self.card.version), ('Renamed', 2))
+        self.assertEqual(self.card.history.count(), 2)
+
+    def test_stale_version_raises_conflict(self):
+        stale = Card.objects.get()
+        versioned_update(self.card, {'title': 'First'})
+        with self.assertRaises(ConflictError) as ctx:
+            versioned_update(stale, {'title': 'Second'})
+        self.assertEqual(ctx.exception.as_payload()['current_version'], 2)
+        self.assertEqual(Card.objects.get().title, 'First')
+
+    async def test_stale_socket_update_gets_conflict_event(self):
+        socket, _ = await connect_socket(self.user, self.board)
+        await socket.send_json_to({'type': 'card.updated', 'payload': {
+            'id': self.card.id, 'version': 1, 'title': 'Fresh',
+        }})
+        event = await socket.receive_json_from()
+        self.assertEqual((event['type'], event['payload']['version']), ('card.updated', 2))
+        await socket.send_json_to({'type': 'card.updated', 'payload': {
+            'id': self.card.id, 'version': 1, 'title': 'Stale',
+        }})
+        conflict = await socket.receive_json_from()
+        self.assertEqual(conflict['type'], 'conflict')
+        self.assertEqual(conflict['payload']['current']['title'], 'Fresh')
+        self.assertTrue(await socket.receive_nothing())
+        await socket.disconnect()
+
+    def test_rest_update_with_stale_version_returns_409(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f'/api/cards/{self.card.id}/'
+        response = client.patch(url, {'title': 'Fresh', 'version': 1})
+        self.assertEqual((response.status_code, response.json()['version']), (200, 2))
+        response = client.patch(url, {'title': 'Stale', 'version': 1})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['current_version'], 2)
+        self.assertEqual(Card.objects.get().title, 'Fresh')
+
+    def test_failed_rest_save_does_not_bump_version(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch('core.serializers.CardSerializer.save', side_effect=OperationalError('disk I/O error')):
+            with self.assertRaises(OperationalError):
+                client.patch(f'/api/cards/{self.card.id}/', {'title': 'Lost', 'version': 1})
+        self.assertEqual(Card.objects.values_list('title', 'version').get(), (self.card.title, 1))
+
+
+class SingleStatementMutationTests(TestCase):
+    """Each consumer write is one statement plus its history row (and a rank lookup when re-ranking)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.board = make_board(self.user, columns=2, cards_per_column=1)
+        self.column, self.other_column = Column.objects.order_by('rank')
+        self.card = Card.objects.get(column=self.column)
+        self.consumer = BoardConsumer()
+        self.consumer.user = self.user
+        self.consumer.board_id = str(self.board.id)
+
+    def test_card_create_validates_column_and_assignee_in_the_insert(self):
+        with self.assertNumQueries(3):
+            card = self.consumer._create_card({
+                'column_id': self.column.id, 'title': 'New', 'assignee': self.user.id,
+            })
+        self.assertEqual((card.column_id, card.assignee_id, card.version), (self.column.id, self.user.id, 1))
+        self.assertGreater(card.rank, self.card.rank)
+        self.assertEqual(card.history.get().history_type, '+')
+        with self.assertRaisesMessage(Column.DoesNotExist, 'Column with id 999 does not exist'):
+            self.consumer._create_card({'column_id': 999, 'title': 'Orphan'})
+        with self.assertRaisesMessage(User.DoesNotExist, 'User with id 999 does not exist'):
+            self.consumer._create_card({'column_id': self.column.id, 'title': 'Orphan', 'assignee': 999})
+        self.assertFalse(Card.objects.filter(title='Orphan').exists())
+
+    def test_card_update_is_one_statement(self):
+        with self.assertNumQueries(2):
+            card = self.consumer._update_card({'id': self.card.id, 'version': 1, 'title': 'Renamed'})
+        self.assertEqual((card.title, card.description, card.version), ('Renamed', '', 2))
+        self.assertEqual(card.history.latest().history_user, self.user)
+
+    def test_card_update_to_missing_column_or_stale_version_fails(self):
+        with self.assertRaisesMessage(Column.DoesNotExist, 'Column with id 999 does not exist'):
+            self.consumer._update_card({'id': self.card.id, 'column_id': 999})
+        with self.assertRaises(ConflictError) as ctx:
+            self.consumer._update_card({'id': self.card.id, 'version': 5, 'title': 'Stale'})
+        self.assertEqual(ctx.exception.as_payload()['current_version'], 1)
+        with self.assertRaisesMessage(Card.DoesNotExist, 'Card with id 999 does not exist'):
+            self.consumer._update_card({'id': 999, 'title': 'Gone'})
+
+    def test_card_move_ranks_without_reading_the_card(self):
+        with self.assertNumQueries(3):
+            card = self.consumer._move_card({
+                'id': self.card.id, 'new_column_id': self.other_column.id, 'new_position': 0,
+            })
+        self.assertEqual((card.column_id, card.version), (self.other_column.id, 2))
+        self.assertLess(card.rank, Card.objects.exclude(id=card.id).get(column=self.other_column).rank)
+
+    def test_card_delete_returns_the_deleted_row(self):
+        with self.assertNumQueries(2):
+            info = self.consumer._delete_card(self.card.id)
+        self.assertEqual(info, {'id': self.card.id, 'title': 'Card 0.0', 'column_id': self.column.id})
+        self.assertFalse(Card.objects.filter(id=self.card.id).exists())
+        self.assertEqual(Card.history.filter(id=self.card.id).latest().history_type, '-')
+        with self.assertRaisesMessage(Card.DoesNotExist, f'Card with id {self.card.id} does not exist'):
+            self.consumer._delete_card(self.card.id)
+
+    def test_column_create_and_update(self):
+        with self.assertNumQueries(3):
+            column = self.consumer._create_column({'title': 'Done'})
+        self.assertEqual((column.board_id, column.name), (self.board.id, 'Done'))
+        with self.assertNumQueries(3):
+            column = self.consumer._update_column({'id': column.id, 'title': 'Shipped', 'position': 0})
+        self.assertEqual((column.name, column.version, column.position), ('Shipped', 2, 0))
+        self.assertLess(column.rank, self.column.rank)
+
+
+@in_process_board
+class AuthCacheTests(TransactionTestCase):
+    def setUp(self):
+        reset_auth_cache()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.board = make_board(self.user, columns=1, cards_per_column=1)
+
+    async def test_token_is_decoded_once(self):
+        token = str(AccessToken.for_user(self.user))
+        with mock.patch('core.middleware.UntypedToken', wraps=UntypedToken) as decode:
+            first = await get_user_from_token(token)
+            second = await get_user_from_token(token)
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual((first.id, second.id), (self.user.id, self.user.id))
+
+    async def test_invalid_token_is_not_cached(self):
+        user = await get_user_from_token('not-a-token')
+        self.assertFalse(user.is_authenticated)
+        self.assertEqual(get_auth_cache().stats()['tokens'], 0)
+
+    async def test_reconnect_reuses_cached_access_decision(self):
+        token = str(AccessToken.for_user(self.user))
+        for _ in range(2):
+            socket, welcome = await connect_socket(self.user, self.board, token=token)
+            self.assertEqual(welcome['type'], 'connection.established')
+            await socket.disconnect()
+        stats = get_auth_cache().stats()
+        self.assertEqual((stats['tokens'], stats['access']), (1, 1))
+        self.assertGreaterEqual(stats['hits'], 1)
+
+    def test_membership_change_invalidates_access(self):
+        cache = get_auth_cache()
+        cache.set_access(self.user.id, self.board.id, True)
+        self.assertTrue(cache.get_access(self.user.id, self.board.id))
+        TeamMembership.objects.filter(user=self.user).delete()
+        self.assertIsNone(cache.get_access(self.user.id, self.board.id))
+
+    def test_entries_expire_and_are_bounded(self):
+        cache = AuthCache(token_ttl=60, access_ttl=60, max_entries=2)
+        cache.set_user('expired', self.user, expires_at=time.time() - 1)
+        self.assertIsNone(cache.get_user('expired'))
+        for board_id in range(3):
+            cache.set_access(self.user.id, board_id, True)
+        self.assertIsNone(cache.get_access(self.user.id, 0))
+        self.assertTrue(cache.get_access(self.user.id, 2))
+
+
+@in_process_board
+class BoardAccessIndexTests(TransactionTestCase):
+    def setUp(self):
+        reset_auth_cache()
+        self.alice = User.objects.create_user(username='alice', password='pw')
+        self.bob = User.objects.create_user(username='bob', password='pw')
+        self.board = make_board(self.alice, columns=1, cards_per_column=1)
+        self.team = self.board.project.team
+
+    def accessible(self, user):
+        return set(BoardAccess.objects.filter(user=user).values_list('board_id', flat=True))
+
+    def test_index_follows_membership_project_and_board_changes(self):
+        self.assertEqual(self.accessible(self.alice), {self.board.id})
+        self.assertEqual(self.accessible(self.bob), set())
+
+        membership = TeamMembership.objects.create(user=self.bob, team=self.team, role='member')
+        second = Board.objects.create(name='Second', project=self.board.project)
+        self.assertEqual(self.accessible(self.bob), {self.board.id, second.id})
+
+        project = self.board.project
+        project.team = Team.objects.create(name='Other')
+        project.save()
+        self.assertEqual(self.accessible(self.bob), set())
+        project.team = self.team
+        project.save()
+
+        membership.delete()
+        self.assertEqual(self.accessible(self.bob), set())
+        self.assertEqual(self.accessible(self.alice), {self.board.id, second.id})
+
+    def test_membership_moved_to_another_user_revokes_the_old_one(self):
+        carol = User.objects.create_user(username='carol', password='pw')
+        membership = TeamMembership.objects.create(user=self.bob, team=self.team, role='member')
+        cache = get_auth_cache()
+        cache.set_access(self.bob.id, self.board.id, True)
+        membership.user = carol
+        membership.save()
+        self.assertEqual(self.accessible(self.bob), set())
+        self.assertEqual(self.accessible(carol), {self.board.id})
+        self.assertIsNone(cache.get_access(self.bob.id, self.board.id))
+
+    def test_rest_querysets_use_the_index(self):
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        self.assertEqual(client.get('/api/boards/').json()['results'], [])
+        client.force_authenticate(self.alice)
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get('/api/cards/')
+        self.assertEqual(len(response.json()['results']), 1)
+        sql = ctx.captured_queries[-1]['sql']
+        self.assertIn('core_boardaccess', sql)
+        self.assertNotIn('core_teammembership', sql)
+
+    async def test_non_member_cannot_connect(self):
+        token = str(AccessToken.for_user(self.bob))
+        socket = BoardSocket(f"/ws/boards/{self.board.id}/", f"token={token}")
+        self.assertFalse(await socket.connect())
+        socket, welcome = await connect_socket(self.alice, self.board)
+        self.assertEqual(welcome['type'], 'connection.established')
+        await socket.disconnect()
+
+    def test_rebuild_repairs_drift(self):
+        BoardAccess.objects.all().delete()
+        BoardAccess.objects.create(user=self.bob, board=self.board)
+        self.assertEqual(rebuild_board_access(), (1, 1))
+        self.assertEqual(self.accessible(self.alice), {self.board.id})
+        self.assertEqual(self.accessible(self.bob), set())
+
+
+class TeamMembershipSyncTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pw')
+        self.board = make_board(self.alice, columns=1, cards_per_column=1)
+        self.team = self.board.project.team
+        self.users = [User.objects.create_user(username=f"user{n}") for n in range(50)]
+        TeamMembership.objects.bulk_create([
+            TeamMembership(user=user, team=self.team, role='member') for user in self.users[:25]
+        ])
+        sync_users_access([user.id for user in self.users])
+
+    def sync(self, member_ids):
+        return sync_team_members(self.team, member_ids, self.alice)
+
+    def test_query_count_does_not_grow_with_members(self):
+        # Keep alice and users 10-39: 10 removed, 15 added
+        desired = [self.alice.id] + [user.id for user in self.users[10:40]]
+        # 10 statements plus savepoints, however many members change
+        with self.assertNumQueries(14):
+            members = self.sync(desired + [999999])
+        self.assertEqual([member['id'] for member in members], sorted(desired))
+        self.assertEqual(set(self.team.members.values_list('id', flat=True)), set(desired))
+        self.assertEqual(TeamMembership.objects.get(user=self.alice).role, 'admin')
+
+        history = TeamMembership.history.filter(history_user=self.alice)
+        self.assertEqual(history.filter(history_type='-').count(), 10)
+        self.assertEqual(history.filter(history_type='+').count(), 15)
+
+        self.assertFalse(BoardAccess.objects.filter(user=self.users[0]).exists())
+        self.assertTrue(BoardAccess.objects.filter(user=self.users[39], board=self.board).exists())
+        self.assertFalse(BoardAccess.objects.filter(user=self.users[40]).exists())
+
+    def test_unchanged_members_write_nothing(self):
+        desired = [self.alice.id] + [user.id for user in self.users[:25]]
+        with CaptureQueriesContext(connection) as ctx:
+            self.sync(desired)
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith(('INSERT', 'DELETE'))])
+
+
+class CardCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.bob = User.objects.create_user(username='bob', password='pw')
+        self.board = make_board(self.user, columns=2, cards_per_column=2)
+        self.todo, self.done = Column.objects.order_by('rank')
+        self.consumer = BoardConsumer()
+        self.consumer.user = self.user
+        self.consumer.board_id = str(self.board.id)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def counts(self, board=None):
+        counts = board_counts((board or self.board).id)
+        return (
+            counts['total'],
+            {item['column']: item['cards'] for item in counts['columns']},
+            {item['assignee']: item['cards'] for item in counts['assignees']},
+        )
+
+    def test_counts_follow_consumer_writes(self):
+        self.assertEqual(self.counts(), (4, {self.todo.id: 2, self.done.id: 2}, {self.user.id: 4}))
+        created = self.consumer._create_card({'column_id': self.todo.id, 'title': 'New'})
+        card = Card.objects.filter(column=self.todo).first()
+        self.consumer._move_card({'id': card.id, 'new_column_id': self.done.id, 'new_position': 0})
+        self.consumer._update_card({'id': card.id, 'assignee': self.bob.id})
+        self.consumer._delete_card(created.id)
+        self.assertEqual(self.counts(), (4, {self.todo.id: 1, self.done.id: 3}, {self.user.id: 3, self.bob.id: 1}))
+        self.assertEqual(repair_card_counts(dry_run=True), [])
+
+    def test_counts_follow_rest_writes_and_cascades(self):
+        response = self.client.post('/api/cards/', {'title': 'REST', 'column': self.todo.id}, format='json')
+        card_id = response.json()['id']
+        self.client.patch(f'/api/cards/{card_id}/', {'column': self.done.id}, format='json')
+        self.assertEqual(self.counts(), (5, {self.todo.id: 2, self.done.id: 3}, {None: 1, self.user.id: 4}))
+        self.client.delete(f'/api/cards/{card_id}/')
+        Card.objects.filter(column=self.todo).update(assignee=self.bob)
+        self.assertEqual(self.counts()[2], {self.user.id: 2, self.bob.id: 2})
+
+        self.bob.delete()
+        self.assertEqual(self.counts()[2], {None: 2, self.user.id: 2})
+        other = Board.objects.create(name='Other', project=self.board.project)
+        self.done.board = other
+        self.done.save()
+        self.assertEqual(self.counts(), (2, {self.todo.id: 2}, {None: 2}))
+        self.assertEqual(self.counts(other), (2, {self.done.id: 2}, {self.user.id: 2}))
+        self.todo.delete()
+        self.assertEqual(self.counts()[0], 0)
+        self.assertEqual(repair_card_counts(dry_run=True), [])
+
+    def test_endpoint_reads_the_counters(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/boards/{self.board.id}/counts/')
+        self.assertEqual(response.json(), {
+            'board': self.board.id,
+            'total': 4,
+            'columns': [{'column': self.todo.id, 'cards': 2}, {'column': self.done.id, 'cards': 2}],
+            'assignees': [{'assignee': self.user.id, 'cards': 4}],
+        })
+        self.client.force_authenticate(self.bob)
+        self.assertEqual(self.client.get(f'/api/boards/{self.board.id}/counts/').status_code, 404)
+
+    def test_repair_reports_and_fixes_drift(self):
+        CardCount.objects.filter(column=self.todo).update(cards=7)
+        CardCount.objects.filter(column=self.done).delete()
+        out = io.StringIO()
+        call_command('repair_card_counts', '--dry-run', stdout=out)
+        self.assertIn(f"column {self.todo.id} assignee {self.user.id}: stored 7, actual 2", out.getvalue())
+        self.assertIn("2 drifted rows found", out.getvalue())
+        self.assertEqual(self.counts()[0], 7)
+
+        drift = repair_card_counts([self.board.id])
+        self.assertEqual([(item['column'], item['stored'], item['actual']) for item in drift],
+                         sorted([(self.todo.id, 7, 2), (self.done.id, 0, 2)]))
+        self.assertEqual(self.counts(), (4, {self.todo.id: 2, self.done.id: 2}, {self.user.id: 4}))
+        self.assertEqual(repair_card_counts(dry_run=True), [])
+
+
+@in_process_board
+class WipLimitTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.board = make_board(self.user, columns=2, cards_per_column=0)
+        self.backlog, self.doing = Column.objects.order_by('rank')
+        self.cards = [
+            Card.objects.create(title=f"Card {n}", column=self.backlog, rank=rank)
+            for n, rank in enumerate(spread_ranks(6))
+        ]
+        Column.objects.filter(id=self.doing.id).update(wip_limit=2)
+        self.consumer = BoardConsumer()
+        self.consumer.user = self.user
+        self.consumer.board_id = str(self.board.id)
+
+    def move(self, card, column=None, position=0):
+        return self.consumer._move_card({'id': card.id, 'new_column_id': (column or self.doing).id, 'new_position': position})
+
+    def in_doing(self):
+        counted = CardCount.objects.filter(column=self.doing).aggregate(cards=Sum('cards'))['cards'] or 0
+        return Card.objects.filter(column=self.doing).count(), counted
+
+    def test_move_checks_the_limit_in_the_same_statement(self):
+        # Rank lookup, the UPDATE (checked by the guard trigger) and its history row, as without a limit
+        with CaptureQueriesContext(connection) as ctx:
+            self.move(self.cards[0])
+        statements = [q['sql'] for q in ctx.captured_queries if q['sql'] not in ('BEGIN', 'COMMIT')]
+        self.assertEqual([sql.split()[0] for sql in statements], ['SELECT', 'UPDATE', 'INSERT'])
+        self.move(self.cards[1])
+        with self.assertRaises(WipLimitError) as ctx:
+            self.move(self.cards[2])
+        self.assertEqual(ctx.exception.as_payload(), {
+            'column_id': self.doing.id, 'card_id': self.cards[2].id, 'wip_limit': 2, 'cards': 2,
+        })
+        with self.assertRaises(WipLimitError):
+            self.consumer._create_card({'column_id': self.doing.id, 'title': 'Extra'})
+        # Reordering inside a full column is not a new entry
+        self.move(self.cards[1], position=0)
+        self.assertEqual(self.in_doing(), (2, 2))
+        self.move(self.cards[0], column=self.backlog)
+        self.move(self.cards[2])
+        self.assertEqual(self.in_doing(), (2, 2))
+
+    async def test_socket_move_into_full_column_gets_structured_error(self):
+        await database_sync_to_async(self.move)(self.cards[0])
+        await database_sync_to_async(self.move)(self.cards[1])
+        socket, _ = await connect_socket(self.user, self.board)
+        await socket.send_json_to({'type': 'card.moved', 'payload': {
+            'id': self.cards[2].id, 'new_column_id': self.doing.id, 'new_position': 0,
+        }})
+        event = await socket.receive_json_from()
+        self.assertEqual(event['type'], 'wip_limit.exceeded')
+        self.assertEqual((event['payload']['column_id'], event['payload']['cards']), (self.doing.id, 2))
+        self.assertTrue(await socket.receive_nothing())
+        await socket.disconnect()
+
+    def deadlock(self):
+        # What Django raises when PostgreSQL picks this transaction as a deadlock victim
+        class DeadlockDetected(Exception):
+            sqlstate = '40P01'
+
+        error = OperationalError('deadlock detected')
+        error.__cause__ = DeadlockDetected()
+        return error
+
+    def test_deadlocked_moves_are_retried(self):
+        # The synchronous body of the consumer's move_card, retries included
+        move_card = BoardConsumer.move_card.__wrapped__
+        attempts = []
+
+        def deadlock_once(*args):
+            attempts.append(args)
+            if len(attempts) == 1:
+                raise self.deadlock()
+            return update_returning(*args)
+
+        with mock.patch('core.consumers.update_returning', side_effect=deadlock_once):
+            move_card(self.consumer, {'id': self.cards[0].id, 'new_column_id': self.doing.id})
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(self.in_doing(), (1, 1))
+
+        with mock.patch('core.consumers.update_returning', side_effect=OperationalError('disk I/O error')) as update:
+            with self.assertRaises(OperationalError):
+                move_card(self.consumer, {'id': self.cards[1].id, 'new_column_id': self.doing.id})
+        self.assertEqual(update.call_count, 1)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch('core.views.wip_limit_refusals', side_effect=[self.deadlock(), nullcontext()]) as guard:
+            response = client.patch(f'/api/cards/{self.cards[1].id}/', {'column': self.doing.id})
+        self.assertEqual((response.status_code, guard.call_count), (200, 2))
+        self.assertEqual(response.json()['version'], 2)
+        self.assertEqual(self.in_doing(), (2, 2))
+
+    def test_rest_writes_respect_the_limit(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for card in self.cards[:2]:
+            self.assertEqual(client.patch(f'/api/cards/{card.id}/', {'column': self.doing.id}).status_code, 200)
+        response = client.patch(f'/api/cards/{self.cards[2].id}/', {'column': self.doing.id})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['code'], 'wip_limit_exceeded')
+        self.assertEqual(client.post('/api/cards/', {'title': 'New', 'column': self.doing.id}).status_code, 409)
+        self.assertEqual(client.patch(f'/api/cards/{self.cards[0].id}/', {'title': 'Renamed'}).status_code, 200)
+        self.assertEqual(client.patch(f'/api/columns/{self.doing.id}/', {'wip_limit': 3}).status_code, 200)
+        self.assertEqual(client.post('/api/cards/', {'title': 'New', 'column': self.doing.id}).status_code, 201)
+        self.assertEqual(self.in_doing(), (3, 3))
+
+    def test_concurrent_moves_never_exceed_the_limit(self):
+        barrier = threading.Barrier(len(self.cards), timeout=10)
+        outcomes = []
+
+        def move(card):
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        with transaction.atomic():
+                            self.move(card)
+                        outcomes.append('moved')
+                        return
+                    except WipLimitError:
+                        outcomes.append('refused')
+                        return
+                    except OperationalError:
+                        # SQLite allows one writer at a time; retry when the database is locked
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=move, args=(card,)) for card in self.cards]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(outcomes), ['moved'] * 2 + ['refused'] * 4)
+        self.assertEqual(self.in_doing(), (2, 2))
+
+    def test_batch_reports_the_refused_move_and_applies_the_rest(self):
+        results, _ = BoardConsumer.apply_batch.__wrapped__(self.consumer, [
+            {'type': 'card.moved', 'payload': {'id': card.id, 'new_column_id': self.doing.id}}
+            for card in self.cards[:3]
+        ], atomic=False)
+        self.assertEqual([result['ok'] for result in results], [True, True, False])
+        self.assertEqual(results[2]['wip_limit'], {
+            'column_id': self.doing.id, 'card_id': self.cards[2].id, 'wip_limit': 2, 'cards': 2,
+        })
+        self.assertEqual(self.in_doing(), (2, 2))
+
+    def test_database_refuses_any_write_into_a_full_column(self):
+        Card.objects.filter(id__in=[card.id for card in self.cards[:2]]).update(column=self.doing)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Card.objects.create(title="Raw", column=self.doing)
+        with self.assertRaises(WipLimitError) as ctx:
+            with wip_limit_refusals(self.doing.id, self.cards[2].id):
+                with transaction.atomic():
+                    Card.objects.filter(id=self.cards[2].id).update(column=self.doing)
+        self.assertEqual((ctx.exception.cards, ctx.exception.wip_limit), (2, 2))
+        # Columns without a limit, and writes that do not change column, are not checked
+        Card.objects.filter(column=self.doing).update(title="Renamed")
+        Column.objects.filter(id=self.doing.id).update(wip_limit=None)
+        Card.objects.create(title="Raw", column=self.doing)
+        self.assertEqual(self.in_doing(), (3, 3))
+
+
+# The guard's row locking only exists on PostgreSQL: run with DATABASE_URL set, e.g.
+#   docker-compose run backend python manage.py test core.tests.WipLimitPostgresTests
+@skipUnless(connection.vendor == 'postgresql', "WIP guard locking needs PostgreSQL")
+@in_process_board
+class WipLimitPostgresTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.board = make_board(self.user, columns=2, cards_per_column=6)
+        self.left, self.right = Column.objects.order_by('rank')
+        Column.objects.filter(board=self.board).update(wip_limit=12)
+        self.consumer = BoardConsumer()
+        self.consumer.user = self.user
+        self.consumer.board_id = str(self.board.id)
+
+    def move(self, card_id, column):
+        # Without the retry wrapper, so a deadlock would surface as an error
+        return self.consumer._move_card({'id': card_id, 'new_column_id': column.id, 'new_position': 0})
+
+    def run_threads(self, targets):
+        errors = []
+
+        def run(target):
+            try:
+                target()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_opposite_moves_do_not_deadlock(self):
+        barrier = threading.Barrier(2, timeout=10)
+
+        def move_all(source, target):
+            card_ids = list(Card.objects.filter(column=source).values_list('id', flat=True))
+            barrier.wait()
+            for card_id in card_ids:
+                self.move(card_id, target)
+
+        errors = self.run_threads([lambda: move_all(self.left, self.right), lambda: move_all(self.right, self.left)])
+        self.assertEqual(errors, [])
+        self.assertEqual(Card.objects.filter(column=self.left).count(), 6)
+
+    def test_second_move_waits_for_the_first_and_sees_its_card(self):
+        Column.objects.filter(id=self.right.id).update(wip_limit=7)
+        first, second = Card.objects.filter(column=self.left).values_list('id', flat=True)[:2]
+        moved, release = threading.Event(), threading.Event()
+        outcomes = []
+
+        def hold_first():
+            with transaction.atomic():
+                self.move(first, self.right)
+                moved.set()
+                release.wait(10)
+
+        def move_second():
+            moved.wait(10)
+            try:
+                self.move(second, self.right)
+                outcomes.append('moved')
+            except WipLimitError:
+                outcomes.append('refused')
+
+        holder = threading.Thread(target=lambda: self.run_threads([hold_first]))
+        holder.start()
+        mover = threading.Thread(target=lambda: self.run_threads([move_second]))
+        mover.start()
+        # The second move queues on the column row while the first is uncommitted
+        mover.join(0.5)
+        self.assertTrue(mover.is_alive())
+        release.set()
+        holder.join()
+        mover.join()
+        self.assertEqual(outcomes, ['refused'])
+
+
+PRESENCE_DIFFS = {'BACKEND': 'core.presence.LocalPresence', 'OPTIONS': {}, 'ttl': 60, 'broadcast_interval_ms': 200}
+
+
+@override_settings(BOARD_PRESENCE=PRESENCE_DIFFS)
+@in_process_board
+class PresenceTests(TransactionTestCase):
+    def setUp(self):
+        reset_presence()
+        reset_event_log()
+        self.alice = User.objects.create_user(username='alice', password='pw')
+        self.bob = User.objects.create_user(username='bob', password='pw')
+        self.board = make_board(self.alice, columns=1, cards_per_column=1)
+        TeamMembership.objects.create(user=self.bob, team=self.board.project.team, role='member')
+        self.card = Card.objects.get()
+
+    def tearDown(self):
+        reset_presence()
+
+    def test_store_groups_connections_per_user_and_expires_them(self):
+        presence = LocalPresence(ttl=30)
+        presence.join(1, 'a1', 1, 'alice')
+        presence.join(1, 'a2', 1, 'alice', card_id=7)
+        presence.join(1, 'b1', 2, 'bob')
+        self.assertFalse(presence.touch(1, 'b1'))
+        self.assertTrue(presence.touch(1, 'b1', 7))
+        self.assertEqual(presence.viewers(1), [
+            {'user_id': 1, 'username': 'alice', 'card_ids': [7], 'connections': 2},
+            {'user_id': 2, 'username': 'bob', 'card_ids': [7], 'connections': 1},
+        ])
+        self.assertTrue(presence.leave(1, 'a1'))
+        self.assertFalse(presence.leave(1, 'a1'))
+
+        # Only bob keeps heartbeating; alice's last connection lapses
+        now = time.time()
+        with mock.patch('core.presence.time.time', return_value=now + 20):
+            presence.touch(1, 'b1')
+        with mock.patch('core.presence.time.time', return_value=now + 40):
+            self.assertTrue(presence.touch(1, 'b1'))
+            self.assertEqual([viewer['username'] for viewer in presence.viewers(1)], ['bob'])
+            self.assertIsNone(presence.touch(1, 'a2'))
+
+    def test_diff_carries_changed_viewers_and_departures(self):
+        broadcaster = PresenceBroadcaster(LocalPresence())
+        alice = {'user_id': 1, 'username': 'alice', 'card_ids': [], 'connections': 1}
+        bob = {'user_id': 2, 'username': 'bob', 'card_ids': [], 'connections': 1}
+        self.assertEqual(broadcaster.diff('1', [alice, bob]), ([alice, bob], []))
+        focused = {**bob, 'card_ids': [5]}
+        self.assertEqual(broadcaster.diff('1', [alice, focused]), ([focused], []))
+        self.assertEqual(broadcaster.diff('1', [alice, focused]), ([], []))
+        self.assertEqual(broadcaster.diff('1', []), ([], [1, 2]))
+
+    async def test_joins_focus_and_leaves_reach_viewers_as_batched_diffs(self):
+        alice, welcome = await connect_socket(self.alice, self.board)
+        self.assertEqual([viewer['username'] for viewer in welcome['payload']['viewers']], ['alice'])
+        bob, welcome = await connect_socket(self.bob, self.board)
+        self.assertEqual([viewer['username'] for viewer in welcome['payload']['viewers']], ['alice', 'bob'])
+        await bob.send_json_to({'type': 'presence.focus', 'payload': {'card_id': self.card.id}})
+        await bob.send_json_to({'type': 'presence.heartbeat', 'payload': {'card_id': self.card.id}})
+
+        # Two joins and a focus change arrive as one diff
+        diff = await alice.receive_json_from(timeout=2)
+        self.assertEqual(diff['type'], 'presence.diff')
+        self.assertNotIn('seq', diff)
+        self.assertEqual(diff['payload']['left'], [])
+        self.assertEqual(
+            [(viewer['username'], viewer['card_ids']) for viewer in diff['payload']['viewers']],
+            [('alice', []), ('bob', [self.card.id])],
+        )
+        self.assertTrue(await alice.receive_nothing(0.4))
+
+        await bob.disconnect()
+        diff = await alice.receive_json_from(timeout=2)
+        self.assertEqual((diff['payload']['viewers'], diff['payload']['left']), ([], [self.bob.id]))
+        await alice.disconnect()
+
+    def test_viewers_endpoint(self):
+        get_presence().join(self.board.id, 'socket-1', self.bob.id, 'bob', card_id=self.card.id)
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        response = client.get(f'/api/boards/{self.board.id}/viewers/')
+        self.assertEqual(response.json(), {'board': self.board.id, 'viewers': [
+            {'user_id': self.bob.id, 'username': 'bob', 'card_ids': [self.card.id], 'connections': 1},
+        ]})
+        client.force_authenticate(User.objects.create_user(username='carol'))
+        self.assertEqual(client.get(f'/api/boards/{self.board.id}/viewers/').status_code, 404)
+
+
+class ListPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.board = make_board(self.user, columns=2, cards_per_column=5)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_pages_cover_every_card_once(self):
+        ids = []
+        url = '/api/cards/?page_size=3'
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 3)
+            ids.extend(card['id'] for card in page['results'])
+            url = page['next']
+        self.assertEqual(ids, sorted(Card.objects.values_list('id', flat=True)))
+
+    def test_page_is_a_keyset_query(self):
+        first = self.client.get('/api/cards/?page_size=2').json()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(first['next'])
+        sql = ctx.captured_queries[-1]['sql']
+        self.assertIn('"core_card"."id" >', sql)
+        self.assertNotIn('OFFSET', sql)
+
+    def test_fields_narrow_output_and_projection(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/cards/?fields=id,title')
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'title'})
+        sql = ctx.captured_queries[-1]['sql']
+        self.assertNotIn('"description"', sql)
+        response = self.client.get('/api/cards/?exclude=description,rank')
+        self.assertNotIn('description', response.json()['results'][0])
+        self.assertIn('column', response.json()['results'][0])
+        self.assertEqual(self.client.get('/api/cards/?fields=nope').status_code, 400)
+
+    def test_empty_field_selection_is_rejected(self):
+        self.assertEqual(self.client.get('/api/cards/?fields=,').status_code, 400)
+        response = self.client.get('/api/columns/?exclude=id,name,board,rank,wip_limit,version')
+        self.assertEqual(response.status_code, 400)
+
+    def test_fields_without_id_still_paginate(self):
+        titles = []
+        url = '/api/cards/?fields=title&page_size=3'
+        while url:
+            page = self.client.get(url).json()
+            self.assertTrue(all(set(card) == {'title'} for card in page['results']))
+            titles.extend(card['title'] for card in page['results'])
+            url = page['next']
+        self.assertEqual(titles, list(Card.objects.order_by('id').values_list('title', flat=True)))
+        response = self.client.get('/api/columns/?exclude=id&page_size=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('id', response.json()['results'][0])
+        self.assertEqual(self.client.get(response.json()['next']).status_code, 200)
+
+    def test_filter_by_board_and_column(self):
+        column = self.board.column_set.order_by('rank').first()
+        results = self.client.get(f'/api/cards/?column={column.id}').json()['results']
+        self.assertEqual({card['column'] for card in results}, {column.id})
+        self.assertEqual(len(self.client.get(f'/api/cards/?board={self.board.id}').json()['results']), 10)
+        self.assertEqual(len(self.client.get(f'/api/columns/?board={self.board.id}').json()['results']), 2)
+        self.assertEqual(self.client.get('/api/cards/?board=x').status_code, 400)
+
+
+class CardSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.board = make_board(self.user, columns=1, cards_per_column=0)
+        self.column = Column.objects.get()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def card(self, title, description='', column=None):
+        return Card.objects.create(title=title, description=description, column=column or self.column)
+
+    def search(self, query, **params):
+        response = self.client.get('/api/cards/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_title_matches_rank_above_description_matches(self):
+        in_description = self.card('Release notes', 'Document the deployment checklist')
+        in_title = self.card('Deployment pipeline', 'Wire up CI')
+        self.card('Unrelated', 'Nothing here')
+        results = self.search('deploy')['results']
+        self.assertEqual([card['id'] for card in results], [in_title.id, in_description.id])
+        self.assertGreater(results[0]['score'], results[1]['score'])
+
+    def test_every_term_must_match_and_operators_are_ignored(self):
+        both = self.card('Fix login bug', 'Session cookie expires early')
+        self.card('Fix signup form')
+        self.assertEqual([card['id'] for card in self.search('fix cookie')['results']], [both.id])
+        self.assertEqual(self.search('"fix" -* cookie)(')['results'][0]['id'], both.id)
+        self.assertEqual(self.client.get('/api/cards/search/').status_code, 400)
+
+    def test_index_follows_card_writes(self):
+        card = self.card('Draft')
+        Card.objects.filter(id=card.id).update(title='Quarterly roadmap')
+        self.assertEqual(self.search('draft')['count'], 0)
+        self.assertEqual(self.search('roadmap')['count'], 1)
+        card.delete()
+        self.assertEqual(self.search('roadmap')['count'], 0)
+
+    def test_results_are_scoped_and_paginated(self):
+        other = make_board(User.objects.create_user(username='bob'), columns=1, cards_per_column=0, name='Other')
+        self.card('Secret roadmap', column=Column.objects.get(board=other))
+        for n in range(25):
+            self.card(f"Roadmap item {n}")
+        first = self.search('roadmap', page_size=10, fields='id,title')
+        self.assertEqual((first['count'], len(first['results'])), (25, 10))
+        self.assertEqual(set(first['results'][0]), {'id', 'title', 'score'})
+        self.assertEqual(self.search('secret')['count'], 0)
+        self.assertEqual(self.search('roadmap', board=other.id)['count'], 0)
+
+
+class ValuesSerializerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.board = make_board(self.user, columns=2, cards_per_column=3)
+        Card.objects.filter(title='Card 0.0').update(assignee=None, description='Long text')
+
+    def test_output_matches_model_serializers(self):
+        for serializer_class, queryset in (
+            (CardSerializer, Card.objects.order_by('id')),
+            (ColumnSerializer, Column.objects.order_by('id')),
+            (BoardSerializer, Board.objects.order_by('id')),
+        ):
+            fast = values_serializer(serializer_class)
+            expected = [dict(item) for item in serializer_class(queryset, many=True).data]
+            self.assertEqual(fast.serialize(fast.values(queryset)), expected)
+
+    def test_selected_fields(self):
+        fast = values_serializer(CardSerializer, ('id', 'column'))
+        self.assertEqual(fast.columns, ('id', 'column_id'))
+        card = Card.objects.order_by('id').first()
+        self.assertEqual(fast.serialize(fast.values(Card.objects.order_by('id')))[0],
+                         {'id': card.id, 'column': card.column_id})
+
+    def test_many_to_many_is_rejected(self):
+        with self.assertRaises(ValueError):
+            values_serializer(TeamSerializer)
+
+    def test_list_endpoint_skips_model_hydration(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/cards/?board=%d' % self.board.id)
+        expected = [dict(item) for item in CardSerializer(Card.objects.order_by('id'), many=True).data]
+        self.assertEqual(response.json()['results'], expected)
+
+
+class CodecTests(TestCase):
+    payload = {
+        'at': datetime.datetime(2026, 10, 18, 9, 30, tzinfo=datetime.timezone.utc),
+        'amount': decimal.Decimal('12.50'),
+        'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'title': 'Ünïcode',
+    }
+
+    def available_codecs(self):
+        codecs = [StdlibCodec()]
+        try:
+            codecs.append(OrjsonCodec())
+        except ImportError:
+            pass
+        return codecs
+
+    def test_native_types_round_trip(self):
+        for codec in self.available_codecs():
+            data = codec.loads(codec.dumps(self.payload))
+            self.assertEqual(data['amount'], '12.50', codec.name)
+            self.assertEqual(data['id'], '12345678-1234-5678-1234-567812345678', codec.name)
+            self.assertTrue(data['at'].startswith('2026-10-18T09:30:00'), codec.name)
+            self.assertTrue(data['at'].endswith('Z'), codec.name)
+            self.assertEqual(data['title'], 'Ünïcode', codec.name)
+            self.assertNotIn(b' ', codec.dumps_bytes({'a': [1, 2]}), codec.name)
+
+    def test_malformed_input_raises_decode_error(self):
+        for codec in self.available_codecs():
+            with self.assertRaises(DecodeError):
+                codec.loads('{"type": ')
+
+    def test_missing_backend_falls_back_to_stdlib(self):
+        codec = load_codec({'BACKEND': 'core.codec.NoSuchCodec'})
+        self.assertIsInstance(codec, StdlibCodec)
+
+    def test_rest_uses_codec_renderer_and_parser(self):
+        user = User.objects.create_user(username='alice', password='pw')
+        board = make_board(user, columns=1, cards_per_column=0)
+        client = APIClient()
+        client.force_authenticate(user)
+        column = board.column_set.get()
+        response = client.post('/api/cards/', {'title': 'JSON', 'column': column.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(get_codec().loads(response.content)['title'], 'JSON')
+        response = client.post('/api/cards/', '{"title": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_requested_indent_is_honoured(self):
+        user = User.objects.create_user(username='alice', password='pw')
+        board = make_board(user, columns=1, cards_per_column=0)
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(f'/api/boards/{board.id}/', HTTP_ACCEPT='application/json; indent=4')
+        self.assertIn(b'\n    "name": "Board"', response.content)
+        self.assertNotIn(b'\n', client.get(f'/api/boards/{board.id}/').content)
+
+
+@in_process_board
+class PreEncodedFanoutTests(TransactionTestCase):
+    def setUp(self):
+        reset_event_log()
+        reset_broadcast_stats()
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.board = make_board(self.user, columns=1, cards_per_column=1)
+
+    async def test_broadcast_is_encoded_once_for_all_subscribers(self):
+        card = await database_sync_to_async(Card.objects.get)()
+        sockets = [(await connect_socket(self.user, self.board))[0] for _ in range(3)]
+        await sockets[0].send_json_to({'type': 'card.updated', 'payload': {'id': card.id, 'title': 'Once'}})
+        frames = [(await socket.receive_output(1))['text'] for socket in sockets]
+        self.assertEqual(len(set(frames)), 1)
+        self.assertEqual(json.loads(frames[0])['payload']['title'], 'Once')
+        stats = get_broadcast_stats().stats(f"board_{self.board.id}")
+        self.assertEqual(stats['frames'], 1)
+        self.assertEqual(stats['bytes'], len(frames[0].encode('utf-8')))
+        self.assertGreater(stats['encode_ns'], 0)
+        for socket in sockets:
+            await socket.disconnect()
+
+
+@in_process_board
+class EventCoalescingTests(TransactionTestCase):
+    def setUp(self):
+        reset_event_log()
+        reset_broadcast_stats()
+        reset_coalescing()
+        self.addCleanup(reset_coalescing)
+        self.user = User.objects.create_user(username='alice', password='pw')
+        self.board = make_board(self.user, columns=1, cards_per_column=1)
+        self.card = Card.objects.get()
+
+    async def type_title(self, socket, text):
+        for end in range(1, len(text) + 1):
+            await socket.send_json_to({'type': 'card.updated', 'payload': {'id': self.card.id, 'title': text[:end]}})
+
+    @override_settings(BOARD_EVENT_COALESCING={'window_ms': 50, 'event_types': ['card.updated']})
+    async def test_rapid_updates_broadcast_once(self):
+        socket, _ = await connect_socket(self.user, self.board)
+        await self.type_title(socket, 'Typing')
+        event = await socket.receive_json_from()
+        self.assertEqual((event['type'], event['payload']['title']), ('card.updated', 'Typing'))
+        self.assertTrue(await socket.receive_nothing(0.2))
+        self.assertEqual(get_broadcast_stats().stats(f"board_{self.board.id}")['frames'], 1)
+        await socket.disconnect()
+
+    @override_settings(BOARD_EVENT_COALESCING={'window_ms': 500, 'event_types': ['card.updated']})
+    async def test_pending_updates_flush_before_other_events(self):
+        socket, _ = await connect_socket(self.user, self.board)
+        await socket.send_json_to({'type': 'card.updated', 'payload': {'id': self.card.id, 'title': 'Edited'}})
+        await socket.send_json_to({'type': 'card.deleted', 'payload': {'id': self.card.id}})
+        first = await socket.receive_json_from()
+        second = await socket.receive_json_from()
+        self.assertEqual([first['type'], second['type']], ['card.updated', 'card.deleted'])
+        self.assertLess(first['seq'], second['seq'])
+        await socket.disconnect()
+
+    @override_settings(BOARD_EVENT_COALESCING={
+        'window_ms': 50, 'event_types': ['card.updated'], 'defer_writes': ['card.updated'],
+    })
+    async def test_deferred_writes_hit_the_database_once(self):
+        socket, _ = await connect_socket(self.user, self.board)
+        await self.type_title(socket, 'Deferred')
+        event = await socket.receive_json_from()
+        self.assertEqual((event['payload']['title'], event['payload']['version']), ('Deferred', 2))
+        self.assertTrue(await socket.receive_nothing(0.2))
+        history = await database_sync_to_async(lambda: self.card.history.count())()
+        self.assertEqual(history, 2)
+        await socket.disconnect()
+
+    @override_settings(BOARD_EVENT_COALESCING={
+        'window_ms': 50, 'event_types': ['card.updated'], 'defer_writes': ['card.updated'],
+    })
+    async def test_deferred_edits_against_different_versions_are_checked_separately(self):
+        socket, _ = await connect_socket(self.user, self.board)
+        await socket.send_json_to({'type': 'card.updated', 'payload': {'id': self.card.id, 'title': 'Stale', 'version': 7}})
+        await socket.send_json_to({'type': 'card.updated', 'payload': {'id': self.card.id, 'title': 'Fresh', 'version': 1}})
+        conflict = await socket.receive_json_from()
+        self.assertEqual(conflict['type'], 'conflict')
+        event = await socket.receive_json_from()
+        self.assertEqual((event['payload']['title'], event['payload']['version']), ('Fresh', 2))
+        await socket.disconnect()
+
+    @override_settings(BOARD_EVENT_COALESCING={
+        'window_ms': 50, 'event_types': ['card.updated'], 'defer_writes': ['card.updated'],
+    })
+    async def test_deferred_edits_from_different_sockets_are_not_merged(self):
+        first, _ = await connect_socket(self.user, self.board)
+        second, _ = await connect_socket(self.user, self.board)
+        await first.send_json_to({'type': 'card.updated', 'payload': {'id': self.card.id, 'title': 'First', 'version': 1}})
+        await second.send_json_to({'type': 'card.updated', 'payload': {'id': self.card.id, 'title': 'Second', 'version': 1}})
+        # Whichever edit is written first wins; the other socket is told about the conflict
+        frames = [await first.receive_json_from(), await second.receive_json_from()]
+        for socket in (first, second):
+            if not await socket.receive_nothing(0.2):
+                frames.append(await socket.receive_json_from())
+        self.assertEqual(sorted(frame['type'] for frame in frames), ['card.updated', 'card.updated', 'conflict'])
+        await first.disconnect()
+        await second.disconnect()
+
+    @override_settings(BOARD_EVENT_COALESCING={
+        'window_ms': 500, 'event_types': ['card.updated'], 'defer_writes': ['card.updated'],
+    })
+    async def test_presence_does_not_flush_deferred_writes(self):
+        socket, _ = await connect_socket(self.user, self.board)
+        await socket.send_json_to({'type': 'card.updated', 'payload': {'id': self.card.id, 'title': 'Deferred'}})
+        await socket.send_json_to({'type': 'presence.heartbeat', 'payload': {'card_id': self.card.id}})
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(get_coalescing().board(self.board.id)), 1)
+        title = await database_sync_to_async(lambda: Card.objects.get(id=self.card.id).title)()
+        self.assertNotEqual(title, 'Deferred')
+        await socket.disconnect()
+
+    async def test_only_the_flushing_task_bypasses_the_buffer(self):
+        coalescing = EventCoalescing(window_ms=50, event_types=['card.updated'])
+        published = []
+        release = asyncio.Event()
+
+        async def publish(event):
+            # What the deferred write broadcasts from inside the flush
+            published.append(('flush', coalescing.buffer_for(1, 'card.updated')))
+            await release.wait()
+
+        coalescer = coalescing.board(1)
+        coalescer.add(('card.updated', 1), {'title': 'a'}, merge_latest, publish)
+        flush = asyncio.ensure_future(coalescer.flush_now())
+        await asyncio.sleep(0)
+        # Another socket's update arriving mid-flush queues behind the flushed entry
+        published.append(('other', coalescing.buffer_for(1, 'card.updated')))
+        release.set()
+        await flush
+        self.assertEqual(published, [('flush', None), ('other', coalescer)])
+
+
+class OutboundQueueTests(TestCase):
+    async def make_queue(self, policy, max_frames=3):
+        self.sent, self.resyncs, self.disconnects = [], [], []
+        self.gate = asyncio.Event()
+
+        async def send(text):
+            await self.gate.wait()
+            self.sent.append(text)
+
+        async def resync(last_seq):
+            self.resyncs.append(last_seq)
+
+        async def disconnect():
+            self.disconnects.append(True)
+
+        return OutboundQueue(send, resync, disconnect, max_frames=max_frames, policy=policy, last_seq=7)
+
+    async def settle(self):
+        self.gate.set()
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+    async def test_drop_resync_replays_from_last_delivered_seq(self):
+        queue = await self.make_queue('drop_resync')
+        queue.put('frame 8', seq=8)
+        await asyncio.sleep(0)
+        # Frame 8 is with the stalled writer; 9-11 fill the queue and 12 overflows it
+        for seq in range(9, 15):
+            queue.put(f"frame {seq}", seq=seq)
+        await self.settle()
+        self.assertEqual(self.sent, ['frame 8', 'frame 13', 'frame 14'])
+        self.assertEqual(self.resyncs, [8])
+        self.assertEqual(queue.dropped, 4)
+        self.assertEqual(queue.max_depth, 3)
+        queue.close()
+
+    async def test_coalesce_keeps_latest_frame_per_entity(self):
+        queue = await self.make_queue('coalesce', max_frames=2)
+        queue.put('moving', seq=8, key=('card.moved', 2))
+        await asyncio.sleep(0)
+        queue.put('a1', seq=9, key=('card.updated', 1))
+        queue.put('b1', seq=10, key=('card.updated', 2))
+        queue.put('a2', seq=11, key=('card.updated', 1))
+        await self.settle()
+        self.assertEqual(self.sent, ['moving', 'b1', 'a2'])
+        self.assertEqual((queue.dropped, self.resyncs), (1, []))
+        queue.close()
+
+    async def test_disconnect_policy_closes_slow_socket(self):
+        queue = await self.make_queue('disconnect', max_frames=1)
+        for seq in range(8, 12):
+            queue.put(f"frame {seq}", seq=seq)
+        await self.settle()
+        self.assertEqual(self.disconnects, [True])
+        self.assertLessEqual(len(self.sent), 1)
+
+    def test_unknown_policy_is_rejected(self):
+        with override_settings(BOARD_OUTBOUND_QUEUE={'policy': 'shrug'}):
+            with self.assertRaises(ValueError):
+                outbound_queue_config()
+
+
+class BoardDbPoolTests(TestCase):
+    def test_pool_follows_setting(self):
+        with override_settings(BOARD_DB_THREADS=4):
+            executor = get_db_executor()
+            self.assertEqual(executor._max_workers, 4)
+            self.assertIs(get_db_executor(), executor)
+        with override_settings(BOARD_DB_THREADS=0):
+            self.assertIsNone(get_db_executor())
+
+    async def test_calls_run_concurrently_on_the_pool(self):
+        barrier = threading.Barrier(3, timeout=5)
+
+        @board_db
+        def wait_for_others():
+            barrier.wait()
+            return threading.current_thread().name
+
+        with override_settings(BOARD_DB_THREADS=3):
+            names = await asyncio.gather(*[wait_for_others() for _ in range(3)])
+        self.assertEqual(len(set(names)), 3)
+        self.assertTrue(all(name.startswith('board-db') for name in names))
+
+
+class HistoryPipelineTests(TransactionTestCase):
+    def setUp(self):
+        self.journal_dir = f"/tmp/devboard-history-{uuid.uuid4().hex}"
+        self.buffered = override_settings(HISTORY_RECORDING={'mode': 'buffered', 'flush_interval_ms': 60000})
+        self.buffered.enable()
+        reset_history_pipeline()
+        self.user = User.objects.create_user(username='alice', password='pw', is_staff=True, is_superuser=True)
+        self.board = make_board(self.user, columns=1, cards_per_column=1)
+        self.card = Card.objects.get()
+
+    def tearDown(self):
+        reset_history_pipeline()
+        self.buffered.disable()
+        reset_history_pipeline()
+        shutil.rmtree(self.journal_dir, ignore_errors=True)
+
+    def test_rows_are_queued_until_flushed(self):
+        self.assertFalse(Card.history.exists())
+        versioned_update(self.card, {'title': 'Renamed'}, user=self.user)
+        stats = get_history_pipeline().stats()
+        # make_board's six creates plus the update
+        self.assertEqual((stats['mode'], stats['pending']), ('buffered', 7))
+        self.assertGreaterEqual(stats['lag_seconds'], 0)
+
+        self.assertEqual(get_history_pipeline().flush(), 7)
+        self.assertEqual(list(Card.history.values_list('history_type', 'title')),
+                         [('~', 'Renamed'), ('+', 'Card 0.0')])
+        self.assertEqual(get_history_pipeline().stats()['pending'], 0)
+
+    def test_bad_row_is_set_aside_and_dropped_without_blocking_others(self):
+        pipeline = get_history_pipeline()
+        pipeline.flush()
+        row = Card.history.model(
+            history_date=timezone.now(), history_type='~', history_user_id=999999,
+            **{field.attname: getattr(self.card, field.attname) for field in Card.history.model.tracked_fields},
+        )
+        pipeline._enqueue([row])
+        versioned_update(self.card, {'title': 'Renamed'}, user=self.user)
+
+        # The good row goes in; the one pointing at a deleted user waits for the next flush
+        self.assertEqual(pipeline.flush(), 1)
+        self.assertEqual(list(Card.history.filter(history_type='~').values_list('title', flat=True)), ['Renamed'])
+        self.assertEqual(pipeline.stats()['pending'], 1)
+
+        versioned_update(self.card, {'title': 'Again'}, user=self.user)
+        self.assertEqual(pipeline.flush(), 1)
+        self.assertEqual(pipeline.flush(), 0)
+        stats = pipeline.stats()
+        self.assertEqual((stats['pending'], stats['dropped'], stats['errors']), (0, 1, 3))
+        self.assertEqual(Card.history.filter(history_type='~').count(), 2)
+
+    def test_rolled_back_changes_queue_nothing(self):
+        get_history_pipeline().flush()
+        with transaction.atomic():
+            Card.objects.create(title='Discarded', column=self.card.column)
+            transaction.set_rollback(True)
+        self.assertEqual(get_history_pipeline().stats()['pending'], 0)
+
+    def test_journal_is_replayed_by_the_next_process(self):
+        get_history_pipeline().flush()
+        pipeline = HistoryPipeline(mode='journal', journal_dir=self.journal_dir, flush_interval_ms=60000)
+        row = Card.history.model(
+            history_date=timezone.now(), history_type='~', history_user=self.user,
+            **{field.attname: getattr(self.card, field.attname) for field in Card.history.model.tracked_fields},
+        )
+        pipeline._enqueue([row])
+        # A live process's journal belongs to it alone
+        Card.history.all().delete()
+        HistoryPipeline(mode='journal', journal_dir=self.journal_dir).close()
+        self.assertFalse(Card.history.exists())
+        # What a process that crashed before its next flush would leave behind
+        shutil.copy(pipeline.journal_path, f"{self.journal_dir}/crashed.journal.tmp")
+        pipeline.close()
+        self.assertEqual(os.listdir(self.journal_dir), ['crashed.journal.tmp'])
+        Card.history.all().delete()
+
+        os.replace(f"{self.journal_dir}/crashed.journal.tmp", f"{self.journal_dir}/crashed.journal")
+        HistoryPipeline(mode='journal', journal_dir=self.journal_dir).close()
+        self.assertEqual(list(Card.history.values_list('history_type', 'history_user')), [('~', self.user.id)])
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_post_create_signal_is_sent_once_the_row_is_written(self):
+        get_history_pipeline().flush()
+        written = []
+
+        def receiver(sender, instance, history_instance, **kwargs):
+            written.append((instance.title, Card.history.filter(history_id=history_instance.history_id).exists()))
+
+        post_create_historical_record.connect(receiver, sender=Card.history.model)
+        self.addCleanup(post_create_historical_record.disconnect, receiver, sender=Card.history.model)
+        versioned_update(self.card, {'title': 'Renamed'}, user=self.user)
+        self.card.title = 'Saved'
+        self.card.save()
+        self.assertEqual(written, [])
+        get_history_pipeline().flush()
+        self.assertEqual(written, [('Saved', True)])
+
+    def test_admin_history_view_flushes_and_reports_lag(self):
+        self.client.force_login(self.user)
+        response = self.client.get(f'/admin/core/card/{self.card.id}/history/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'flushed')
+        self.assertEqual(Card.history.count(), 1)
+        stats = APIClient()
+        stats.force_authenticate(self.user)
+        self.assertEqual(stats.get('/api/history/stats/').json()['pending'], 0)
+
+
+class HistoryRetentionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pw')
+        make_board(self.user, columns=1, cards_per_column=1)
+        self.card = Card.objects.get()
+        Card.history.all().delete()
+        self.now = timezone.now()
+
+    def record(self, days_ago, history_type='~', minutes=0, **changes):
+        for field, value in changes.items():
+            setattr(self.card, field, value)
+        self.card.version += 1
+        return Card.history.create(
+            history_date=self.now - datetime.timedelta(days=days_ago) + datetime.timedelta(minutes=minutes),
+            history_type=history_type,
+            **{field.attname: getattr(self.card, field.attname) for field in Card.history.model.tracked_fields},
+        ).history_id
+
+    def remaining(self):
+        return list(Card.history.order_by('history_date').values_list('history_id', flat=True))
+
+    def test_runs_of_moves_collapse_to_their_last_position(self):
+        created = self.record(2, '+')
+        moves = [self.record(2, minutes=n, rank=f"m{n}") for n in range(1, 5)]
+        renamed = self.record(2, minutes=10, title='Renamed')
+        moved_away = self.record(2, minutes=11, column_id=self.card.column_id, rank='z')
+        report = compact_model(Card, Card.history.model, now=self.now)
+        self.assertEqual(self.remaining(), [created, moves[-1], renamed, moved_away])
+        self.assertEqual((report['collapsed'], report['rows_after']), (3, 4))
+
+    def test_old_rows_keep_one_per_object_per_day(self):
+        created = self.record(40, '+')
+        edits = [self.record(40, minutes=n, title=f"Edit {n}") for n in range(1, 4)]
+        next_day = self.record(39, title='Next day')
+        recent = [self.record(1, minutes=n, title=f"Recent {n}") for n in range(2)]
+        compact_model(Card, Card.history.model, now=self.now)
+        self.assertEqual(self.remaining(), [created, edits[-1], next_day] + recent)
+
+    @override_settings(HISTORY_RETENTION={'models': {'card': {'delete_after_days': 100}}})
+    def test_per_model_expiry_and_dry_run(self):
+        self.record(200, '+')
+        kept = self.record(50, title='Kept')
+        columns_before = Column.history.count()
+
+        out = io.StringIO()
+        call_command('compact_history', '--dry-run', stdout=out)
+        self.assertIn('Would remove 1 history rows', out.getvalue())
+        self.assertEqual(Card.history.count(), 2)
+
+        report = compact_model(Card, Card.history.model, now=self.now)
+        self.assertEqual((report['expired'], self.remaining()), (1, [kept]))
+        self.assertEqual(Column.history.count(), columns_before)
+
+
+SHARDED_LAYERS = {
+    'default': {
+        'BACKEND': 'core.layers.ShardedChannelLayer',
+        'CONFIG': {'shards': [
+            {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+            {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+        ]},
+    },
+}
+
+
+class ShardedChannelLayerTests(TransactionTestCase):
+    def nodes(self, count, shards=2, **options):
+        backends = [InMemoryChannelLayer() for _ in range(shards)]
+        return backends, [ShardedChannelLayer(shards=backends, **options) for _ in range(count)]
+
+    def test_board_groups_hash_consistently_over_shards(self):
+        groups = [f"board_{n}" for n in range(2000)]
+        placed = [HashRing(4).shard(group) for group in groups]
+        self.assertEqual(placed, [HashRing(4).shard(group) for group in groups])
+        for index in range(4):
+            self.assertTrue(300 < placed.count(index) < 700)
+
+        # A fifth shard only takes groups over; nothing moves between the old four
+        moved = [(before, HashRing(5).shard(group)) for group, before in zip(groups, placed)]
+        changed = [after for before, after in moved if before != after]
+        self.assertEqual(set(changed), {4})
+        self.assertLess(len(changed), len(groups) * 0.3)
+
+    async def test_group_and_direct_sends_cross_nodes(self):
+        _, (a, b) = self.nodes(2)
+        alice, bob = await a.new_channel(), await b.new_channel()
+        await a.group_add('board_1', alice)
+        await b.group_add('board_1', bob)
+
+        await a.group_send('board_1', {'type': 'broadcast_message', 'text': 'hi'})
+        self.assertEqual((await asyncio.wait_for(a.receive(alice), 1))['text'], 'hi')
+        self.assertEqual((await asyncio.wait_for(b.receive(bob), 1))['text'], 'hi')
+
+        await b.send(alice, {'type': 'direct', 'n': 1})
+        self.assertEqual(await asyncio.wait_for(a.receive(alice), 1), {'type': 'direct', 'n': 1})
+        # Our own envelope came back through the shard and was dropped, not delivered twice
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(a.receive(alice), 0.1)
+        await a.close()
+        await b.close()
+
+    async def test_local_only_groups_never_reach_the_backend(self):
+        backends, (a, b) = self.nodes(2, membership_ttl=0)
+        first, second = await a.new_channel(), await a.new_channel()
+        await a.group_add('board_1', first)
+        await a.group_add('board_1', second)
+        shard = backends[a.shard_for('board_1')]
+
+        with mock.patch.object(shard, 'group_send', wraps=shard.group_send) as backend_send:
+            await a.group_send('board_1', {'type': 'broadcast_message', 'text': 'local'})
+            self.assertEqual(backend_send.call_count, 0)
+            for channel in (first, second):
+                self.assertEqual((await asyncio.wait_for(a.receive(channel), 1))['text'], 'local')
+
+            # Another worker joins: sends go through the shard until it leaves again
+            remote = await b.new_channel()
+            await b.group_add('board_1', remote)
+            await a.group_send('board_1', {'type': 'broadcast_message', 'text': 'shared'})
+            self.assertEqual(backend_send.call_count, 1)
+            self.assertEqual((await asyncio.wait_for(b.receive(remote), 1))['text'], 'shared')
+
+            await b.group_discard('board_1', remote)
+            await a.group_send('board_1', {'type': 'broadcast_message', 'text': 'local again'})
+            self.assertEqual(backend_send.call_count, 1)
+        self.assertEqual(a.counters['fast_path_sends'], 2)
+        self.assertEqual(a.counters['remote_sends'], 1)
+        await a.close()
+        await b.close()
+
+    async def test_node_channel_holds_a_burst_from_other_workers(self):
+        backends, (a, b) = self.nodes(2, capacity=500)
+        shard = backends[a.shard_for('board_1')]
+        self.assertEqual(shard.get_capacity(a.node_channel), 10000)
+        self.assertEqual(shard.get_capacity('specific.other!x'), 100)
+        alice, bob = await a.new_channel(), await b.new_channel()
+        await a.group_add('board_1', alice)
+        await b.group_add('board_1', bob)
+        # More than a backend channel's default 100 slots before a's reader gets to run
+        for n in range(300):
+            await b.group_send('board_1', {'type': 'broadcast_message', 'n': n})
+        received = [(await asyncio.wait_for(a.receive(alice), 1))['n'] for _ in range(300)]
+        self.assertEqual(received, list(range(300)))
+        await a.close()
+        await b.close()
+
+    def test_foreign_channels_cannot_join_groups(self):
+        _, (a, b) = self.nodes(2)
+
+        async def join():
+            await a.group_add('board_1', await b.new_channel())
+
+        with self.assertRaises(ValueError):
+            asyncio.run(join())
+
+    @override_settings(CHANNEL_LAYERS=SHARDED_LAYERS)
+    async def test_board_broadcasts_through_sharded_layer(self):
+        reset_event_log()
+        user = await database_sync_to_async(User.objects.create_user)(username='alice', password='pw')
+        board = await database_sync_to_async(make_board)(user, columns=1, cards_per_column=1)
+        card = await database_sync_to_async(Card.objects.get)()
+        sockets = [(await connect_socket(user, board))[0] for _ in range(2)]
+        await sockets[0].send_json_to({'type': 'card.updated', 'payload': {'id': card.id, 'title': 'Sharded'}})
+        for socket in sockets:
+            frame = await socket.receive_json_from(timeout=2)
+            self.assertEqual((frame['type'], frame['payload']['title']), ('card.updated', 'Sharded'))
+        for socket in sockets:
+            await socket.disconnect()
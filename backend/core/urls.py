@@ -3,7 +3,7 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     CardViewSet, ColumnViewSet, BoardViewSet, ProjectViewSet, 
     TeamViewSet, TeamMembershipViewSet, RegisterView,
-    user_profile, login_view
+    user_profile, login_view, snapshot_cache_stats, broadcast_stats, history_stats
 )
 
 router = DefaultRouter()
@@ -19,6 +19,9 @@ urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', login_view, name='login'),
     path('profile/', user_profile, name='user_profile'),
+    path('snapshot-cache/stats/', snapshot_cache_stats, name='snapshot_cache_stats'),
+    path('broadcast/stats/', broadcast_stats, name='broadcast_stats'),
+    path('history/stats/', history_stats, name='history_stats'),
 ]
 
 # from django.urls import path, include
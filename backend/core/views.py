@@ -1,85 +1,261 @@
 from rest_framework import viewsets, permissions, generics, status
 from .models import Card, Column, Board, Project, Team, TeamMembership
-from .serializers import CardSerializer, ColumnSerializer, BoardSerializer, ProjectSerializer, TeamSerializer, RegisterSerializer, TeamMembershipSerializer
+from .serializers import requested_fields, values_serializer, CardSerializer, ColumnSerializer, BoardSerializer, ProjectSerializer, TeamSerializer, RegisterSerializer, TeamMembershipSerializer
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes, action
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User
+from contextlib import contextmanager
+from django.db import transaction
+from django.http import HttpResponse
+from .snapshot import cached_board_snapshot_bytes
+from .snapshot_cache import get_snapshot_cache
+from .fanout import get_broadcast_stats
+from .history import get_history_pipeline
+from .ranking import card_rank, column_rank
+from .concurrency import ConflictError, claim_version, run_retrying
+from .access import accessible_board_ids
+from .aggregates import board_counts
+from .wip import WipLimitError, wip_limit_refusals
+from .presence import get_presence
+from .pagination import SearchPagination
+from .search import search_cards
+from rest_framework.exceptions import APIException, ValidationError
 
-class CardViewSet(viewsets.ModelViewSet):
+class SnapshotInvalidationMixin:
+    """Invalidate the cached board snapshot after REST writes"""
+
+    def snapshot_board_id(self, instance):
+        raise NotImplementedError
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        get_snapshot_cache().invalidate(self.snapshot_board_id(serializer.instance))
+
+    def perform_update(self, serializer):
+        # A card or column may move to another board, so invalidate both
+        old_board_id = self.snapshot_board_id(serializer.instance)
+        super().perform_update(serializer)
+        new_board_id = self.snapshot_board_id(serializer.instance)
+        get_snapshot_cache().invalidate(old_board_id)
+        if new_board_id != old_board_id:
+            get_snapshot_cache().invalidate(new_board_id)
+
+    def perform_destroy(self, instance):
+        board_id = self.snapshot_board_id(instance)
+        super().perform_destroy(instance)
+        get_snapshot_cache().invalidate(board_id)
+
+class SparseFieldsetViewMixin:
+    """Load only the model columns selected with ?fields= / ?exclude= on reads"""
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        selected = requested_fields(self.request, self.get_serializer_class()().fields)
+        if selected is None:
+            return queryset
+        concrete = {field.name for field in queryset.model._meta.concrete_fields}
+        return queryset.only('id', *[name for name in selected if name in concrete])
+
+class FastListMixin:
+    """Serve list() from values() rows through a ValuesSerializer instead of hydrated models"""
+
+    def list(self, request, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        selected = requested_fields(request, serializer_class().fields)
+        fast = values_serializer(serializer_class, tuple(selected) if selected is not None else None)
+        queryset = fast.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(fast.serialize(page))
+        return Response(fast.serialize(queryset))
+
+class IndexedFilterMixin:
+    """Filter on ?param=<id> query parameters mapped to indexed lookups in `filter_params`"""
+    filter_params = {}
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        for param, lookup in self.filter_params.items():
+            value = self.request.query_params.get(param)
+            if value is None:
+                continue
+            if not value.isdigit():
+                raise ValidationError({param: 'A valid integer is required.'})
+            queryset = queryset.filter(**{lookup: int(value)})
+        return queryset
+
+class VersionConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The object was modified by someone else.'
+    default_code = 'conflict'
+
+    def __init__(self, conflict):
+        # Keep the payload's ints and nested row as-is instead of coercing to strings
+        self.detail = conflict.as_payload()
+
+class WipLimitExceeded(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The column is at its WIP limit.'
+    default_code = 'wip_limit_exceeded'
+
+    def __init__(self, error):
+        self.detail = {'code': self.default_code, **error.as_payload()}
+
+class OptimisticConcurrencyMixin:
+    """Reject REST updates made against a stale `version` with 409 Conflict"""
+
+    def perform_update(self, serializer):
+        expected = self.request.data.get('version')
+        if expected is not None:
+            try:
+                expected = int(expected)
+            except (TypeError, ValueError):
+                raise ValidationError({'version': 'A valid integer is required.'})
+        # The version bump and the save commit together or not at all
+        with transaction.atomic():
+            try:
+                serializer.validated_data['version'] = claim_version(serializer.instance, expected)
+            except ConflictError as e:
+                raise VersionConflict(e)
+            super().perform_update(serializer)
+
+class CardViewSet(SnapshotInvalidationMixin, OptimisticConcurrencyMixin, FastListMixin, IndexedFilterMixin,
+                  SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = Card.objects.all()
     serializer_class = CardSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # ?column= narrows on the leading column of the (column, rank) index and ?board=
+    # joins through the columns' (board, rank) index; pages then sort the matches by id
+    filter_params = {'column': 'column_id', 'board': 'column__board_id'}
     
     def get_queryset(self):
         # Filter cards based on user's access to boards
-        return Card.objects.filter(column__board__project__team__members=self.request.user)
+        return Card.objects.filter(column__board_id__in=accessible_board_ids(self.request.user))
+
+    def snapshot_board_id(self, instance):
+        return Column.objects.filter(id=instance.column_id).values_list('board_id', flat=True).first()
+
+    def perform_create(self, serializer):
+        # New cards go to the end of their column
+        column = serializer.validated_data['column']
+        serializer.validated_data['rank'] = card_rank(column.id)
+        with self.wip_limit(column.id):
+            super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        column = serializer.validated_data.get('column')
+        if column is None or column.id == serializer.instance.column_id:
+            super().perform_update(serializer)
+            return
+        serializer.validated_data['rank'] = card_rank(column.id)
 
-class ColumnViewSet(viewsets.ModelViewSet):
+        def move():
+            with self.wip_limit(column.id, serializer.instance.id):
+                super(CardViewSet, self).perform_update(serializer)
+
+        # A move that loses a deadlock (e.g. to a batch) is rolled back and retried;
+        # save() already changed the instance, so it is reloaded first
+        run_retrying(move, before_retry=serializer.instance.refresh_from_db)
+
+    @contextmanager
+    def wip_limit(self, column_id, card_id=None):
+        # The database refuses the save when the column is full (see core.wip)
+        try:
+            with wip_limit_refusals(column_id, card_id):
+                yield
+        except WipLimitError as e:
+            raise WipLimitExceeded(e)
+
+    @action(detail=False, methods=['get'], pagination_class=SearchPagination)
+    def search(self, request):
+        """Cards matching ?q= in title or description, best match first, with their score"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'A search query is required.'})
+        serializer_class = self.get_serializer_class()
+        selected = requested_fields(request, serializer_class().fields)
+        fast = values_serializer(serializer_class, tuple(selected) if selected is not None else None)
+        queryset = search_cards(self.filter_queryset(self.get_queryset()), query)
+        page = self.paginate_queryset(queryset.values(*fast.columns, 'search_rank'))
+        results = fast.serialize(page)
+        for item, row in zip(results, page):
+            item['score'] = row['search_rank']
+        return self.get_paginated_response(results)
+
+class ColumnViewSet(SnapshotInvalidationMixin, OptimisticConcurrencyMixin, FastListMixin, IndexedFilterMixin,
+                    SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = Column.objects.all()
     serializer_class = ColumnSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # Narrows on the leading column of the (board, rank) index; pages sort the matches by id
+    filter_params = {'board': 'board_id'}
     
     def get_queryset(self):
         # Filter columns based on user's access to boards
-        return Column.objects.filter(board__project__team__members=self.request.user)
+        return Column.objects.filter(board_id__in=accessible_board_ids(self.request.user))
 
-class BoardViewSet(viewsets.ModelViewSet):
+    def snapshot_board_id(self, instance):
+        return instance.board_id
+
+    def perform_create(self, serializer):
+        # New columns go to the end of their board
+        serializer.validated_data['rank'] = column_rank(serializer.validated_data['board'].id)
+        super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        board = serializer.validated_data.get('board')
+        if board is not None and board.id != serializer.instance.board_id:
+            serializer.validated_data['rank'] = column_rank(board.id)
+        super().perform_update(serializer)
+
+class BoardViewSet(SnapshotInvalidationMixin, OptimisticConcurrencyMixin, FastListMixin, IndexedFilterMixin,
+                   SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = Board.objects.all()
     serializer_class = BoardSerializer
     permission_classes = [permissions.IsAuthenticated]
+    filter_params = {'project': 'project_id'}
     
     def get_queryset(self):
         # Filter boards based on user's team membership
-        return Board.objects.filter(project__team__members=self.request.user)
+        return Board.objects.filter(id__in=accessible_board_ids(self.request.user))
+
+    def snapshot_board_id(self, instance):
+        return instance.id
     
     @action(detail=True, methods=['get'])
     def full_board(self, request, pk=None):
         """Get board with all columns and cards"""
         try:
             board = self.get_object()
-            columns = board.columns.all().prefetch_related('cards')
-            
-            board_data = {
-                'id': board.id,
-                'name': board.name,
-                'description': board.description,
-                'columns': [
-                    {
-                        'id': col.id,
-                        'name': col.name,
-                        'position': col.position,
-                        'cards': [
-                            {
-                                'id': card.id,
-                                'title': card.title,
-                                'description': card.description,
-                                'position': card.position,
-                                'assigned_to': card.assigned_to.username if card.assigned_to else None,
-                                'created_at': card.created_at,
-                                'updated_at': card.updated_at,
-                            }
-                            for card in col.cards.all().order_by('position')
-                        ]
-                    }
-                    for col in columns.order_by('position')
-                ]
-            }
-            return Response(board_data)
+            return HttpResponse(cached_board_snapshot_bytes(board), content_type='application/json')
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class ProjectViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def counts(self, request, pk=None):
+        """Card totals by column and assignee, read from the maintained counters"""
+        board = self.get_object()
+        return Response(board_counts(board.id))
+
+    @action(detail=True, methods=['get'])
+    def viewers(self, request, pk=None):
+        """Users with the board open right now and the cards they have focused"""
+        board = self.get_object()
+        return Response({'board': board.id, 'viewers': get_presence().viewers(board.id)})
+
+class ProjectViewSet(IndexedFilterMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
     permission_classes = [permissions.IsAuthenticated]
+    filter_params = {'team': 'team_id'}
     
     def get_queryset(self):
         # Filter projects based on user's team membership
         return Project.objects.filter(team__members=self.request.user)
 
-class TeamViewSet(viewsets.ModelViewSet):
+class TeamViewSet(SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -88,10 +264,11 @@ class TeamViewSet(viewsets.ModelViewSet):
         # Only show teams user is a member of
         return Team.objects.filter(members=self.request.user)
 
-class TeamMembershipViewSet(viewsets.ModelViewSet):
+class TeamMembershipViewSet(IndexedFilterMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = TeamMembership.objects.all()
     serializer_class = TeamMembershipSerializer
     permission_classes = [permissions.IsAuthenticated]
+    filter_params = {'team': 'team_id'}
     
     def get_queryset(self):
         # Only show memberships for teams user belongs to
@@ -132,6 +309,24 @@ def user_profile(request):
         'last_name': user.last_name,
     })
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def snapshot_cache_stats(request):
+    """Hit/miss counters for the board snapshot cache"""
+    return Response(get_snapshot_cache().stats())
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def broadcast_stats(request):
+    """Frames, encoded bytes and encode time per board group in this process"""
+    return Response(get_broadcast_stats().stats())
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def history_stats(request):
+    """Queued history rows and how far the batched writer is behind"""
+    return Response(get_history_pipeline().stats())
+
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def login_view(request):
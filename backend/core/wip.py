@@ -0,0 +1,173 @@
+import re
+from contextlib import contextmanager
+from django.db import IntegrityError
+from django.db.models import Sum
+from .models import CardCount, Column
+
+# Work-in-progress limits, enforced by BEFORE triggers on core_card: a card may
+# enter a column (insert, or update of column_id) only while the column's
+# CardCount rows (core.aggregates) sum to less than its wip_limit. The write
+# that would overfill the column fails with an error naming WIP_LIMIT_EXCEEDED,
+# which WipGuard and wip_limit_refusals turn into WipLimitError.
+#
+# On PostgreSQL the guard locks the target column's row (FOR NO KEY UPDATE, so
+# foreign key checks against the column are not blocked) before summing, and
+# only when the column has a limit. Concurrent moves into the same column queue
+# on that row; each sum is a new statement, so it sees the cards the previous
+# holder committed. A move takes no other column lock, and the counter rows are
+# updated in column order (0008), so opposite moves cannot deadlock. SQLite
+# serializes writers anyway.
+#
+# The suite runs these tests on SQLite unless DATABASE_URL points it at
+# PostgreSQL (e.g. `docker-compose run backend python manage.py test
+# core.tests.WipLimitPostgresTests`), which is what exercises the locking.
+
+WIP_LIMIT_EXCEEDED = 'wip_limit_exceeded'
+
+# PostgreSQL reports the count it refused on; SQLite's RAISE() takes a fixed message
+_REFUSAL = re.compile(WIP_LIMIT_EXCEEDED + r': (\d+) of (\d+) cards')
+
+POSTGRES_TRIGGER_SQL = [
+    f"""
+    CREATE OR REPLACE FUNCTION core_card_wip_guard() RETURNS trigger AS $$
+    DECLARE
+        column_limit integer;
+        column_cards integer;
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM core_column WHERE id = NEW.column_id AND wip_limit IS NOT NULL) THEN
+            RETURN NEW;
+        END IF;
+        SELECT wip_limit INTO column_limit FROM core_column WHERE id = NEW.column_id FOR NO KEY UPDATE;
+        SELECT COALESCE(SUM(cards), 0) INTO column_cards FROM core_cardcount WHERE column_id = NEW.column_id;
+        IF column_cards >= column_limit THEN
+            RAISE EXCEPTION '{WIP_LIMIT_EXCEEDED}: % of % cards', column_cards, column_limit
+                USING ERRCODE = 'check_violation';
+        END IF;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS core_card_wip_insert ON core_card",
+    """
+    CREATE TRIGGER core_card_wip_insert BEFORE INSERT ON core_card
+    FOR EACH ROW EXECUTE FUNCTION core_card_wip_guard()
+    """,
+    "DROP TRIGGER IF EXISTS core_card_wip_update ON core_card",
+    """
+    CREATE TRIGGER core_card_wip_update BEFORE UPDATE OF column_id ON core_card
+    FOR EACH ROW WHEN (OLD.column_id IS DISTINCT FROM NEW.column_id) EXECUTE FUNCTION core_card_wip_guard()
+    """,
+]
+POSTGRES_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS core_card_wip_insert ON core_card",
+    "DROP TRIGGER IF EXISTS core_card_wip_update ON core_card",
+    "DROP FUNCTION IF EXISTS core_card_wip_guard()",
+]
+
+_FULL = """
+    (SELECT COALESCE(SUM(cards), 0) FROM core_cardcount WHERE column_id = NEW.column_id)
+    >= (SELECT wip_limit FROM core_column WHERE id = NEW.column_id)
+"""
+
+SQLITE_TRIGGER_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_card_wip_insert BEFORE INSERT ON core_card
+    WHEN {_FULL} BEGIN
+        SELECT RAISE(ABORT, '{WIP_LIMIT_EXCEEDED}');
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS core_card_wip_update BEFORE UPDATE OF column_id ON core_card
+    WHEN OLD.column_id IS NOT NEW.column_id AND {_FULL} BEGIN
+        SELECT RAISE(ABORT, '{WIP_LIMIT_EXCEEDED}');
+    END
+    """,
+]
+SQLITE_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS core_card_wip_insert",
+    "DROP TRIGGER IF EXISTS core_card_wip_update",
+]
+
+
+def install_wip_triggers(schema_editor):
+    """Create the vendor's WIP limit guard triggers"""
+    for sql in {'postgresql': POSTGRES_TRIGGER_SQL, 'sqlite': SQLITE_TRIGGER_SQL}.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_wip_triggers(schema_editor):
+    for sql in {'postgresql': POSTGRES_DROP_SQL, 'sqlite': SQLITE_DROP_SQL}.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class WipLimitError(Exception):
+    """A card was refused entry to a column that is at its WIP limit"""
+
+    def __init__(self, column_id, wip_limit, cards, card_id=None):
+        self.column_id = column_id
+        self.wip_limit = wip_limit
+        self.cards = cards
+        self.card_id = card_id
+        super().__init__(f"Column {column_id} is at its WIP limit ({cards} of {wip_limit} cards)")
+
+    def as_payload(self):
+        """Structured body for the `wip_limit.exceeded` event sent back to the writer"""
+        return {
+            "column_id": self.column_id,
+            "card_id": self.card_id,
+            "wip_limit": self.wip_limit,
+            "cards": self.cards,
+        }
+
+
+def _limit_state(column_id):
+    """(cards, wip_limit) for a column"""
+    wip_limit = Column.objects.filter(id=column_id).values_list('wip_limit', flat=True).first()
+    cards = CardCount.objects.filter(column_id=column_id).aggregate(cards=Sum('cards'))['cards'] or 0
+    return cards, wip_limit
+
+
+def wip_limit_error(error, column_id, card_id=None):
+    """The WipLimitError for a database error raised by the guard trigger, or None for any other error"""
+    message = str(error)
+    if WIP_LIMIT_EXCEEDED not in message:
+        return None
+    match = _REFUSAL.search(message)
+    if match:
+        cards, wip_limit = int(match[1]), int(match[2])
+    else:
+        # SQLite: the failed statement was rolled back on its own, so the transaction can still read
+        cards, wip_limit = _limit_state(column_id)
+    return WipLimitError(column_id, wip_limit, cards, card_id)
+
+
+@contextmanager
+def wip_limit_refusals(column_id, card_id=None):
+    """For ORM writes (REST): raise WipLimitError when the guard refuses card `card_id` entry to the column"""
+    try:
+        yield
+    except IntegrityError as e:
+        error = wip_limit_error(e, column_id, card_id)
+        if error is None:
+            raise
+        raise error from e
+
+
+# Condition for insert_returning/update_returning on a card entering column
+# `column_id`. The guard trigger does the check, so it adds nothing to the
+# statement; explain() turns the trigger's refusal into WipLimitError.
+class WipGuard:
+    sql = None
+    params = ()
+
+    def __init__(self, column_id, card_id=None):
+        self.column_id = Column._meta.pk.get_prep_value(column_id)
+        self.card_id = card_id
+
+    def check(self):
+        """A refused write raises instead of matching no row, so there is nothing to explain here"""
+
+    def explain(self, error):
+        refusal = wip_limit_error(error, self.column_id, self.card_id)
+        if refusal is not None:
+            raise refusal from error
@@ -29,7 +29,8 @@ function BoardPage() {
       
       // Fetch tasks for this board
       const tasksResponse = await apiClient.get(`/projects/${id}/tasks/`);
-      setTasks(tasksResponse.data);
+      // List endpoints are cursor-paginated: { next, previous, results }
+      setTasks(tasksResponse.data.results);
     } catch (error) {
       console.error('Error fetching board data:', error);
       if (error.response?.status === 404) {
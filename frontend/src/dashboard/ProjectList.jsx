@@ -20,7 +20,8 @@ function ProjectList() {
       
       // Use the apiClient which automatically handles token refresh
       const response = await apiClient.get('/projects/');
-      setProjects(response.data);
+      // List endpoints are cursor-paginated: { next, previous, results }
+      setProjects(response.data.results);
     } catch (error) {
       console.error('Error fetching projects:', error);
       setError('Failed to fetch projects. Please try again.');